@@ -2,11 +2,13 @@
 import os
 import sys
 import pprint
-from osgeo import gdal
 from os.path import join
 import glob
+import hashlib
 import settings
-import geo_functions
+import extraction_engine
+import raster_reader
+from landsat_catalog import LandsatCatalog
 import numpy as np
 
 sys.path.append(join(os.path.dirname(os.path.realpath(__file__)), ".."))
@@ -20,12 +22,77 @@ LT8_band_dict = {
     settings.band_key_list[i]: settings.LT8_band_index[i] for i in range(bandNum)
 }
 
+# Version of the extracted values in the result cache, bump it whenever
+# LandsatSR gives different values for the same scene
+EXTRACTOR_VERSION = "2"
+
+"""
+build the table of clear pixel_qa values, indexed by the pixel_qa value
+input of the function:
+clear, water, snow: accept pixels with the clear (bit 1), water (bit 2) or
+snow (bit 4) flag
+max_cloud_confidence: highest accepted cloud confidence (bits 6-7)
+output of the function:
+boolean numpy array of 65536 entries; fill (bit 0), cloud shadow (bit 3)
+and cloud (bit 5) pixels are never clear, nor pixels with a disabled flag
+"""
+
+
+def build_qa_lut(clear=True, water=False, snow=False, max_cloud_confidence=2):
+    qa = np.arange(65536, dtype=np.int64)
+    accepted = 0
+    rejected = 1 << 0 | 1 << 3 | 1 << 5
+    for flag, bit in ((clear, 1), (water, 2), (snow, 4)):
+        if flag:
+            accepted |= 1 << bit
+        else:
+            rejected |= 1 << bit
+    return (
+        (qa & accepted != 0)
+        & (qa & rejected == 0)
+        & ((qa >> 6) & 3 <= max_cloud_confidence)
+    )
+
+
+# clear pixel_qa values for the flags in settings (the former fixed list
+# 66, 130, 322, 386, 834, 898, 1346 is included with the default flags)
+CLEAR_QA_LUT = build_qa_lut(
+    settings.LANDSAT_QA_CLEAR,
+    settings.LANDSAT_QA_WATER,
+    settings.LANDSAT_QA_SNOW,
+    settings.LANDSAT_QA_MAX_CLOUD_CONFIDENCE,
+)
+
+"""
+get a short tag identifying a table of clear pixel_qa values, so that the
+results masked with other QA flags are cached and checkpointed apart
+"""
+
+
+def qa_lut_tag(lut):
+    return hashlib.sha1(np.packbits(lut).tobytes()).hexdigest()[:8]
+
+
 """
 get the suitable file folds acoording to the path and row
+if catalog_path is given, the folders come from the SQLite scene catalog at
+that path (refreshed for these path/rows first unless refresh is False),
+otherwise from globbing the data dirs
 """
 
 
-def get_file_list(path_rows, data_dirs, start_time, end_time):
+def get_file_list(
+    path_rows, data_dirs, start_time, end_time, catalog_path=None, refresh=True
+):
+    if catalog_path is not None:
+        catalog = LandsatCatalog(catalog_path, data_dirs)
+        try:
+            if refresh:
+                catalog.refresh(path_rows)
+            return catalog.query(path_rows, start_time, end_time)
+        finally:
+            catalog.close()
+
     tar_list = {}
     for (path, row) in path_rows:
         for data_dir in data_dirs:
@@ -45,6 +112,148 @@ def get_file_list(path_rows, data_dirs, start_time, end_time):
     return tar_list
 
 
+"""
+get the band names of the results: the bands, or with a window size, one
+"<band>_<stat>" column per band and statistic
+"""
+
+
+def get_band_names(window_size=None, window_stats=None):
+    return extraction_engine.column_names(
+        settings.band_key_list, window_size, window_stats
+    )
+
+
+class LandsatSR(extraction_engine.Sensor):
+    """Landsat 5/7/8 surface reflectance for the extraction engine.
+    Scenes are the folders of the path/rows of tile_dict
+    ({'path-row': [(lat, lon), ...]} or getTileName.get_landsat_tile_index);
+    a point is clear when its pixel_qa value is in CLEAR_QA_LUT, and the
+    reflectances are 0-1 (-1 otherwise).
+    The name holds qa_lut_tag(CLEAR_QA_LUT), so results masked under other
+    settings.LANDSAT_QA_* flags are not reused.
+    window_size, window_stats: see extraction_engine.Sensor; a window_size
+    other than None, 1 or an odd int >= 3, or a statistic unknown to
+    raster_reader.window_stats raises ValueError
+    """
+
+    version = EXTRACTOR_VERSION
+    bands = settings.band_key_list
+    decimals = 4
+    scale = 0.0001
+    valid_range = (0.0, 1.0)
+
+    def __init__(self, refresh_catalog=True, window_size=None, window_stats=None):
+        if window_size == 1:
+            window_size = None
+        if window_stats is None:
+            window_stats = settings.NEIGHBORHOOD_STATS
+        if window_size is not None and (
+            not isinstance(window_size, (int, np.integer))
+            or window_size < 3
+            or window_size % 2 == 0
+        ):
+            raise ValueError(
+                "window size must be None or an odd int >= 3: %r" % (window_size,)
+            )
+        for stat in window_stats:
+            if stat != "count" and stat not in raster_reader.WINDOW_STATS:
+                raise ValueError("unknown window statistic: %r" % (stat,))
+        self.refresh_catalog = refresh_catalog
+        self.window_size = window_size
+        self.window_stats = list(window_stats)
+        # results of other QA flags or of another window are cached under
+        # another extractor name
+        self.name = "landsat_sr_qa" + qa_lut_tag(CLEAR_QA_LUT)
+        if window_size is not None:
+            self.name += "_w%d_%s" % (window_size, "-".join(window_stats))
+
+    def list_scenes(self, tile_keys, start_time, end_time):
+        path_rows = [tuple(pr_key.split("-")) for pr_key in tile_keys]
+        data_dirs = []
+        for landsat_dir in settings.LANDSAT_SR_PATH:
+            data_dirs.append(join(os.path.expanduser("~"), landsat_dir))
+        catalog_path = None
+        if settings.LANDSAT_CATALOG_PATH:
+            catalog_path = join(os.path.expanduser("~"), settings.LANDSAT_CATALOG_PATH)
+        tar_list = get_file_list(
+            path_rows,
+            data_dirs,
+            start_time,
+            end_time,
+            catalog_path,
+            self.refresh_catalog,
+        )
+        if len(tar_list) == 0:
+            raise Exception("There is no suitable files")
+        return tar_list
+
+    def scene_files(self, folder_path):
+        satellite = folder_path.split("/")[-5]
+        if satellite in ["LT05", "LE07"]:
+            band_dict = LT57_band_dict
+        elif satellite in ["LC08"]:
+            band_dict = LT8_band_dict
+        else:
+            print("satellite type error!")
+            return None
+        scene_name = folder_path.split("/")[-1]
+        File_Path = {
+            band_type: join(folder_path, scene_name + band_dict[band_type])
+            for band_type in settings.band_key_list
+        }
+        return extraction_engine.Scene(
+            folder_path.split("_")[-4],
+            join(folder_path, scene_name + "_pixel_qa.img"),
+            [File_Path],
+            settings.band_key_list,
+        )
+
+    def qa_rule(self, qa_values):
+        # pixels outside the scene (NaN in windows) are not clear
+        return CLEAR_QA_LUT[np.nan_to_num(qa_values).astype(np.uint16)]
+
+
+"""
+function to extract BLUE/GREEN/RED/NIR/SWIR1/SWIR2 data scene by scene
+input of the function:
+tile_dict: {'path-row': [(lat, lon), ...]}, or the result_cube.TiledPoints of
+getTileName.get_landsat_tile_index
+start_time, end_time: 'YYYYMMDD' [string]
+workers, point_index, checkpoint, cache: see extraction_engine.iter_scenes
+window_size, window_stats: see extraction_engine.Sensor
+output of the function:
+iterator of result_cube.SceneBatch, one per readable scene as soon as it is
+processed, in the same order in serial and parallel mode; values are 0-1,
+-1 for invalid data
+"""
+
+
+def iter_landsat_sr(
+    tile_dict,
+    start_time,
+    end_time,
+    refresh_catalog=True,
+    workers=None,
+    point_index=None,
+    checkpoint=None,
+    cache=None,
+    window_size=None,
+    window_stats=None,
+):
+    sensor = LandsatSR(refresh_catalog, window_size, window_stats)
+    return extraction_engine.iter_scenes(
+        sensor,
+        tile_dict,
+        start_time,
+        end_time,
+        workers,
+        point_index,
+        checkpoint,
+        cache,
+    )
+
+
 """
 function to extract BLUE/GREEN/RED/NIR/SWIR1/SWIR2 data given sample points
 and a period of time
@@ -52,6 +261,10 @@ input of the function:
 points: coordinate (lat, lon); float, a list of tuple
 startDate: start time, should be in the format of 'YYYYMMDD' [string]
 endDate: end time, should be in the format of "YYYYMMDD" [string]
+workers, output, resume, use_cache: see extraction_engine.extract
+window_size: None for the pixel under each point, or an odd k for the
+window_stats (None: settings.NEIGHBORHOOD_STATS) of the clear pixels of the
+k x k window around it, as "<band>_<stat>" keys (e.g. "NIR_band_median")
 output of the function:
 a list of data with format[{'coordinate': (lat,lon),'BLUE': [(time1,value1),
 (time2,value2),....], 'GREEN': [(time1,value1),(time2,value2),....],...}...]
@@ -62,138 +275,22 @@ a list of data with format[{'coordinate': (lat,lon),'BLUE': [(time1,value1),
 """
 
 
-def extract_Landsat_SR(tile_dict, start_time, end_time):
-    # Get path_rows in tile_dict
-    path_rows = tile_dict.keys()
-    # Results
-    landsat_ref_res = {}
-
-    tar_list = {}
-    data_dirs = []
-    for landsat_dir in settings.LANDSAT_SR_PATH:
-        data_dirs.append(join(os.path.expanduser("~"), landsat_dir))
-    tar_list = get_file_list(path_rows, data_dirs, start_time, end_time)
-
-    if len(tar_list) == 0:
-        raise Exception("There is no suitable files")
-        return
-    else:
-        pass
-
-    tile_count = 0
-    for pr_key in tar_list.keys():
-        print("Processing the tile", tile_count, "out of ", len(tar_list.keys()))
-        tile_count += 1
-
-        img_folders = tar_list[pr_key]
-
-        for folder_path in img_folders:
-            file_date = folder_path.split("_")[-4]
-
-            # open qc img
-            try:
-                qc_path = join(
-                    folder_path, folder_path.split("/")[-1] + "_pixel_qa.img"
-                )
-                cloudmask = gdal.Open(qc_path)
-                cloudmask_raster = cloudmask.GetRasterBand(1).ReadAsArray()
-            except Exception as e:
-                print(e)
-                print("Unable to open QC file\n")
-                continue
-
-            # open band img
-            satellite = folder_path.split("/")[-5]
-            File_Path = {}
-            bandfiles = {}
-            bandraster = {}
-
-            if satellite in ["LT05", "LE07"]:
-                for band_type in settings.band_key_list:
-                    File_Path[band_type] = join(
-                        folder_path,
-                        folder_path.split("/")[-1] + LT57_band_dict[band_type],
-                    )
-            elif satellite in ["LC08"]:
-                for band_type in settings.band_key_list:
-                    File_Path[band_type] = join(
-                        folder_path,
-                        folder_path.split("/")[-1] + LT8_band_dict[band_type],
-                    )
-            else:
-                print("satellite type error!")
-                continue
-
-            for band_type in settings.band_key_list:
-                try:
-                    bandfiles[band_type] = gdal.Open(File_Path[band_type])
-                    bandraster[band_type] = (
-                        bandfiles[band_type].GetRasterBand(1).ReadAsArray()
-                    )
-
-                except Exception as e:
-                    print(e)
-                    print("Unable to open " + band_type + " file\n")
-                    continue
-
-            for location in tile_dict[pr_key]:
-                lat = location[0]
-                lon = location[1]
-
-                # Check if data is valid
-                is_valid, px, py = geo_functions.point_boundary_is_valid(
-                    cloudmask, lat, lon
-                )
-                if not is_valid:
-                    continue
-                cloudmask_data = geo_functions.get_band_value(
-                    cloudmask_raster, px, py, 1, cloud=True
-                )
-                if cloudmask_data not in [66, 130, 322, 386, 834, 898, 1346]:
-                    continue
-
-                band_data = {band_type: -1 for band_type in settings.band_key_list}
-                # Get Band Ref
-                for band_type in settings.band_key_list:
-                    try:
-                        ref_value = geo_functions.get_band_value(
-                            bandraster[band_type], px, py, 1
-                        )
-                        if 0.0 < ref_value < 1.0:
-                            band_data[band_type] = ref_value
-                        else:
-                            band_data[band_type] = -1.0
-                    except Exception:
-                        print("Unable to get " + band_type + " data\n")
-                        continue
-
-                # Add to results
-                res_key = geo_functions.get_latlon_key(lat, lon)
-                if res_key in landsat_ref_res.keys:
-                    landsat_ref_record = landsat_ref_res[res_key]
-                    for band_type in settings.band_key_list:
-                        try:
-                            landsat_ref_record[band_type].append(
-                                (file_date, float(band_data[band_type]))
-                            )
-                        except KeyError:
-                            print("Key Error!!!")
-                            pass
-                else:
-                    landsat_ref_record = {}
-                    for band_type in settings.band_key_list:
-                        landsat_ref_record[band_type] = (
-                            file_date,
-                            float(band_data[band_type]),
-                        )
-                    landsat_ref_res[res_key] = landsat_ref_record
-
-    # Sort the resuls by date
-    for _, landsat_ref_record in landsat_ref_res.items():
-        for band_type in settings.band_key_list:
-            landsat_ref_record[band_type].sort()
-
-    return landsat_ref_res
+def extract_Landsat_SR(
+    tile_dict,
+    start_time,
+    end_time,
+    refresh_catalog=True,
+    workers=None,
+    output="dict",
+    resume=False,
+    use_cache=False,
+    window_size=None,
+    window_stats=None,
+):
+    sensor = LandsatSR(refresh_catalog, window_size, window_stats)
+    return extraction_engine.extract(
+        sensor, tile_dict, start_time, end_time, workers, output, resume, use_cache
+    )
 
 
 if __name__ == "__main__":
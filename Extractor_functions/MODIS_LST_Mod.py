@@ -10,11 +10,22 @@ from os.path import join
 import numpy as np
 from datetime import datetime
 import settings
-import geo_functions
+import extraction_engine
+import instrument
+from modis_catalog import ModisCatalog
 
 sys.path.append(join(os.path.dirname(os.path.realpath(__file__)), ".."))
 printer = pprint.PrettyPrinter(indent=3)
 
+# Version of the extracted values in the result cache, bump it whenever
+# ModisLST gives different values for the same file
+EXTRACTOR_VERSION = "2"
+
+# Valid LST digital numbers and their scale to Kelvin
+LST_VALID_MIN = 7500
+LST_VALID_MAX = 65535
+LST_SCALE = 0.02
+
 """
 function to get hdf files based on tileName and Date range
 """
@@ -42,6 +53,36 @@ def create_tar_hdf(data_path, tile_Key, startDate, endDate):
     return hdf_list
 
 
+"""
+function to get hdf files of many tiles in all data paths based on Date range
+if catalog_path is given, the files come from the SQLite granule index at
+that path (refreshed for the date range first unless refresh is False),
+otherwise from listing the folders with create_tar_hdf
+output of the function:
+{tile_Key: [hdf path, ...]}, products in the order of data_paths
+"""
+
+
+def get_hdf_dict(
+    tile_keys, data_paths, startDate, endDate, catalog_path=None, refresh=True
+):
+    if catalog_path is not None:
+        catalog = ModisCatalog(catalog_path, data_paths)
+        try:
+            if refresh:
+                catalog.refresh(startDate, endDate)
+            return catalog.query(tile_keys, startDate, endDate)
+        finally:
+            catalog.close()
+
+    hdf_dict = {}
+    for tile_Key in tile_keys:
+        hdf_dict[tile_Key] = []
+        for data_path in data_paths:
+            hdf_dict[tile_Key] += create_tar_hdf(data_path, tile_Key, startDate, endDate)
+    return hdf_dict
+
+
 """
 function to convert date(YYYYMMDD) to DOY
 """
@@ -53,12 +94,151 @@ def date2DOY(file_date):
     return days
 
 
+"""
+function to compute the LST of many pixels from the day/night LST and QC
+values, as array operations
+input of the function:
+day_lst, day_qc, night_lst, night_qc: raw values of the pixels, numpy arrays
+output of the function:
+float64 array of the mean of the valid day and night LST (Kelvin, rounded
+to 2 decimals), -1 where neither is valid
+--------------Valid LST-----------------
+QC == 0 or QC & 0x000F == 1, and 7500 <= LST <= 65535 before scaling
+"""
+
+
+def get_lst_values(day_lst, day_qc, night_lst, night_qc):
+    total = np.zeros(len(day_lst), dtype=np.float64)
+    count = np.zeros(len(day_lst), dtype=np.int64)
+    for lst, qc in ((day_lst, day_qc), (night_lst, night_qc)):
+        lst = np.asarray(lst, dtype=np.int64)
+        qc = np.asarray(qc, dtype=np.int64)
+        good = ((qc == 0) | ((qc & 0x000F) == 1)) & (
+            (lst >= LST_VALID_MIN) & (lst <= LST_VALID_MAX)
+        )
+        total += np.where(good, lst * LST_SCALE, 0.0)
+        count += good
+    # nanmean of day and night, without the all-NaN warning
+    mean = total / np.maximum(count, 1)
+    return np.where(count > 0, np.round(mean, 2), -1.0)
+
+
+class ModisLST(extraction_engine.Sensor):
+    """MODIS MOD11A1/MYD11A1 daily LST for the extraction engine.
+    Scenes are the hdf files of the tiles of tile_dict
+    ({'hXXvYY': [(lat, lon), ...]} or getTileName.get_modis_tile_index); the
+    single band of a file is its product, the mean of its valid day and
+    night LST (see get_lst_values).
+    """
+
+    name = "modis_lst"
+    version = EXTRACTOR_VERSION
+    bands = ["MOD11A1", "MYD11A1"]
+    decimals = 2
+    # LST_SCALE and the valid LST range are applied by get_lst_values
+    all_bands_required = True
+    empty_records = True
+
+    def __init__(self, refresh_catalog=True):
+        self.refresh_catalog = refresh_catalog
+
+    def list_scenes(self, tile_keys, start_time, end_time):
+        # MODIS LST folders
+        MOD_data_path = join(os.path.expanduser("~"), settings.MOD11A1_PATH)
+        MYD_data_path = join(os.path.expanduser("~"), settings.MYD11A1_PATH)
+        catalog_path = None
+        if settings.MODIS_CATALOG_PATH:
+            catalog_path = join(os.path.expanduser("~"), settings.MODIS_CATALOG_PATH)
+        return get_hdf_dict(
+            tile_keys,
+            [MOD_data_path, MYD_data_path],
+            start_time,
+            end_time,
+            catalog_path,
+            self.refresh_catalog,
+        )
+
+    def scene_files(self, file_path):
+        try:
+            with instrument.stage("gdal_open"):
+                hdf_ds = gdal.Open(file_path, gdal.GA_ReadOnly)
+            # Day LST and QC, Night LST and QC subdatasets
+            subdatasets = hdf_ds.GetSubDatasets()
+        except Exception:
+            print("Unable to open file: \n" + file_path + "\nSkipping\n")
+            return None
+
+        # Compare file info and folder info
+        path_info = file_path.split("/")
+        file_date = path_info[-2].replace(".", "")
+        file_type = path_info[-3].split(".")[0]
+        file_name = os.path.basename(file_path)
+        file_info = file_name.split(".")
+        if file_type != file_info[0] or date2DOY(file_date) != file_info[1][1:]:
+            print("File info unmatch: \n" + file_path + "\nSkipping\n")
+            return None
+
+        sds_paths = {
+            "day_lst": subdatasets[0][0],
+            "day_qc": subdatasets[1][0],
+            "night_lst": subdatasets[4][0],
+            "night_qc": subdatasets[5][0],
+        }
+        return extraction_engine.Scene(file_date, None, [sds_paths], [file_type])
+
+    def scale_values(self, raw, bands, shape):
+        lst_values = get_lst_values(
+            raw["day_lst"].ravel(),
+            raw["day_qc"].ravel(),
+            raw["night_lst"].ravel(),
+            raw["night_qc"].ravel(),
+        ).reshape(shape)
+        return {bands[0]: np.where(lst_values == -1.0, np.nan, lst_values)}
+
+
+"""
+function to extract MODIS LST data hdf file by hdf file
+input of the function:
+tile_dict: {'hXXvYY': [(lat, lon), ...]}, or the result_cube.TiledPoints of
+getTileName.get_modis_tile_index
+startDate, endDate: 'YYYYMMDD' [string]
+workers, point_index, checkpoint, cache: see extraction_engine.iter_scenes
+output of the function:
+iterator of result_cube.SceneBatch, one per usable hdf file as soon as it is
+processed, in the same order in serial and parallel mode; the batch's only
+band is the product (MOD11A1 or MYD11A1), -1 for invalid LST
+"""
+
+
+def iter_modis_lst(
+    tile_dict,
+    startDate,
+    endDate,
+    refresh_catalog=True,
+    workers=None,
+    point_index=None,
+    checkpoint=None,
+    cache=None,
+):
+    return extraction_engine.iter_scenes(
+        ModisLST(refresh_catalog),
+        tile_dict,
+        startDate,
+        endDate,
+        workers,
+        point_index,
+        checkpoint,
+        cache,
+    )
+
+
 """
 function to extract MODIS LST data given latitude, longitude and a period of time
 input of the function:
 points: coordinate (lat, lon); float, a list of tuple
 startDate: start time, should be in the format of 'YYYYMMDD' [string]
 endDate: end time, should be in the format of "YYYYMMDD" [string]
+workers, output, resume, use_cache: see extraction_engine.extract
 output of the function:
 a list of data with format[{coordinate: value, 'MOD11A1': { day/night: [(time1,value1),
 (time2,value2),...]}, 'MYD11A1': { day/night: [(time1,value1),(time2,value2),...]}},...]
@@ -71,118 +251,26 @@ Others(eg. QC == 2/3)
 """
 
 
-def extract_MODIS_LST(tile_dict, startDate, endDate):
-    # Results Initialization
-    MODIS_LST_res = {
-        ("{:.6f}".format(pt[0]), "{:.6f}".format(pt[1])): {"MOD11A1": [], "MYD11A1": []}
-        for pt in points
-    }
-
-    # MODIS LST folders
-    MOD_data_path = join(os.path.expanduser("~"), settings.MOD11A1_PATH)
-    MYD_data_path = join(os.path.expanduser("~"), settings.MYD11A1_PATH)
-
-    # Get Data
-    for tile_Key in tile_dict.keys():
-        hdf_files = []
-        hdf_files = hdf_files + create_tar_hdf(
-            MOD_data_path, tile_Key, startDate, endDate
-        )
-        hdf_files = hdf_files + create_tar_hdf(
-            MYD_data_path, tile_Key, startDate, endDate
-        )
-
-        for file_path in hdf_files:
-            try:
-                hdf_ds = gdal.Open(file_path, gdal.GA_ReadOnly)
-            except Exception:
-                print("Unable to open file: \n" + file_path + "\nSkipping\n")
-                continue
-
-            # Compare file info and folder info
-            path_info = file_path.split("/")
-            file_date = path_info[-2].replace(".", "")
-            file_type = path_info[-3].split(".")[0]
-            file_name = os.path.basename(file_path)
-            file_info = file_name.split(".")
-            if file_type != file_info[0] or date2DOY(file_date) != file_info[1][1:]:
-                print("File info unmatch: \n" + file_path + "\nSkipping\n")
-                continue
-
-            # read dataset
-            # Get Day LST and QC
-            # Get Day QC Dataset
-            day_lst_ds = gdal.Open(hdf_ds.GetSubDatasets()[0][0])
-            day_lst_rst = day_lst_ds.GetRasterBand(1).ReadAsArray()
-            day_qc_ds = gdal.Open(hdf_ds.GetSubDatasets()[1][0])
-            day_qc_rst = day_qc_ds.GetRasterBand(1).ReadAsArray()
-
-            # Get Night LST and QC
-            # Get Night QC Value
-            night_lst_ds = gdal.Open(hdf_ds.GetSubDatasets()[4][0])
-            night_lst_rst = night_lst_ds.GetRasterBand(1).ReadAsArray()
-            night_qc_ds = gdal.Open(hdf_ds.GetSubDatasets()[5][0])
-            night_qc_rst = night_qc_ds.GetRasterBand(1).ReadAsArray()
-
-            for location in tile_dict[tile_Key]:
-                latitude = location[0]
-                longitude = location[1]
-
-                # Get img coords(from proj coord) and check if data is valid
-                is_valid, px, py = geo_functions.point_boundary_is_valid(
-                    day_qc_ds, latitude, longitude
-                )
-                if not is_valid:
-                    continue
-
-                # LST value result
-                valid_lst_value = []
-
-                # Get Day QC Value
-                day_lst_value = -1
-                day_qc_value = geo_functions.get_band_value(day_qc_rst, px, py, 3, True)
-                if day_qc_value == 0 or day_qc_value & 0x000F == 1:
-                    # Get Day LST Value
-                    day_lst_value = geo_functions.get_band_value(day_lst_rst, px, py, 3)
-                # Add to valid list
-                if 7500 <= day_lst_value <= 65535:
-                    valid_lst_value.append(day_lst_value)
-
-                # Get Night QC Value
-                night_lst_value = -1
-                night_qc_value = geo_functions.get_band_value(
-                    night_qc_rst, px, py, 3, True
-                )
-                if night_qc_value == 0 or night_qc_value & 0x000F == 1:
-                    # Get Night LST Value
-                    night_lst_value = geo_functions.get_band_value(
-                        night_lst_rst, px, py, 3
-                    )
-                # Add to valid list
-                if 7500 <= night_lst_value <= 65535:
-                    valid_lst_value.append(night_lst_value)
-
-                # Get Final LST Value
-                lst_value = -1
-                if len(valid_lst_value) != 0:
-                    lst_value = np.mean(np.array(valid_lst_value))
-
-                # Add to results
-                res_key = geo_functions.get_latlon_key(latitude, longitude)
-
-                MODIS_LST_record = MODIS_LST_res[res_key]
-                MODIS_LST_record[file_type].append(
-                    (file_date, float("%.2f" % lst_value))
-                )
-
-    # sort the results by Date
-    for _, MODIS_LST_record in MODIS_LST_res.items():
-        if "MOD11A1" in MODIS_LST_record.keys():
-            MODIS_LST_record["MOD11A1"].sort()
-        if "MYD11A1" in MODIS_LST_record.keys():
-            MODIS_LST_record["MYD11A1"].sort()
-
-    return MODIS_LST_res
+def extract_MODIS_LST(
+    tile_dict,
+    startDate,
+    endDate,
+    refresh_catalog=True,
+    workers=None,
+    output="dict",
+    resume=False,
+    use_cache=False,
+):
+    return extraction_engine.extract(
+        ModisLST(refresh_catalog),
+        tile_dict,
+        startDate,
+        endDate,
+        workers,
+        output,
+        resume,
+        use_cache,
+    )
 
 
 # test main function
@@ -0,0 +1,681 @@
+"""
+benchmark of the extraction pipeline on synthetic data, without the
+tq-data0x mounts
+
+synthetic Landsat SR scenes (.img), MOD11A1/MYD11A1-style granules and
+Sentinel-2 R20m products with real projections and geotransforms are
+written into a temporary home laid out as settings.py expects, then the
+file listing, tile assignment, raster reads and point sampling stages are
+timed for each point count and written to a JSON report
+
+usage:
+python benchmark.py --points 1000 10000 100000 1000000 --report bench.json
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+from os.path import join
+import numpy as np
+from osgeo import gdal, osr
+import settings
+import geo_functions
+import raster_reader
+import instrument
+import extraction_engine
+import result_cube
+import modis_index
+import Landsat_Ref_Mod
+import MODIS_LST_Mod
+from sentinel_catalog import SentinelCatalog
+
+gdal.UseExceptions()
+
+# pixel_qa values drawn for the synthetic Landsat scenes (mostly clear)
+LANDSAT_QA_VALUES = [322, 322, 322, 386, 834, 480, 2800]
+# Sinusoidal projection of the MODIS land products
+MODIS_PROJ4 = "+proj=sinu +R=6371007.181 +nadgrids=@null +wktext"
+# Subdatasets of MOD11A1/MYD11A1, in file order
+MODIS_SDS = [
+    "LST_Day_1km",
+    "QC_Day",
+    "Day_view_time",
+    "Day_view_angl",
+    "LST_Night_1km",
+    "QC_Night",
+    "Night_view_time",
+    "Night_view_angl",
+    "Emis_31",
+    "Emis_32",
+    "Clear_day_cov",
+    "Clear_night_cov",
+]
+SENTINEL_BANDS = ["B02", "B03", "B04", "B8A", "B11", "B12"]
+SENTINEL_BANDS_10M = ["B02", "B03", "B04", "B08"]
+
+
+"""
+projected (UTM) spatial reference WKT of an EPSG code
+"""
+
+
+def get_wkt(epsg):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    return srs.ExportToWkt()
+
+
+"""
+write a single band raster
+input of the function:
+path: output file, driver_name: GDAL driver (HFA for .img, GTiff...)
+data: 2-D numpy array, gt: geotransform, wkt: projection
+"""
+
+
+def write_raster(path, driver_name, data, gt, wkt, data_type):
+    driver = gdal.GetDriverByName(driver_name)
+    ds = driver.Create(path, data.shape[1], data.shape[0], 1, data_type)
+    ds.SetGeoTransform(gt)
+    ds.SetProjection(wkt)
+    ds.GetRasterBand(1).WriteArray(data)
+    ds.FlushCache()
+    ds = None
+
+
+"""
+random points inside a raster, as latitude/longitude arrays
+"""
+
+
+def random_points(path, n, rng):
+    ds = gdal.Open(path)
+    gt = ds.GetGeoTransform()
+    # stay half a pixel inside the raster edges
+    px = 0.5 + rng.random(n) * (ds.RasterXSize - 1)
+    py = 0.5 + rng.random(n) * (ds.RasterYSize - 1)
+    xs = gt[0] + px * gt[1] + py * gt[2]
+    ys = gt[3] + px * gt[4] + py * gt[5]
+
+    prosrs, geosrs = geo_functions.getSRSPair(ds)
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+        prosrs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        geosrs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    ct = osr.CoordinateTransformation(prosrs, geosrs)
+    coords = np.asarray(ct.TransformPoints(np.column_stack((xs, ys)).tolist()))
+    return coords[:, 1], coords[:, 0]
+
+
+"""
+generate Landsat 8 SR scenes of one path/row (UTM 15N, 30 m)
+output of the function:
+list of scene folders
+"""
+
+
+def make_landsat_scenes(home, dates, size, rng):
+    wkt = get_wkt(32615)
+    gt = (300000.0, 30.0, 0.0, 4500000.0, 0.0, -30.0)
+    folders = []
+    for file_date in dates:
+        name = "LC08_L1TP_026032_" + file_date + "_20170223_01_T1"
+        folder = join(
+            home, settings.LANDSAT_SR_PATH[0], "LC08", "01", "026", "032", name
+        )
+        os.makedirs(folder)
+        qa = rng.choice(LANDSAT_QA_VALUES, size=(size, size)).astype(np.uint16)
+        write_raster(
+            join(folder, name + "_pixel_qa.img"), "HFA", qa, gt, wkt, gdal.GDT_UInt16
+        )
+        for suffix in settings.LT8_band_index:
+            band = rng.integers(-100, 10500, size=(size, size)).astype(np.int16)
+            write_raster(join(folder, name + suffix), "HFA", band, gt, wkt, gdal.GDT_Int16)
+        folders.append(folder)
+    return folders
+
+
+"""
+generate MOD11A1 and MYD11A1-style granules of one tile (h10v04)
+the HDF4 driver cannot write, so the granules are netCDF-4 files with the
+12 subdatasets of the product in file order and the .hdf name of the product
+output of the function:
+list of granule files
+"""
+
+
+def make_modis_granules(home, dates, rng, h=10, v=4):
+    srs = osr.SpatialReference()
+    srs.ImportFromProj4(MODIS_PROJ4)
+    wkt = srs.ExportToWkt()
+    pixel = modis_index.TILE_SIZE / 1200
+    gt = (
+        -modis_index.GRID_XMAX + h * modis_index.TILE_SIZE,
+        pixel,
+        0.0,
+        modis_index.GRID_YMAX - v * modis_index.TILE_SIZE,
+        0.0,
+        -pixel,
+    )
+    mem = gdal.GetDriverByName("MEM")
+    netcdf = gdal.GetDriverByName("netCDF")
+
+    files = []
+    for product_path in [settings.MOD11A1_PATH, settings.MYD11A1_PATH]:
+        product = os.path.basename(product_path).split(".")[0]
+        for file_date in dates:
+            day = datetime.strptime(file_date, "%Y%m%d")
+            folder = join(home, product_path, day.strftime("%Y.%m.%d"))
+            os.makedirs(folder)
+            file_path = join(
+                folder,
+                product
+                + ".A"
+                + day.strftime("%Y%j")
+                + "."
+                + modis_index.tile_name(h, v)
+                + ".006.2017000000000.hdf",
+            )
+            for i, sds in enumerate(MODIS_SDS):
+                if sds.startswith("LST"):
+                    data = rng.integers(13000, 16500, size=(1200, 1200))
+                    data_type = gdal.GDT_UInt16
+                elif sds.startswith("QC"):
+                    data = rng.choice([0, 0, 0, 1, 2, 65], size=(1200, 1200))
+                    data_type = gdal.GDT_Byte
+                else:
+                    data = np.zeros((1200, 1200))
+                    data_type = gdal.GDT_Byte
+                src = mem.Create("", 1200, 1200, 1, data_type)
+                src.SetGeoTransform(gt)
+                src.SetProjection(wkt)
+                src.GetRasterBand(1).WriteArray(data)
+                src.GetRasterBand(1).SetMetadataItem("NETCDF_VARNAME", sds)
+                options = ["FORMAT=NC4"]
+                if i > 0:
+                    options.append("APPEND_SUBDATASET=YES")
+                netcdf.CreateCopy(file_path, src, options=options)
+                src = None
+            files.append(file_path)
+    return files
+
+
+"""
+generate Sentinel-2 L2A products of one MGRS tile (15TVG, UTM 15N) with
+the six 20 m bands, the four 10 m bands (twice the size), the cloud mask
+folder and waterfall/total_list.json
+output of the function:
+list of IMG_DATA folders
+"""
+
+
+def make_sentinel_products(home, dates, size, rng):
+    wkt = get_wkt(32615)
+    gt = (399960.0, 20.0, 0.0, 4800000.0, 0.0, -20.0)
+    total_list = []
+    img_folders = []
+    for file_date in dates:
+        day = datetime.strptime(file_date, "%Y%m%d")
+        stamp = file_date + "T170301"
+        tile_dir = join(
+            "tq-data05",
+            "sentinel",
+            "SAFE_sentinel",
+            "15",
+            "T",
+            "VG",
+            str(day.year),
+            str(day.month),
+            str(day.day),
+        )
+        product = "S2A_MSIL2A_" + stamp + "_N0205_R069_T15TVG_" + stamp + ".SAFE"
+        img_data = join(
+            home, tile_dir, product, "GRANULE", "L2A_T15TVG_" + stamp, "IMG_DATA"
+        )
+        os.makedirs(join(img_data, "R20m"))
+        os.makedirs(join(img_data, "R10m"))
+        gt_10m = (gt[0], 10.0, 0.0, gt[3], 0.0, -10.0)
+        for band_name in SENTINEL_BANDS_10M:
+            band = rng.integers(0, 10000, size=(2 * size, 2 * size)).astype(np.uint16)
+            write_raster(
+                join(img_data, "R10m", "L2A_T15TVG_" + stamp + "_" + band_name + "_10m.tif"),
+                "GTiff",
+                band,
+                gt_10m,
+                wkt,
+                gdal.GDT_UInt16,
+            )
+        for band_name in SENTINEL_BANDS:
+            band = rng.integers(0, 10000, size=(size, size)).astype(np.uint16)
+            write_raster(
+                join(img_data, "R20m", "L2A_T15TVG_" + stamp + "_" + band_name + "_20m.tif"),
+                "GTiff",
+                band,
+                gt,
+                wkt,
+                gdal.GDT_UInt16,
+            )
+
+        # cloud mask folder of the product's date, 4 files as the extractor expects
+        qc_dir = join(home, tile_dir.replace("SAFE_sentinel", "SAFE_sentinel/cloudmask/sentinel"))
+        os.makedirs(qc_dir)
+        cloud = rng.choice([1, 1, 1, 0, 2], size=(size, size)).astype(np.uint8)
+        write_raster(join(qc_dir, "cloud.img"), "HFA", cloud, gt, wkt, gdal.GDT_Byte)
+        for extra in ["cloud.img.aux.xml", "cloud_prob.img", "cloud_prob.img.aux.xml"]:
+            if not os.path.exists(join(qc_dir, extra)):
+                open(join(qc_dir, extra), "w").close()
+
+        total_list.append("/" + join(tile_dir, product))
+        img_folders.append(img_data)
+
+    os.makedirs(join(home, "waterfall"))
+    with open(join(home, "waterfall", "total_list.json"), "w") as fp:
+        json.dump(total_list, fp)
+    return img_folders
+
+
+"""
+time a function
+output of the function:
+(seconds of each run, result of the last run)
+"""
+
+
+def timed(func, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - begin)
+    return runs, result
+
+
+class Report:
+    """Timings of one benchmark run, written as JSON."""
+
+    def __init__(self, config):
+        self.config = config
+        self.results = []
+
+    def add(self, sensor, stage, points, runs, **extra):
+        record = {
+            "sensor": sensor,
+            "stage": stage,
+            "points": points,
+            "seconds": min(runs),
+            "runs": runs,
+        }
+        record.update(extra)
+        self.results.append(record)
+        print(
+            "%-9s %-20s %9s %10.4f s"
+            % (sensor, stage, "" if points is None else points, min(runs))
+        )
+
+    def skip(self, sensor, stage, points, reason):
+        self.results.append(
+            {"sensor": sensor, "stage": stage, "points": points, "skipped": reason}
+        )
+        print("%-9s %-20s %9s skipped: %s" % (sensor, stage, points, reason))
+
+    def write(self, path):
+        report = {
+            "created": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "gdal": gdal.__version__,
+            "machine": platform.machine(),
+            "config": self.config,
+            "results": self.results,
+        }
+        if instrument.enabled:
+            report["stages"] = instrument.snapshot()
+        with open(path, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+
+"""
+time the full read of rasters, as the extractors did before windowed reads
+"""
+
+
+def read_full(paths):
+    for path in paths:
+        ds = gdal.Open(path)
+        ds.GetRasterBand(1).ReadAsArray()
+        ds = None
+
+
+def bench_landsat(report, home, dates, point_counts, scene_size, repeat, rng):
+    begin = time.perf_counter()
+    folders = make_landsat_scenes(home, dates, scene_size, rng)
+    report.add("landsat", "generate", None, [time.perf_counter() - begin])
+
+    start_time, end_time = dates[0], dates[-1]
+    path_rows = [("026", "032")]
+    data_dirs = [join(home, landsat_dir) for landsat_dir in settings.LANDSAT_SR_PATH]
+    runs, _ = timed(
+        lambda: Landsat_Ref_Mod.get_file_list(path_rows, data_dirs, start_time, end_time),
+        repeat,
+    )
+    report.add("landsat", "get_file_list", None, runs)
+    catalog_path = join(home, settings.LANDSAT_CATALOG_PATH)
+    runs, _ = timed(
+        lambda: Landsat_Ref_Mod.get_file_list(
+            path_rows, data_dirs, start_time, end_time, catalog_path
+        ),
+        repeat,
+    )
+    report.add("landsat", "get_file_list_catalog", None, runs)
+
+    folder = folders[0]
+    name = os.path.basename(folder)
+    qa_path = join(folder, name + "_pixel_qa.img")
+    band_paths = {
+        band_type: join(folder, name + Landsat_Ref_Mod.LT8_band_dict[band_type])
+        for band_type in settings.band_key_list
+    }
+    runs, _ = timed(lambda: read_full([qa_path] + list(band_paths.values())), repeat)
+    report.add("landsat", "raster_read_full", None, runs)
+
+    try:
+        from landsat_index import ConvertToWRS
+
+        to_wrs = ConvertToWRS()
+    except Exception as e:
+        to_wrs = None
+        wrs_error = str(e)
+
+    for n in point_counts:
+        lats, lons = random_points(qa_path, n, rng)
+        if to_wrs is not None:
+            runs, _ = timed(lambda: to_wrs.get_wrs_many(lats, lons), repeat)
+            report.add("landsat", "tile_assignment", n, runs)
+        else:
+            report.skip("landsat", "tile_assignment", n, wrs_error)
+
+        qa_ds = gdal.Open(qa_path)
+        runs, (pxs, pys, valid) = timed(
+            lambda: geo_functions.points_to_pixels(qa_ds, lats, lons), repeat
+        )
+        report.add("landsat", "points_to_pixels", n, runs)
+        runs, _ = timed(
+            lambda: raster_reader.read_bands(band_paths, pxs, pys, valid), repeat
+        )
+        report.add("landsat", "read_bands", n, runs)
+        sensor = Landsat_Ref_Mod.LandsatSR()
+        runs, _ = timed(
+            lambda: extraction_engine.extract_scene(folder, sensor, lats, lons), repeat
+        )
+        report.add("landsat", "extract_scene", n, runs)
+
+        tile_dict = {"026-032": list(zip(lats.tolist(), lons.tolist()))}
+        runs, _ = timed(
+            lambda: Landsat_Ref_Mod.extract_Landsat_SR(
+                tile_dict, start_time, end_time, use_cache=False
+            ),
+            repeat,
+        )
+        report.add("landsat", "extract_Landsat_SR", n, runs, scenes=len(folders))
+
+
+def bench_modis(report, home, dates, point_counts, repeat, rng):
+    if gdal.GetDriverByName("netCDF") is None:
+        report.skip("modis", "generate", None, "GDAL has no netCDF driver")
+        return
+    begin = time.perf_counter()
+    files = make_modis_granules(home, dates, rng)
+    report.add("modis", "generate", None, [time.perf_counter() - begin])
+
+    startDate, endDate = dates[0], dates[-1]
+    tile_key = modis_index.tile_name(10, 4)
+    data_paths = [
+        join(home, settings.MOD11A1_PATH),
+        join(home, settings.MYD11A1_PATH),
+    ]
+    runs, _ = timed(
+        lambda: [
+            MODIS_LST_Mod.create_tar_hdf(data_path, tile_key, startDate, endDate)
+            for data_path in data_paths
+        ],
+        repeat,
+    )
+    report.add("modis", "create_tar_hdf", None, runs)
+    catalog_path = join(home, settings.MODIS_CATALOG_PATH)
+    runs, _ = timed(
+        lambda: MODIS_LST_Mod.get_hdf_dict(
+            [tile_key], data_paths, startDate, endDate, catalog_path
+        ),
+        repeat,
+    )
+    report.add("modis", "get_hdf_dict_catalog", None, runs)
+
+    file_path = files[0]
+    subdatasets = gdal.Open(file_path).GetSubDatasets()
+    sds_paths = {
+        "day_lst": subdatasets[0][0],
+        "day_qc": subdatasets[1][0],
+        "night_lst": subdatasets[4][0],
+        "night_qc": subdatasets[5][0],
+    }
+    runs, _ = timed(lambda: read_full(list(sds_paths.values())), repeat)
+    report.add("modis", "raster_read_full", None, runs)
+
+    for n in point_counts:
+        lats, lons = random_points(sds_paths["day_qc"], n, rng)
+        runs, _ = timed(lambda: modis_index.latlon_to_tile(lats, lons), repeat)
+        report.add("modis", "tile_assignment", n, runs)
+
+        qc_ds = gdal.Open(sds_paths["day_qc"])
+        runs, (pxs, pys, valid) = timed(
+            lambda: geo_functions.points_to_pixels(qc_ds, lats, lons), repeat
+        )
+        report.add("modis", "points_to_pixels", n, runs)
+        runs, _ = timed(
+            lambda: raster_reader.read_bands(sds_paths, pxs, pys, valid), repeat
+        )
+        report.add("modis", "read_bands", n, runs)
+        sensor = MODIS_LST_Mod.ModisLST()
+        runs, _ = timed(
+            lambda: extraction_engine.extract_scene(file_path, sensor, lats, lons),
+            repeat,
+        )
+        report.add("modis", "extract_scene", n, runs)
+
+        tile_dict = {tile_key: list(zip(lats.tolist(), lons.tolist()))}
+        runs, _ = timed(
+            lambda: MODIS_LST_Mod.extract_MODIS_LST(
+                tile_dict, startDate, endDate, use_cache=False
+            ),
+            repeat,
+        )
+        report.add("modis", "extract_MODIS_LST", n, runs, scenes=len(files))
+
+
+def bench_sentinel(report, home, dates, point_counts, scene_size, repeat, rng):
+    begin = time.perf_counter()
+    img_folders = make_sentinel_products(home, dates, scene_size, rng)
+    report.add("sentinel", "generate", None, [time.perf_counter() - begin])
+
+    file_json = join(home, "waterfall", "total_list.json")
+    runs, _ = timed(
+        lambda: SentinelCatalog(file_json, home).get_file_list(
+            ["15TVG"], dates[0], dates[-1]
+        ),
+        repeat,
+    )
+    report.add("sentinel", "get_file_list", None, runs)
+
+    img_data = img_folders[0]
+    band_paths = {}
+    for file_name in os.listdir(join(img_data, "R20m")):
+        for band_type, band_name in zip(settings.band_key_list, SENTINEL_BANDS):
+            if "_" + band_name + "_20m" in file_name:
+                band_paths[band_type] = join(img_data, "R20m", file_name)
+    runs, _ = timed(lambda: read_full(list(band_paths.values())), repeat)
+    report.add("sentinel", "raster_read_full", None, runs)
+
+    try:
+        from sentinel_index import ConvertToMRGS
+
+        to_mgrs = ConvertToMRGS()
+    except Exception as e:
+        to_mgrs = None
+        mgrs_error = str(e)
+    try:
+        import sentinel_extractor
+    except Exception as e:
+        sentinel_extractor = None
+        extractor_error = str(e)
+
+    for n in point_counts:
+        lats, lons = random_points(band_paths["NIR_band"], n, rng)
+        if to_mgrs is not None:
+            runs, _ = timed(
+                lambda: [to_mgrs.get_mgrs(lat, lon) for lat, lon in zip(lats, lons)],
+                repeat,
+            )
+            report.add("sentinel", "tile_assignment", n, runs)
+        else:
+            report.skip("sentinel", "tile_assignment", n, mgrs_error)
+
+        nir_ds = gdal.Open(band_paths["NIR_band"])
+        runs, (pxs, pys, valid) = timed(
+            lambda: geo_functions.points_to_pixels(nir_ds, lats, lons), repeat
+        )
+        report.add("sentinel", "points_to_pixels", n, runs)
+        runs, _ = timed(
+            lambda: raster_reader.read_bands(band_paths, pxs, pys, valid), repeat
+        )
+        report.add("sentinel", "read_bands", n, runs)
+        if sentinel_extractor is None:
+            report.skip("sentinel", "extract_scene", n, extractor_error)
+            report.skip("sentinel", "extract", n, extractor_error)
+            continue
+        sensor = sentinel_extractor.SentinelSR("20m", SentinelCatalog(file_json, home))
+        runs, _ = timed(
+            lambda: extraction_engine.extract_scene(img_data, sensor, lats, lons),
+            repeat,
+        )
+        report.add("sentinel", "extract_scene", n, runs)
+
+        # the points of the tile as TiledPoints, without an MGRS lookup
+        tiled = result_cube.TiledPoints(lats, lons, {"15TVG": np.arange(n)})
+        runs, _ = timed(
+            lambda: extraction_engine.extract(sensor, tiled, dates[0], dates[-1]),
+            repeat,
+        )
+        report.add("sentinel", "extract", n, runs, scenes=len(img_folders))
+
+
+"""
+run the benchmark
+input of the function:
+point_counts: numbers of sample points to time
+dates: number of scenes/granules/products generated per sensor
+scene_size: Landsat and Sentinel raster side in pixels (MODIS is 1200)
+repeat: runs per stage, the report keeps every run and the fastest
+report_path: output JSON file
+work_dir: where the temporary home is created (None: system temp dir)
+keep: keep the synthetic data
+sensors: subset of "landsat", "modis", "sentinel"
+instrument: also record the per-stage counters of the extractors (see
+instrument.py), added to the report and, per scene, to <report>.scenes.jsonl
+"""
+
+
+def run(
+    point_counts,
+    dates=3,
+    scene_size=2000,
+    repeat=3,
+    report_path="benchmark_report.json",
+    work_dir=None,
+    keep=False,
+    sensors=("landsat", "modis", "sentinel"),
+    seed=0,
+    instrument_stages=False,
+):
+    rng = np.random.default_rng(seed)
+    home = tempfile.mkdtemp(prefix="extractor_bench_", dir=work_dir)
+    # every settings path is relative to the home directory
+    old_home = os.environ.get("HOME")
+    os.environ["HOME"] = home
+
+    first = datetime(2016, 4, 1)
+    file_dates = [
+        (first + timedelta(days=16 * i)).strftime("%Y%m%d") for i in range(dates)
+    ]
+    report = Report(
+        {
+            "points": list(point_counts),
+            "dates": dates,
+            "scene_size": scene_size,
+            "repeat": repeat,
+            "seed": seed,
+            "band_read_threads": settings.BAND_READ_THREADS,
+            "instrument": instrument_stages,
+        }
+    )
+    if instrument_stages:
+        instrument.enable(os.path.splitext(report_path)[0] + ".scenes.jsonl")
+    try:
+        if "landsat" in sensors:
+            bench_landsat(report, home, file_dates, point_counts, scene_size, repeat, rng)
+        if "modis" in sensors:
+            bench_modis(report, home, file_dates, point_counts, repeat, rng)
+        if "sentinel" in sensors:
+            bench_sentinel(report, home, file_dates, point_counts, scene_size, repeat, rng)
+    finally:
+        if old_home is None:
+            del os.environ["HOME"]
+        else:
+            os.environ["HOME"] = old_home
+        if keep:
+            print("synthetic data kept in " + home)
+        else:
+            shutil.rmtree(home, ignore_errors=True)
+
+    report.write(report_path)
+    print("report written to " + report_path)
+    if instrument_stages:
+        print(instrument.summary())
+        instrument.disable()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--points", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+    )
+    parser.add_argument("--dates", type=int, default=3)
+    parser.add_argument("--scene-size", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--report", default="benchmark_report.json")
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument(
+        "--sensors", nargs="+", default=["landsat", "modis", "sentinel"]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--instrument", action="store_true")
+    args = parser.parse_args()
+
+    run(
+        args.points,
+        args.dates,
+        args.scene_size,
+        args.repeat,
+        args.report,
+        args.work_dir,
+        args.keep,
+        args.sensors,
+        args.seed,
+        args.instrument,
+    )
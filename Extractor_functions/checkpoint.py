@@ -0,0 +1,154 @@
+"""
+per-scene completion journal and partial results on local disk, so that an
+interrupted extraction run can be restarted and only process the scenes
+that are not done yet
+
+a run directory holds one npz file per completed scene and journal.jsonl,
+with one line per completed scene appended after its npz file is safely
+on disk
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from os.path import join
+import numpy as np
+import result_cube
+
+
+class Checkpoint:
+    """Journal of the scenes completed by one extraction run.
+    Usage:
+        checkpoint = Checkpoint.for_run(base_dir, "landsat", tile_dict, start, end)
+        # results of the previous run(s), with the ids of this run
+        for batch in checkpoint.batches(tiled, point_ids):
+            ...
+        if scene_id not in checkpoint.done:
+            ...
+            checkpoint.record(batch, tile_key, idx)
+        checkpoint.clear()   # once the whole run is finished
+    The points of a scene are journaled by their tile and their indices in
+    it, not by point id, as the ids depend on the PointIndex of the run.
+    """
+
+    def __init__(self, run_dir):
+        if not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+        self.run_dir = run_dir
+        self.journal_path = join(run_dir, "journal.jsonl")
+        # scene_id -> npz file name, in completion order
+        self.done = {}
+        self._count = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as fp:
+                line = ""
+                for line in fp:
+                    self._count += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line cut short by a crash, the scene is redone
+                        continue
+                    if os.path.exists(join(run_dir, entry["file"])):
+                        self.done[entry["scene_id"]] = entry["file"]
+                if line and not line.endswith("\n"):
+                    # keep the next entry off the cut-short line
+                    with open(self.journal_path, "a") as fa:
+                        fa.write("\n")
+
+    @classmethod
+    def for_run(cls, base_dir, *params):
+        """Get the checkpoint of the run identified by params (extractor
+        name, points, dates...), so that a restart with the same parameters
+        finds the same journal.
+        """
+        key = hashlib.sha1(
+            json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        return cls(join(base_dir, str(params[0]) + "_" + key[:16]))
+
+    def batches(self, tiled, point_ids):
+        """Yield the result_cube.SceneBatch of every completed scene.
+        tiled: result_cube.TiledPoints of this run
+        point_ids: ids of the points of tiled in this run's PointIndex
+        Scenes journaled for other points (another tile, or other
+        coordinates at the journaled indices) are left out of done, so that
+        they are extracted again.
+        """
+        tile_keys = {str(tile_key): tile_key for tile_key in tiled.tiles}
+        for scene_id, file_name in list(self.done.items()):
+            with np.load(join(self.run_dir, file_name)) as data:
+                members = _scene_members(data, tiled, tile_keys)
+                if members is None:
+                    print("Checkpoint of other points, redoing: " + scene_id)
+                    del self.done[scene_id]
+                    continue
+                yield result_cube.SceneBatch(
+                    scene_id,
+                    str(data["date"]),
+                    [str(band_type) for band_type in data["bands"]],
+                    point_ids[members],
+                    tiled.lats[members],
+                    tiled.lons[members],
+                    data["values"],
+                )
+
+    def record(self, batch, tile_key, idx):
+        """Store the results of a completed scene and journal it.
+        tile_key, idx: tile of the scene and indices of the batch's points
+        in the members of the tile
+        """
+        file_name = "scene_%06d.npz" % self._count
+        self._count += 1
+        tmp_path = join(self.run_dir, file_name + ".tmp")
+        with open(tmp_path, "wb") as fp:
+            np.savez(
+                fp,
+                date=np.array(batch.date),
+                bands=np.array(batch.bands),
+                tile_key=np.array(str(tile_key)),
+                idx=np.asarray(idx, dtype=np.int64),
+                lats=batch.lats,
+                lons=batch.lons,
+                values=batch.values,
+            )
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, join(self.run_dir, file_name))
+
+        with open(self.journal_path, "a") as fp:
+            fp.write(json.dumps({"scene_id": batch.scene_id, "file": file_name}) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        self.done[batch.scene_id] = file_name
+
+    def clear(self):
+        """Remove the run directory once the run has finished."""
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+        self.done = {}
+        self._count = 0
+
+
+"""
+get the indices in tiled of the points of a journaled scene, or None if the
+scene was journaled for other points (or by an older version, without tile)
+"""
+
+
+def _scene_members(data, tiled, tile_keys):
+    if "tile_key" not in data.files:
+        return None
+    members = tiled.tiles.get(tile_keys.get(str(data["tile_key"])))
+    if members is None:
+        return None
+    idx = data["idx"]
+    if len(idx) and (idx.min() < 0 or idx.max() >= len(members)):
+        return None
+    members = members[idx]
+    if not (
+        np.array_equal(tiled.lats[members], data["lats"])
+        and np.array_equal(tiled.lons[members], data["lons"])
+    ):
+        return None
+    return members
@@ -0,0 +1,656 @@
+"""
+sensor-agnostic extraction engine shared by the Landsat, MODIS and Sentinel
+extractors: scene discovery, QA masking, band reads, scaling, windows,
+result cache, checkpoints and parallelism are written once here, and a
+Sensor descriptor per product gives what differs (file discovery, band map,
+QA rule, scale factor and valid range)
+Usage:
+    sensor = Landsat_Ref_Mod.LandsatSR()
+    result = extraction_engine.extract(sensor, tile_dict, start_time, end_time)
+"""
+
+import os
+import hashlib
+from os.path import join
+from collections import namedtuple
+import numpy as np
+from osgeo import gdal
+import settings
+import geo_functions
+import raster_reader
+import parallel
+import result_cube
+import checkpoint
+import scene_cache
+import instrument
+
+
+"""
+files of one scene, as given by Sensor.scene_files
+date: 'YYYYMMDD'
+qa_path: QA raster of the scene, None if the sensor has none
+grids: list of {raw band: path}, one dict per pixel grid (the files of a
+dict share CRS, geotransform and size, so the points are transformed once)
+bands: output bands of the scene, the keys given by Sensor.scale_values
+"""
+Scene = namedtuple("Scene", ["date", "qa_path", "grids", "bands"])
+
+
+class Sensor:
+    """Descriptor of a sensor product for the extraction engine.
+    Subclasses set the attributes and implement list_scenes and scene_files;
+    qa_rule and scale_values have defaults for sensors without QA raster and
+    with a linear scale. Instances are sent to the worker processes, so they
+    only hold plain values.
+    Attributes:
+    name: extractor name in the result cache and checkpoints
+    version: version of the extracted values in the result cache, bump it
+    whenever the sensor gives different values for the same scene
+    bands: output bands of the results (of all scenes)
+    decimals: number of decimals of the values
+    scale: factor from raw values to physical values
+    valid_range: (low, high) exclusive bounds of the scaled values, None to
+    keep all values
+    all_bands_required: skip scenes in which a band cannot be read, instead
+    of giving -1 for that band
+    empty_records: give every input point a record in the dict format, also
+    the points without any value
+    window_size: None for the pixel under each point, or an odd size k to
+    get window_stats of the clear pixels of the k x k window around it
+    """
+
+    name = None
+    version = "1"
+    bands = []
+    decimals = 4
+    scale = 1.0
+    valid_range = None
+    all_bands_required = False
+    empty_records = False
+    window_size = None
+    window_stats = None
+
+    def tile_points(self, points):
+        """Get the result_cube.TiledPoints of the input points; by default
+        the input is {tile: [(lat, lon), ...]} already.
+        """
+        return result_cube.tiled_points(points)
+
+    def list_scenes(self, tile_keys, start_time, end_time):
+        """Get {tile: [scene id, ...]} of the scenes between the dates."""
+        raise NotImplementedError
+
+    def scene_stamp(self, scene_id):
+        """Stamp of the files of a scene, see scene_cache.scene_stamp."""
+        return scene_cache.scene_stamp(scene_id)
+
+    def scene_files(self, scene_id):
+        """Get the Scene of a scene id, or None if the scene is unusable."""
+        raise NotImplementedError
+
+    def qa_rule(self, qa_values):
+        """Get the clear pixels (boolean array) from QA values of any shape;
+        NaN values are outside the raster.
+        """
+        return np.ones(np.shape(qa_values), dtype=bool)
+
+    def scale_values(self, raw, bands, shape):
+        """Scale the raw values of the clear points of a scene.
+        raw: {raw band: array of shape}, bands: output bands of the scene
+        output: {band: float array of shape}, NaN for invalid values
+        """
+        scaled = {}
+        for band_type in bands:
+            if band_type not in raw:
+                scaled[band_type] = np.full(shape, np.nan)
+                continue
+            values = np.round(raw[band_type] * self.scale, self.decimals)
+            if self.valid_range is not None:
+                low, high = self.valid_range
+                values = np.where((values > low) & (values < high), values, np.nan)
+            scaled[band_type] = values
+        return scaled
+
+    def columns(self):
+        """Get the columns of the results: the bands, or with a window one
+        "<band>_<stat>" column per band and statistic.
+        """
+        return column_names(self.bands, self.window_size, self.window_stats)
+
+
+"""
+get the result columns of bands, see Sensor.columns
+"""
+
+
+def column_names(bands, window_size=None, window_stats=None):
+    if not window_size or window_size == 1:
+        return list(bands)
+    if window_stats is None:
+        window_stats = settings.NEIGHBORHOOD_STATS
+    return [band_type + "_" + stat for band_type in bands for stat in window_stats]
+
+
+"""
+open a raster and get the pixels of the points in it, once per grid
+output of the function:
+(pxs, pys, valid) as geo_functions.points_to_pixels, and the raster
+"""
+
+
+def _open_pixels(path, lats, lons, points_key):
+    with instrument.stage("gdal_open"):
+        ds = gdal.Open(path)
+    if ds is None:
+        raise IOError("Unable to open " + path)
+    return geo_functions.points_to_pixels_cached(ds, lats, lons, points_key), ds
+
+
+"""
+data of a scene read by load_scene, to be turned into values by sample_scene
+scene: the Scene
+idx: indices of the clear points
+clear_pixels: with a window, clear pixels of the windows of all points
+(None without a window or QA raster)
+raw: {raw band: values (or patches) at the clear points}
+"""
+LoadedScene = namedtuple("LoadedScene", ["scene", "idx", "clear_pixels", "raw"])
+
+
+"""
+function to read the QA and band values of one scene at the given points
+(the I/O part of extract_scene)
+input of the function:
+scene_id: scene folder or file, given to sensor.scene_files
+sensor: Sensor descriptor
+lats, lons: coordinates of the points of the scene's tile, numpy arrays
+points_key: identifier of the points (scene_cache.points_hash), to reuse
+their pixels on every raster of the same grid
+output of the function:
+LoadedScene, or None if the scene cannot be used
+"""
+
+
+def load_scene(scene_id, sensor, lats, lons, points_key=None):
+    if points_key is None:
+        points_key = scene_cache.points_hash(lats, lons)
+    window_size = sensor.window_size
+
+    scene = sensor.scene_files(scene_id)
+    if scene is None:
+        return None
+
+    # clear points (and with a window, clear pixels) from the QA raster
+    clear = np.ones(len(lats), dtype=bool)
+    clear_pixels = None
+    if scene.qa_path is not None:
+        try:
+            (pxs, pys, valid), qa_ds = _open_pixels(
+                scene.qa_path, lats, lons, points_key
+            )
+            if window_size is None:
+                qa_values = raster_reader.read_points(
+                    qa_ds.GetRasterBand(1), pxs, pys, valid
+                )
+            else:
+                qa_values = raster_reader.read_windows(
+                    qa_ds.GetRasterBand(1), pxs, pys, window_size, valid
+                )
+        except Exception as e:
+            print(e)
+            print("Unable to open QC file: " + scene.qa_path + "\n")
+            return None
+        if window_size is None:
+            clear = valid & sensor.qa_rule(qa_values)
+        else:
+            clear_pixels = sensor.qa_rule(qa_values)
+            clear = valid & clear_pixels.any(axis=(1, 2))
+        qa_ds = qa_values = None
+
+    # the points of each grid, through the first raster of the grid
+    grids = []
+    for band_paths in scene.grids:
+        try:
+            (pxs, pys, valid), _ = _open_pixels(
+                list(band_paths.values())[0], lats, lons, points_key
+            )
+        except Exception as e:
+            print(e)
+            print("Unable to open the rasters of scene: " + scene_id + "\n")
+            return None
+        clear = clear & valid
+        grids.append((band_paths, pxs, pys))
+    idx = np.flatnonzero(clear)
+
+    # read the bands of each grid concurrently, only at the clear points
+    raw = {}
+    for band_paths, pxs, pys in grids:
+        bandvalues = raster_reader.read_bands(
+            band_paths, pxs, pys, clear, size=window_size
+        )
+        for band_type in band_paths:
+            if band_type not in bandvalues:
+                print("Unable to get " + band_type + " data of: " + scene_id + "\n")
+                if sensor.all_bands_required:
+                    return None
+                continue
+            raw[band_type] = bandvalues[band_type][idx]
+        # keep only the clear points, free the full-length arrays now
+        bandvalues = None
+
+    return LoadedScene(scene, idx, clear_pixels, raw)
+
+
+"""
+function to compute the values of a loaded scene (the CPU part of
+extract_scene): QA masking of the windows, scaling and statistics
+output of the function:
+as extract_scene
+"""
+
+
+def sample_scene(sensor, loaded):
+    if loaded is None:
+        return None
+    scene, idx, clear_pixels, raw = loaded
+    window_size = sensor.window_size
+    window_stats = sensor.window_stats
+    if window_stats is None:
+        window_stats = settings.NEIGHBORHOOD_STATS
+
+    if window_size is None:
+        shape = (len(idx),)
+        raw = {
+            band_type: values.astype(np.float64) for band_type, values in raw.items()
+        }
+        with instrument.stage("scale"):
+            scaled = sensor.scale_values(raw, scene.bands, shape)
+            values = np.column_stack([scaled[band_type] for band_type in scene.bands])
+            # scenes without clear points give an empty [0, bands] block
+            values = np.where(np.isnan(values), -1.0, values)
+            values = values.reshape(len(idx), len(scene.bands))
+        return scene.date, list(scene.bands), idx, values.astype(np.float32)
+
+    shape = (len(idx), window_size, window_size)
+    columns = []
+    with instrument.stage("scale"):
+        scaled = sensor.scale_values(raw, scene.bands, shape)
+        for band_type in scene.bands:
+            pixels = scaled[band_type]
+            if clear_pixels is not None:
+                # mask cloudy pixels, per pixel
+                pixels = np.where(clear_pixels[idx], pixels, np.nan)
+            stats = raster_reader.window_stats(pixels, window_stats)
+            for stat in window_stats:
+                columns.append(np.where(np.isnan(stats[stat]), -1.0, stats[stat]))
+        values = np.round(np.column_stack(columns), sensor.decimals)
+        values = values.reshape(len(idx), len(scene.bands) * len(window_stats))
+    return (
+        scene.date,
+        column_names(scene.bands, window_size, window_stats),
+        idx,
+        values.astype(np.float32),
+    )
+
+
+"""
+function to extract the values of one scene at the given points
+input of the function:
+as load_scene
+output of the function:
+(file_date, columns, idx, values) where idx are the indices of the clear
+points inside the scene (with a window: of the points with at least one
+clear pixel) and values a float32 array [len(idx), len(columns)], -1 for
+invalid values; or None if the scene cannot be used
+"""
+
+
+def extract_scene(scene_id, sensor, lats, lons, points_key=None):
+    return sample_scene(sensor, load_scene(scene_id, sensor, lats, lons, points_key))
+
+
+"""
+estimate the peak memory of extracting one scene: for every band of a grid
+read at the same time (settings.BAND_READ_THREADS), the area read_points or
+read_windows reads at the points (whole raster, window or block, see
+raster_reader.read_peak_bytes), plus the per-point arrays. Only the raster
+metadata is read, and the estimate of a grid is cached per grid and points
+input of the function:
+scene_id, sensor, lats, lons, points_key: as for extract_scene
+output of the function:
+estimated bytes, 0 if the scene cannot be used
+"""
+
+GRID_MEMORY_CACHE_SIZE = 64
+_grid_memory = {}
+
+
+def scene_memory(scene_id, sensor, lats, lons, points_key=None):
+    if points_key is None:
+        points_key = scene_cache.points_hash(lats, lons)
+    scene = sensor.scene_files(scene_id)
+    if scene is None:
+        return 0
+    threads = max(settings.BAND_READ_THREADS or 1, 1)
+    grids = list(scene.grids)
+    if scene.qa_path is not None:
+        grids.append({"qa": scene.qa_path})
+
+    peak = 0
+    band_count = 0
+    for band_paths in grids:
+        band_count += len(band_paths)
+        try:
+            ds = gdal.Open(list(band_paths.values())[0])
+            band = ds.GetRasterBand(1)
+            key = geo_functions.grid_key(ds) + (
+                points_key,
+                band.DataType,
+                sensor.window_size,
+            )
+            grid_bytes = _grid_memory.get(key)
+            if grid_bytes is None:
+                pxs, pys, valid = geo_functions.points_to_pixels_cached(
+                    ds, lats, lons, points_key
+                )
+                grid_bytes = raster_reader.read_peak_bytes(
+                    band, pxs[valid], pys[valid], sensor.window_size
+                )
+                if len(_grid_memory) >= GRID_MEMORY_CACHE_SIZE:
+                    del _grid_memory[next(iter(_grid_memory))]
+                _grid_memory[key] = grid_bytes
+        except Exception:
+            continue
+        # the grids are read one after another
+        peak = max(peak, grid_bytes * min(len(band_paths), threads))
+        ds = band = None
+
+    pixels = (sensor.window_size or 1) ** 2
+    return peak + len(lats) * pixels * 8 * (band_count + 3)
+
+
+"""
+extract the units of iter_scenes in this process, loading the next depth
+scenes in background threads while the current one is sampled
+output of the function:
+iterator over the extract_scene results, in the order of units; with
+instrument, the counters of a scene also hold the reads of the scenes
+loaded meanwhile
+"""
+
+
+def _sample_prefetched(units, depth, cost, budget):
+    loaded = parallel.prefetch(load_scene, units, depth, cost, budget)
+    try:
+        for unit in units:
+            instrument.begin_scene()
+            result = sample_scene(unit[1], next(loaded))
+            instrument.end_scene(unit[0])
+            yield result
+    finally:
+        loaded.close()
+
+
+"""
+function to extract the scenes of a sensor scene by scene
+input of the function:
+sensor: Sensor descriptor
+points: input points of the sensor (see Sensor.tile_points) or TiledPoints
+start_time, end_time: 'YYYYMMDD' [string]
+workers: number of processes extracting scenes in parallel (None: serial)
+point_index: result_cube.PointIndex giving the point ids (a new one if None)
+checkpoint: checkpoint.Checkpoint of the run; the scenes it has completed are
+yielded from disk first (with the ids of point_index) and not read again,
+new scenes are recorded in it
+cache: scene_cache.SceneCache; scenes cached for the same points and
+unchanged on disk are not read again, new results are stored in it
+output of the function:
+iterator of result_cube.SceneBatch, one per usable scene as soon as it is
+processed, in the same order in serial and parallel mode
+"""
+
+
+def iter_scenes(
+    sensor,
+    points,
+    start_time,
+    end_time,
+    workers=None,
+    point_index=None,
+    checkpoint=None,
+    cache=None,
+):
+    if point_index is None:
+        point_index = result_cube.PointIndex()
+
+    tiled = tile_points(sensor, points)
+    with instrument.stage("list_files"):
+        tar_list = sensor.list_scenes(list(tiled.tiles.keys()), start_time, end_time)
+    # ids of all the points, registered once; the tiles index into them
+    point_ids = point_index.add_points(tiled.lats, tiled.lons)
+
+    done = {}
+    if checkpoint is not None:
+        done = checkpoint.done
+        # Results of the scenes completed before a restart
+        for batch in checkpoint.batches(tiled, point_ids):
+            yield batch
+
+    # One work unit per (scene, points of its tile)
+    units = []
+    unit_keys = []
+    unit_stamps = []
+    tile_ids = {}
+    for tile_key in tar_list.keys():
+        members = tiled.tiles[tile_key]
+        lats = tiled.lats[members]
+        lons = tiled.lons[members]
+        tile_ids[tile_key] = point_ids[members]
+        points_key = scene_cache.points_hash(lats, lons)
+        for scene_id in tar_list[tile_key]:
+            if scene_id in done:
+                continue
+            stamp = None
+            if cache is not None:
+                stamp = sensor.scene_stamp(scene_id)
+                cached = cache.get(scene_id, points_key, stamp)
+                if cached is not None:
+                    # yielded as found, not held until the scan ends
+                    file_date, bands, idx, values = cached
+                    yield result_cube.SceneBatch(
+                        scene_id,
+                        file_date,
+                        bands,
+                        tile_ids[tile_key][idx],
+                        lats[idx],
+                        lons[idx],
+                        values,
+                    )
+                    cached = None
+                    continue
+            units.append((scene_id, sensor, lats, lons, points_key))
+            unit_keys.append(tile_key)
+            unit_stamps.append(stamp)
+
+    tile_count = 0
+    last_key = None
+    budget = None
+    if settings.MEMORY_BUDGET_MB:
+        budget = settings.MEMORY_BUDGET_MB * 2 ** 20
+
+    # cost is called in this thread before a unit is submitted, on the
+    # critical path of the prefetch: the scenes of a tile share the grid and
+    # points, so the estimate of its first usable scene is reused for the
+    # others instead of opening their files here
+    tile_memory = {}
+
+    def cost(unit):
+        memory = tile_memory.get(unit[4])
+        if memory is None:
+            memory = scene_memory(*unit)
+            if memory:
+                tile_memory[unit[4]] = memory
+        return memory
+
+    if (not workers or workers <= 1) and settings.PREFETCH_DEPTH:
+        results = _sample_prefetched(units, settings.PREFETCH_DEPTH, cost, budget)
+    else:
+        results = parallel.map_units(extract_scene, units, workers, cost, budget)
+    for unit, tile_key, stamp, result in zip(units, unit_keys, unit_stamps, results):
+        if tile_key != last_key:
+            print(
+                "Processing the tile",
+                tile_count,
+                "out of ",
+                len(tar_list.keys()),
+                ", file number:",
+                len(tar_list[tile_key]),
+            )
+            tile_count += 1
+            last_key = tile_key
+        if result is None:
+            continue
+        scene_id, _, lats, lons, points_key = unit
+        file_date, bands, idx, values = result
+        batch = result_cube.SceneBatch(
+            scene_id,
+            file_date,
+            bands,
+            tile_ids[tile_key][idx],
+            lats[idx],
+            lons[idx],
+            values,
+        )
+        if cache is not None:
+            cache.put(scene_id, points_key, stamp, file_date, bands, idx, values)
+        if checkpoint is not None:
+            checkpoint.record(batch, tile_key, idx)
+        yield batch
+
+
+"""
+get the TiledPoints of a sensor's input points (unchanged if they are
+TiledPoints already, e.g. passed on by extract)
+"""
+
+
+def tile_points(sensor, points):
+    if isinstance(points, result_cube.TiledPoints):
+        return points
+    with instrument.stage("tile_assignment"):
+        return sensor.tile_points(points)
+
+
+"""
+digest of TiledPoints identifying the points of a run (for checkpoints)
+"""
+
+
+def points_digest(tiled):
+    sha = hashlib.sha1(scene_cache.points_hash(tiled.lats, tiled.lons).encode())
+    for tile_key, members in tiled.tiles.items():
+        sha.update(str(tile_key).encode("utf-8"))
+        sha.update(np.ascontiguousarray(members, dtype=np.int64).tobytes())
+    return sha.hexdigest()
+
+
+"""
+function to extract the values of a sensor given sample points and a period
+of time
+input of the function:
+sensor: Sensor descriptor
+points: input points of the sensor (see Sensor.tile_points) or TiledPoints
+start_time, end_time: 'YYYYMMDD' [string]
+workers: number of processes extracting scenes in parallel (None: serial);
+the results are the same as in serial mode
+output: "dict" for the format below, "cube" for a result_cube.ResultCube
+(points x dates x columns float32 array, convert with to_legacy())
+resume: journal completed scenes under settings.CHECKPOINT_PATH, so that a
+run restarted with the same parameters skips them; removed when finished
+use_cache: reuse the results of unchanged scenes stored in the result cache
+(settings.RESULT_CACHE_PATH) and store the new ones; off by default, as the
+cache grows with every scene and point set until the file is deleted
+output of the function:
+{(lat_str, lon_str): {column: [(date, value), ...]}}, sorted by date
+"""
+
+
+def extract(
+    sensor,
+    points,
+    start_time,
+    end_time,
+    workers=None,
+    output="dict",
+    resume=False,
+    use_cache=False,
+):
+    columns = sensor.columns()
+    tiled = tile_points(sensor, points)
+    point_index = result_cube.PointIndex()
+    run_checkpoint = None
+    if resume:
+        run_checkpoint = checkpoint.Checkpoint.for_run(
+            join(os.path.expanduser("~"), settings.CHECKPOINT_PATH),
+            sensor.name,
+            points_digest(tiled),
+            start_time,
+            end_time,
+        )
+    cache = None
+    if use_cache and settings.RESULT_CACHE_PATH:
+        cache = scene_cache.SceneCache(
+            join(os.path.expanduser("~"), settings.RESULT_CACHE_PATH),
+            sensor.name,
+            sensor.version,
+        )
+    batches = iter_scenes(
+        sensor,
+        tiled,
+        start_time,
+        end_time,
+        workers,
+        point_index,
+        run_checkpoint,
+        cache,
+    )
+
+    try:
+        if output == "cube":
+            builder = result_cube.CubeBuilder(
+                columns, sensor.decimals, point_index, sensor.empty_records
+            )
+            for batch in batches:
+                builder.add_batch(batch)
+            if run_checkpoint is not None:
+                run_checkpoint.clear()
+            with instrument.stage("build_cube"):
+                return builder.build()
+
+        # Results by point id, keyed by "{:.6f}" strings only at the end
+        records = {}
+        for batch in batches:
+            with instrument.stage("merge_results"):
+                result_cube.merge_records(records, batch, columns, sensor.decimals)
+        if run_checkpoint is not None:
+            run_checkpoint.clear()
+    finally:
+        if cache is not None:
+            cache.close()
+
+    with instrument.stage("merge_results"):
+        if sensor.empty_records:
+            # every input point gets a record, even without any value
+            records = {
+                point_id: records.get(point_id)
+                or {band_type: [] for band_type in columns}
+                for point_id in range(len(point_index))
+            }
+        res = result_cube.legacy_records(records, point_index)
+
+    # Sort the results by date
+    for record in res.values():
+        for band_values in record.values():
+            band_values.sort()
+
+    return res
@@ -1,5 +1,7 @@
 from osgeo import osr
+import threading
 import numpy as np
+import instrument
 
 """
 获得给定数据的投影参考系和地理参考系
@@ -25,12 +27,60 @@ def getSRSPair(dataset):
 
 
 def lonlat2geo(dataset, lon, lat):
-    prosrs, geosrs = getSRSPair(dataset)
-    ct = osr.CoordinateTransformation(geosrs, prosrs)
+    ct = get_transform(dataset.GetProjection())
     coords = ct.TransformPoint(lon, lat)
     return coords[:2]
 
 
+"""
+按投影WKT缓存经纬度到投影坐标的转换对象，避免每个点都重建SpatialReference
+:param wkt: 投影参考系WKT
+:return: 地理坐标(lon, lat)到投影坐标的osr.CoordinateTransformation
+"""
+
+# 转换对象不能在线程间共享，每个线程一个{WKT: 转换对象}缓存，随线程结束释放
+_transform_local = threading.local()
+
+
+def get_transform(wkt):
+    cache = getattr(_transform_local, "cache", None)
+    if cache is None:
+        cache = _transform_local.cache = {}
+    ct = cache.get(wkt)
+    if ct is None:
+        prosrs = osr.SpatialReference()
+        prosrs.ImportFromWkt(wkt)
+        geosrs = prosrs.CloneGeogCS()
+        # GDAL 3 defaults to authority axis order (lat, lon); keep (lon, lat)
+        if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+            prosrs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            geosrs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        ct = osr.CoordinateTransformation(geosrs, prosrs)
+        cache[wkt] = ct
+    return ct
+
+
+"""
+批量将经纬度坐标转为投影坐标
+:param dataset: GDAL地理数据
+:param lons: 经度数组
+:param lats: 纬度数组
+:return: 投影坐标数组(x, y)
+"""
+
+
+def lonlat2geo_batch(dataset, lons, lats):
+    lons = np.asarray(lons, dtype=np.float64).ravel()
+    lats = np.asarray(lats, dtype=np.float64).ravel()
+    if lons.size == 0:
+        return np.empty(0), np.empty(0)
+    ct = get_transform(dataset.GetProjection())
+    coords = np.asarray(
+        ct.TransformPoints(np.column_stack((lons, lats)).tolist()), dtype=np.float64
+    )
+    return coords[:, 0], coords[:, 1]
+
+
 """
 根据GDAL的六参数模型将给定的投影或地理坐标转为影像图上坐标（行列号）
 :param dataset: GDAL地理数据
@@ -48,8 +98,26 @@ def geo2imagexy(dataset, x, y):
 
 
 """
-根据图像坐标获取波段内像素值
-:param bandraster: 栅格图像波段
+批量将投影坐标转为影像图上坐标，六参数模型只求逆一次
+:param dataset: GDAL地理数据
+:param x: 投影坐标x数组
+:param y: 投影坐标y数组
+:return: 浮点影像坐标数组(px, py)
+"""
+
+
+def geo2imagexy_batch(dataset, x, y):
+    trans = dataset.GetGeoTransform()
+    inv = np.linalg.inv(np.array([[trans[1], trans[2]], [trans[4], trans[5]]]))
+    dx = np.asarray(x, dtype=np.float64) - trans[0]
+    dy = np.asarray(y, dtype=np.float64) - trans[3]
+    return inv[0, 0] * dx + inv[0, 1] * dy, inv[1, 0] * dx + inv[1, 1] * dy
+
+
+"""
+根据图像坐标获取波段内像素值（已弃用，保留给外部调用者；新代码请用
+raster_reader.read_points按点批量读取）
+:param bandraster: 栅格图像波段数组
 :param px: 图像坐标x
 :param py: 图像坐标y
 :param dataType: 获取数据类型（1:Landsat 2:Sentinel 3:MODIS）
@@ -58,39 +126,101 @@ def geo2imagexy(dataset, x, y):
 
 
 def get_band_value(bandraster, px, py, dataType, cloud=False):
-    result = bandraster[py][px]
-    value = -1
+    return scale_band_value(bandraster[py][px], dataType, cloud)
+
+
+"""
+按数据类型对像素值进行缩放（已弃用，新代码由extraction_engine.Sensor缩放）
+:param result: 像素值
+:param dataType: 获取数据类型（1:Landsat 2:Sentinel 3:MODIS），其他类型返回-1
+:param cloud: 是否是云掩膜
+"""
+
+
+def scale_band_value(result, dataType, cloud=False):
     if cloud:
-        value = round(result, 4)
-    elif dataType is 1 or 2:
-        value = round(result * 0.0001, 4)
-    elif dataType is 3:
-        value = round(result * 0.02, 4)
-    else:
-        value = -1
-    return value
+        return round(result, 4)
+    if dataType in (1, 2):
+        return round(result * 0.0001, 4)
+    if dataType == 3:
+        return round(result * 0.02, 4)
+    return -1
 
 
 """
-根据经纬度获取图像坐标
+根据经纬度获取图像坐标（已弃用，单点调用points_to_pixels；新代码请直接
+批量调用points_to_pixels）
 :param bandfile: 栅格图像文件句柄
 :param lat: 纬度
 :param lon: 经度
+:return: (是否落在图像范围内, px, py)
 """
 
 
 def point_boundary_is_valid(bandfile, lat, lon):
-    xsize = bandfile.RasterXSize
-    ysize = bandfile.RasterYSize
-    x, y = lonlat2geo(bandfile, lon, lat)  # (lat, lon) to (x, y)
-    px, py = geo2imagexy(bandfile, x, y)  # (x, y) to (row, col)
-    px = int(px)
-    py = int(py)
-    if px > xsize or px < 0 or py > ysize or py < 0:
+    pxs, pys, valid = points_to_pixels(bandfile, [lat], [lon])
+    if not valid[0]:
         print("the point is out of the image range:" + str(lat) + ", " + str(lon))
-        return False, px, py
-    else:
-        return True, px, py
+    return bool(valid[0]), int(pxs[0]), int(pys[0])
+
+
+"""
+批量根据经纬度获取图像坐标
+:param dataset: 栅格图像文件句柄
+:param lats: 纬度数组
+:param lons: 经度数组
+:return: 整型图像坐标数组(px, py)以及是否落在图像范围内的布尔掩膜
+"""
+
+
+def points_to_pixels(dataset, lats, lons):
+    with instrument.stage("transform"):
+        x, y = lonlat2geo_batch(dataset, lons, lats)
+        fx, fy = geo2imagexy_batch(dataset, x, y)
+    valid = np.isfinite(fx) & np.isfinite(fy)
+    fx = np.floor(np.where(valid, fx, -1))
+    fy = np.floor(np.where(valid, fy, -1))
+    valid &= (fx >= 0) & (fx < dataset.RasterXSize)
+    valid &= (fy >= 0) & (fy < dataset.RasterYSize)
+    return fx.astype(np.int64), fy.astype(np.int64), valid
+
+
+"""
+按栅格网格（投影、六参数、尺寸）缓存点集的图像坐标：同一分幅不同日期、
+同一分辨率的各波段网格相同，只需转换一次
+:param dataset: GDAL地理数据
+:param lats: 纬度数组
+:param lons: 经度数组
+:param points_key: 点集标识，如scene_cache.points_hash(lats, lons)
+:return: 同points_to_pixels（缓存的数组请勿修改）
+"""
+
+PIXEL_CACHE_SIZE = 16
+_pixel_cache = {}
+_pixel_lock = threading.Lock()
+
+
+def grid_key(dataset):
+    return (
+        dataset.GetProjection(),
+        tuple(dataset.GetGeoTransform()),
+        dataset.RasterXSize,
+        dataset.RasterYSize,
+    )
+
+
+def points_to_pixels_cached(dataset, lats, lons, points_key):
+    key = grid_key(dataset) + (points_key,)
+    with _pixel_lock:
+        pixels = _pixel_cache.get(key)
+    if pixels is None:
+        pixels = points_to_pixels(dataset, lats, lons)
+        with _pixel_lock:
+            if len(_pixel_cache) >= PIXEL_CACHE_SIZE:
+                # drop the oldest grid
+                del _pixel_cache[next(iter(_pixel_cache))]
+            _pixel_cache[key] = pixels
+    return pixels
 
 
 """
@@ -1,28 +1,35 @@
-from landsat_index import ConvertToWRS_Landsat
+from landsat_index import ConvertToWRS
 from sentinel_index import ConvertToWRS_Sentinel
 from os.path import join
 import os, sys
 import pprint
 import numpy as np
-import subprocess
+import modis_index
+import result_cube
+import instrument
 
 sys.path.append(join(os.path.dirname(os.path.realpath(__file__)),".."))
 printer = pprint.PrettyPrinter(indent=3)
 
 '''
 For Landsat Data
+get_landsat_tile_index gives result_cube.TiledPoints: the points as float64
+arrays and the indices of the points of each 'path-row' tile
+get_landsat_tile gives the legacy {'path-row': [(lat, lon), ...]}
 '''
+def get_landsat_tile_index(points):
+    lats, lons = result_cube.as_point_arrays(points)
+    to_WRS = ConvertToWRS()
+    with instrument.stage('tile_assignment'):
+        point_idx, paths, rows = to_WRS.get_wrs_many(lats, lons)
+        codes = np.asarray(paths, dtype=np.int64) * 1000 + np.asarray(rows, dtype=np.int64)
+        tiled = result_cube.tiles_of_matches(lats, lons, point_idx, codes)
+    tiles = {'0' + str(code // 1000) + '-' + '0' + str(code % 1000): members
+             for code, members in tiled.tiles.items()}
+    return result_cube.TiledPoints(tiled.lats, tiled.lons, tiles)
+
 def get_landsat_tile(points):
-    tile_dict = {}
-    to_WRS = ConvertToWRS_Landsat()
-    for (lat,lon) in points:
-        result = to_WRS.get_wrs(lat,lon)
-        for i in range(0,len(result)):
-            path = '0' + str(result[i]['path'])
-            row = '0' + str(result[i]['row'])
-            key = path + '-' + row
-            tile_dict.setdefault(key,[]).append((lat,lon))
-    return tile_dict
+    return result_cube.tile_lists(get_landsat_tile_index(points))
 
 '''
 For Sentinel Data
@@ -38,25 +45,24 @@ def get_sentinel_tile(points):
 
 '''
 For MODIS Data
+get_modis_tile_index gives result_cube.TiledPoints with the indices of the
+points of each 'hXXvYY' tile; get_modis_tile the legacy {'hXXvYY': [(lat, lon), ...]}
 '''
+def get_modis_tile_index(points):
+    lats, lons = result_cube.as_point_arrays(points)
+    with instrument.stage('tile_assignment'):
+        h, v = modis_index.latlon_to_tile(lats, lons)
+        point_idx = np.flatnonzero(h >= 0)
+        tiled = result_cube.tiles_of_matches(lats, lons, point_idx,
+                                             h[point_idx] * 100 + v[point_idx])
+    for point in zip(lats[h < 0].tolist(), lons[h < 0].tolist()):
+        print("Invalid coordinate for MODIS tile: " + str(point) + "\n")
+    tiles = {modis_index.tile_name(code // 100, code % 100): members
+             for code, members in tiled.tiles.items()}
+    return result_cube.TiledPoints(tiled.lats, tiled.lons, tiles)
+
 def get_modis_tile(points):
-    tile_dict = {}
-    for pt in points:
-        try:
-            tileName = subprocess.check_output(['extractor_functions/tilemap3', str(pt[0]), str(pt[1])])
-            tileName = tileName.decode("utf-8")
-            tileSub = tileName.split('#')[1]
-            tileName = 'h' + tileSub[0: -3].zfill(2) + 'v' + tileSub[-3:-1]
-        except Exception as e:
-            print("Call MODIS2TILE program error: " + str(pt) + "\n")
-            continue
-        if tileName is None:
-            continue
-        if tileName in tile_dict.keys():
-            tile_dict[tileName].append(pt)
-        else:
-            tile_dict[tileName] = [pt]
-    return tile_dict
+    return result_cube.tile_lists(get_modis_tile_index(points))
 
 if __name__ == '__main__':
     print('begin!')
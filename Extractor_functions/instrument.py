@@ -0,0 +1,199 @@
+"""
+per-stage wall time, call and byte counters of the extractors (directory
+scanning, gdal.Open, reads, coordinate transforms, scaling, result merging)
+
+disabled by default: stage() then returns a shared no-op context manager,
+so instrumented code only pays a function call per stage
+Usage:
+    instrument.enable("scenes.jsonl")   # or enable() for the totals only
+    extract_Landsat_SR(tile_dict, start_time, end_time)
+    print(instrument.summary())
+    instrument.disable()
+stages running in several threads at once (band reads) add up their time
+per thread, so their total can exceed the wall time of the run
+"""
+
+import json
+import time
+import threading
+
+enabled = False
+# stage -> [calls, seconds, bytes], for the whole run and the current scene
+_totals = {}
+_scene = None
+_scene_log = None
+_lock = threading.Lock()
+
+
+class _Stage:
+    """Times a with block and records it under its stage name."""
+
+    __slots__ = ("name", "nbytes", "begin")
+
+    def __init__(self, name):
+        self.name = name
+        self.nbytes = 0
+
+    def add_bytes(self, nbytes):
+        self.nbytes += int(nbytes)
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        add(self.name, time.perf_counter() - self.begin, 1, self.nbytes)
+        return False
+
+
+class _NoStage:
+    """Stage returned when instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def add_bytes(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Context manager timing one stage; call add_bytes on it to count the
+    bytes the stage read.
+    """
+    if not enabled:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def add(name, seconds=0.0, calls=1, nbytes=0):
+    """Add to the counters of a stage."""
+    if not enabled:
+        return
+    with _lock:
+        for stats in (_totals, _scene):
+            if stats is None:
+                continue
+            entry = stats.get(name)
+            if entry is None:
+                entry = stats[name] = [0, 0.0, 0]
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += nbytes
+
+
+def enable(scene_log=None):
+    """Start recording, from zero. scene_log: JSON lines file receiving
+    the counters of every scene (appended), or None.
+    """
+    global enabled, _scene_log
+    reset()
+    _scene_log = scene_log
+    enabled = True
+
+
+def disable():
+    global enabled, _scene_log
+    enabled = False
+    _scene_log = None
+
+
+def reset():
+    global _totals, _scene
+    with _lock:
+        _totals = {}
+        _scene = None
+
+
+def snapshot():
+    """Get the counters of the run as {stage: {"calls", "seconds", "bytes"}}."""
+    with _lock:
+        return _as_dict(_totals)
+
+
+def _as_dict(stats):
+    return {
+        name: {"calls": entry[0], "seconds": entry[1], "bytes": entry[2]}
+        for name, entry in stats.items()
+    }
+
+
+def begin_scene():
+    """Start the counters of one scene (work unit)."""
+    global _scene
+    if enabled:
+        with _lock:
+            _scene = {}
+
+
+def end_scene(scene_id):
+    """Close the counters of the current scene, write them to the scene
+    log if any and return them as [calls, seconds, bytes] per stage.
+    """
+    global _scene
+    if not enabled:
+        return None
+    with _lock:
+        stats, _scene = _scene, None
+    if stats is not None and scene_id is not None:
+        write_scene(scene_id, stats)
+    return stats
+
+
+def write_scene(scene_id, stats):
+    if _scene_log is None or not stats:
+        return
+    with open(_scene_log, "a") as fp:
+        fp.write(json.dumps({"scene_id": scene_id, "stages": _as_dict(stats)}) + "\n")
+
+
+def merge(stats):
+    """Add the counters of a scene processed in another process."""
+    if not enabled or not stats:
+        return
+    with _lock:
+        for name, (calls, seconds, nbytes) in stats.items():
+            entry = _totals.get(name)
+            if entry is None:
+                entry = _totals[name] = [0, 0.0, 0]
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += nbytes
+
+
+def run_recorded(func, *args):
+    """Run one work unit in a worker process and return (result, counters
+    of the unit), so that the parent process can merge them.
+    """
+    global enabled
+    enabled = True
+    reset()
+    begin_scene()
+    result = func(*args)
+    return result, end_scene(None)
+
+
+def summary():
+    """Format the counters of the run as a table, slowest stage first."""
+    stats = snapshot()
+    lines = ["%-16s %10s %12s %14s" % ("stage", "calls", "seconds", "MB read")]
+    for name in sorted(stats, key=lambda name: -stats[name]["seconds"]):
+        entry = stats[name]
+        lines.append(
+            "%-16s %10d %12.4f %14.2f"
+            % (name, entry["calls"], entry["seconds"], entry["bytes"] / 1e6)
+        )
+    return "\n".join(lines)
+
+
+def dump_json(path):
+    """Write the counters of the run to a JSON file."""
+    with open(path, "w") as fp:
+        json.dump(snapshot(), fp, indent=2)
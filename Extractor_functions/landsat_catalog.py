@@ -0,0 +1,149 @@
+"""
+SQLite catalog of the Landsat SR scene folders on the data volumes, so that
+file lookups are indexed queries instead of glob walks over the mounts
+
+folders are expected as <volume>/<sensor>/01/<path>/<row>/<scene folder>,
+e.g. tq-data01/landsat_sr/LC08/01/023/032/LC08_L1TP_023032_20160415_..._T1
+"""
+
+import os
+import sqlite3
+from os.path import join
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    folder TEXT PRIMARY KEY,
+    volume TEXT NOT NULL,
+    sensor TEXT NOT NULL,
+    path TEXT NOT NULL,
+    row TEXT NOT NULL,
+    acq_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scenes_path_row_date ON scenes (path, row, acq_date);
+CREATE TABLE IF NOT EXISTS row_dirs (
+    dir TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+class LandsatCatalog:
+    """Scene catalog stored in a local SQLite file.
+    Usage:
+        catalog = LandsatCatalog(db_path, data_dirs)
+        catalog.refresh(path_rows)   # or catalog.refresh() for everything
+        tar_list = catalog.query(path_rows, "20160401", "20161001")
+    refresh only lists the row directories whose mtime changed since the
+    last refresh, so repeated runs do one stat per (volume, sensor, path/row).
+    """
+
+    def __init__(self, db_path, data_dirs):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.data_dirs = list(data_dirs)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def refresh(self, path_rows=None):
+        """Update the catalog from the data volumes, either for the given
+        (path, row) pairs or, if None, for every path/row found on disk.
+        Returns the number of row directories that were re-listed.
+        """
+        known = dict(self.conn.execute("SELECT dir, mtime_ns FROM row_dirs"))
+        rescanned = 0
+        with self.conn:
+            for row_dir, volume, sensor, path, row in self._row_dirs(path_rows):
+                try:
+                    mtime_ns = os.stat(row_dir).st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+                if known.get(row_dir) == mtime_ns:
+                    # unchanged, or missing and never catalogued
+                    continue
+                self._rescan(row_dir, volume, sensor, path, row, mtime_ns)
+                rescanned += 1
+        return rescanned
+
+    def query(self, path_rows, start_time, end_time):
+        """Get the scene folders per 'path-row' key between two dates
+        ('YYYYMMDD', inclusive), in the format of get_file_list.
+        """
+        tar_list = {}
+        for (path, row) in path_rows:
+            cursor = self.conn.execute(
+                "SELECT folder FROM scenes WHERE path = ? AND row = ? "
+                "AND acq_date BETWEEN ? AND ? ORDER BY acq_date, folder",
+                (path, row, start_time, end_time),
+            )
+            tar_list[path + "-" + row] = [folder for (folder,) in cursor]
+        return tar_list
+
+    def _row_dirs(self, path_rows):
+        """Yield (row_dir, volume, sensor, path, row) for the directories
+        to check. Row directories that disappeared are yielded too when
+        they are known to the catalog, so their scenes get removed.
+        """
+        for volume in self.data_dirs:
+            if not os.path.isdir(volume):
+                continue
+            for sensor in sorted(os.listdir(volume)):
+                sensor_dir = join(volume, sensor, "01")
+                if path_rows is not None:
+                    for (path, row) in path_rows:
+                        yield join(sensor_dir, path, row), volume, sensor, path, row
+                    continue
+                if not os.path.isdir(sensor_dir):
+                    continue
+                for path in sorted(os.listdir(sensor_dir)):
+                    path_dir = join(sensor_dir, path)
+                    if not os.path.isdir(path_dir):
+                        continue
+                    for row in sorted(os.listdir(path_dir)):
+                        yield join(path_dir, row), volume, sensor, path, row
+
+    def _rescan(self, row_dir, volume, sensor, path, row, mtime_ns):
+        """Replace the scenes of one row directory with its current listing."""
+        self.conn.execute(
+            "DELETE FROM scenes WHERE folder LIKE ? ESCAPE '\\'",
+            (_escape_like(join(row_dir, "")) + "%",),
+        )
+        if mtime_ns is None:
+            self.conn.execute("DELETE FROM row_dirs WHERE dir = ?", (row_dir,))
+            return
+        records = []
+        for name in os.listdir(row_dir):
+            folder = join(row_dir, name)
+            acq_date = scene_date(folder)
+            if acq_date is None:
+                continue
+            records.append((folder, volume, sensor, path, row, acq_date))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?)", records
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO row_dirs VALUES (?, ?)", (row_dir, mtime_ns)
+        )
+
+
+"""
+get the acquisition date (YYYYMMDD) from a scene folder name, or None
+"""
+
+
+def scene_date(folder):
+    parts = os.path.basename(folder).split("_")
+    if len(parts) < 4:
+        return None
+    file_date = parts[-4]
+    if len(file_date) != 8 or not file_date.isdigit():
+        return None
+    return file_date
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
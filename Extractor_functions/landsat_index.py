@@ -1,7 +1,19 @@
 import os,sys
-import ogr
+try:
+    from osgeo import ogr
+except ImportError:
+    # GDAL < 2 installs the bindings as top-level modules
+    import ogr
+import numpy as np
 import shapely.geometry
-import shapely.wkt
+import shapely.wkb
+from shapely.strtree import STRtree
+
+try:
+    # shapely >= 2.0 can build and query point arrays in bulk
+    from shapely import points as shapely_points
+except ImportError:
+    shapely_points = None
 
 class ConvertToWRS:
     """Class which performs conversion between latitude/longitude co-ordinates
@@ -15,10 +27,12 @@ class ConvertToWRS:
     1. Create an instance of the class:
 
         conv = ConvertToWRS()
-    (This will take a while to run, as it loads
-    the shapefiles in to memory)
+    (The shapefile is loaded on the first conversion; this is
+    fast once the binary cache next to it has been built)
     2. Use the get_wrs method to do a conversion:
         print conv.get_wrs(50.14, -1.43)
+    or get_wrs_many to convert whole arrays of points at once:
+        point_idx, paths, rows = conv.get_wrs_many(lats, lons)
     For example:
         >>> conv = ConvertToWRS()
         >>> conv.get_wrs(50.14, -1.7)
@@ -27,40 +41,167 @@ class ConvertToWRS:
         [{'path': 201, 'row': 25}, {'path': 202, 'row': 25}]
     """
     def __init__(self, shapefile="wrs2_descending/wrs2_descending.shp"):
-        """Create a new instance of the ConvertToWRS class,
-        and load the shapefiles into memory.
+        """Create a new instance of the ConvertToWRS class.
         If it can't find the shapefile then specify the path
         using the shapefile keyword - but it should work if the
         shapefile is in the same directory.
+        The polygons are loaded on the first conversion, from a binary
+        cache next to the shapefile (wrs2_descending.cache.npz) when it
+        is up to date, otherwise from the shapefile, refreshing the cache.
         """
-        shapefile=os.path.join(os.path.dirname(os.path.realpath(__file__)),"wrs2_descending","wrs2_descending.shp")
-        # Open the shapefile
-        self.shapefile = ogr.Open(shapefile)
+        # relative paths are relative to this directory
+        shapefile=os.path.join(os.path.dirname(os.path.realpath(__file__)),shapefile)
         if not os.path.exists(shapefile):
             raise Exception("path-row file was not found and check out the file dir!")
             # print('path-row file was not found and check out the file dir!')
             # exit(0)
-        # Get the only layer within it
-        self.layer = self.shapefile.GetLayer(0)
+        self.shapefile_path = shapefile
+        self.cache_path = os.path.splitext(shapefile)[0] + ".cache.npz"
+        self.polygons = None
+
+    def _load(self):
+        """Load the polygons and build the spatial index, once."""
+        if self.polygons is not None:
+            return
+        stamp = self._shapefile_stamp()
+        polygons = self._read_cache(stamp)
+        if polygons is None:
+            polygons = self._read_shapefile()
+            self._write_cache(polygons, stamp)
+        self.polygons = polygons
+        self._build_index()
+
+    def _shapefile_stamp(self):
+        """mtime (ns) and size of the shapefile and of its .dbf (which holds
+        the paths and rows), used to validate the cache.
+        """
+        stamp = []
+        for path in (self.shapefile_path,
+                     os.path.splitext(self.shapefile_path)[0] + ".dbf"):
+            if os.path.exists(path):
+                st = os.stat(path)
+                stamp += [st.st_mtime_ns, st.st_size]
+            else:
+                stamp += [0, 0]
+        return np.array(stamp, dtype=np.int64)
+
+    def _read_shapefile(self):
+        """Read (shape, path, row) tuples from the shapefile through OGR."""
+        # Open the shapefile and get the only layer within it
+        datasource = ogr.Open(self.shapefile_path)
+        layer = datasource.GetLayer(0)
 
-        self.polygons = []
+        polygons = []
 
         # For each feature in the layer
-        for i in range(self.layer.GetFeatureCount()):
+        for i in range(layer.GetFeatureCount()):
             # Get the feature, and its path and row attributes
-            feature = self.layer.GetFeature(i)
+            feature = layer.GetFeature(i)
             path = feature['PATH']
             row = feature['ROW']
 
             # Get the geometry into a Shapely-compatible
-            # format by converting to Well-known Text (Wkt)
+            # format by converting to Well-known Binary (Wkb)
             # and importing that into shapely
             geom = feature.GetGeometryRef()
-            shape = shapely.wkt.loads(geom.ExportToWkt())
+            shape = shapely.wkb.loads(bytes(geom.ExportToWkb()))
 
             # Store the shape and the path/row values
             # in a list so we can search it easily later
-            self.polygons.append((shape, path, row))
+            polygons.append((shape, path, row))
+
+        return polygons
+
+    def _read_cache(self, stamp):
+        """Return the cached polygons, or None if the cache is missing,
+        unreadable or older than the shapefile.
+        """
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            with np.load(self.cache_path) as cache:
+                if not np.array_equal(cache['stamp'], stamp):
+                    return None
+                wkb = cache['wkb'].tobytes()
+                offsets = cache['offsets']
+                paths = cache['paths']
+                rows = cache['rows']
+        except Exception as e:
+            print("Unable to read WRS-2 cache, rebuilding: " + str(e))
+            return None
+
+        polygons = []
+        for i in range(len(paths)):
+            shape = shapely.wkb.loads(wkb[offsets[i]:offsets[i + 1]])
+            polygons.append((shape, int(paths[i]), int(rows[i])))
+        return polygons
+
+    def _write_cache(self, polygons, stamp):
+        """Store the polygons as concatenated WKB plus offsets and the
+        path/row arrays; written to a temporary file and renamed so that
+        concurrent workers never see a partial cache.
+        """
+        blobs = [poly[0].wkb for poly in polygons]
+        offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(blob) for blob in blobs])
+        tmp_path = self.cache_path + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as fp:
+                np.savez(fp,
+                         stamp=stamp,
+                         wkb=np.frombuffer(b"".join(blobs), dtype=np.uint8),
+                         offsets=offsets,
+                         paths=np.array([poly[1] for poly in polygons], dtype=np.int32),
+                         rows=np.array([poly[2] for poly in polygons], dtype=np.int32))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print("Unable to write WRS-2 cache: " + str(e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _build_index(self):
+        """Build the STRtree over the WRS-2 polygons, with the path/row
+        attributes kept in arrays aligned with the tree's geometry order.
+        """
+        self.shapes = [poly[0] for poly in self.polygons]
+        self.paths = np.array([poly[1] for poly in self.polygons], dtype=np.int32)
+        self.rows = np.array([poly[2] for poly in self.polygons], dtype=np.int32)
+        self.tree = STRtree(self.shapes)
+        # shapely < 2.0 returns geometries from queries, not indices
+        self._shape_index = {id(shape): i for i, shape in enumerate(self.shapes)}
+
+    def get_wrs_many(self, lats, lons):
+        """Get the Landsat WRS-2 paths and rows for arrays of latitude and
+        longitude co-ordinates in one call.
+        Returns three aligned arrays (point_idx, paths, rows), one entry per
+        (point, scene) match, sorted by point index and then by the order of
+        the scenes in the shapefile. Points in the overlap of several scenes
+        appear several times; points outside every scene do not appear.
+        """
+        self._load()
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+
+        if shapely_points is not None:
+            pts = shapely_points(lons, lats)
+            point_idx, poly_idx = self.tree.query(pts, predicate="within")
+        else:
+            point_idx, poly_idx = [], []
+            for i in range(len(lats)):
+                pt = shapely.geometry.Point(lons[i], lats[i])
+                for hit in self.tree.query(pt):
+                    # shapely 1.x returns the geometries, 2.x their indices
+                    if not isinstance(hit, (int, np.integer)):
+                        hit = self._shape_index[id(hit)]
+                    if pt.within(self.shapes[hit]):
+                        point_idx.append(i)
+                        poly_idx.append(hit)
+            point_idx = np.array(point_idx, dtype=np.int64)
+            poly_idx = np.array(poly_idx, dtype=np.int64)
+
+        order = np.lexsort((poly_idx, point_idx))
+        point_idx, poly_idx = point_idx[order], poly_idx[order]
+        return point_idx, self.paths[poly_idx], self.rows[poly_idx]
 
 
     def get_wrs(self, lat, lon):
@@ -71,18 +212,11 @@ class ConvertToWRS:
         [{path: 202, row: 26}, {path:186, row=7}]
         """
 
-        # Create a point with the given latitude
-        # and longitude (NB: the arguments are lon, lat
-        # not lat, lon)
-        pt = shapely.geometry.Point(lon, lat)
+        # Query the spatial index instead of testing every polygon
+        _, paths, rows = self.get_wrs_many([lat], [lon])
         res = []
-        # Iterate through every polgon
-        for poly in self.polygons:
-            # If the point is within the polygon then
-            # append the current path/row to the results
-            # list
-            if pt.within(poly[0]):
-                res.append({'path': poly[1], 'row': poly[2]})
+        for path, row in zip(paths, rows):
+            res.append({'path': int(path), 'row': int(row)})
 
         # Return the results list to the user
         return res
@@ -0,0 +1,164 @@
+"""
+SQLite index of the MODIS HDF granules keyed by (product, tile, date), so
+that the hdf files of many tiles are found with one directory scan
+
+folders are expected as <product dir>/YYYY.MM.DD/<granule>.hdf,
+e.g. tq-data04/modis/MOD11A1.006/2016.04.01/MOD11A1.A2016092.h11v04.006.*.hdf
+"""
+
+import os
+import sqlite3
+from os.path import join
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS granules (
+    path TEXT PRIMARY KEY,
+    product TEXT NOT NULL,
+    tile TEXT NOT NULL,
+    acq_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS granules_tile_date ON granules (tile, acq_date);
+CREATE TABLE IF NOT EXISTS date_dirs (
+    dir TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+class ModisCatalog:
+    """Granule index stored in a local SQLite file.
+    Usage:
+        catalog = ModisCatalog(db_path, [MOD_data_path, MYD_data_path])
+        catalog.refresh("20160401", "20161001")
+        hdf_dict = catalog.query(tile_keys, "20160401", "20161001")
+    refresh lists each product directory once and only re-lists the date
+    folders (inside the date range, if given) whose mtime changed; indexed
+    date folders which are no longer on disk are dropped.
+    """
+
+    def __init__(self, db_path, data_paths):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.data_paths = list(data_paths)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def refresh(self, startDate=None, endDate=None):
+        """Update the index from the product directories, for the date
+        folders between startDate and endDate ('YYYYMMDD', inclusive) or
+        for all of them. Returns the number of date folders re-listed.
+        """
+        known = dict(self.conn.execute("SELECT dir, mtime_ns FROM date_dirs"))
+        rescanned = 0
+        with self.conn:
+            for data_path in self.data_paths:
+                listed = set()
+                if os.path.isdir(data_path):
+                    listed = set(os.listdir(data_path))
+                # date folders indexed before and removed since
+                for date_dir in known:
+                    folder = os.path.basename(date_dir)
+                    if os.path.dirname(date_dir) != data_path or folder in listed:
+                        continue
+                    folder_date = folder_to_date(folder)
+                    if startDate is not None and folder_date < startDate:
+                        continue
+                    if endDate is not None and folder_date > endDate:
+                        continue
+                    self._forget(date_dir)
+                for MOD11Folder in listed:
+                    folder_date = folder_to_date(MOD11Folder)
+                    if folder_date is None:
+                        continue
+                    if startDate is not None and folder_date < startDate:
+                        continue
+                    if endDate is not None and folder_date > endDate:
+                        continue
+                    date_dir = join(data_path, MOD11Folder)
+                    mtime_ns = os.stat(date_dir).st_mtime_ns
+                    if known.get(date_dir) == mtime_ns:
+                        continue
+                    self._rescan(date_dir, folder_date, mtime_ns)
+                    rescanned += 1
+        return rescanned
+
+    def query(self, tile_keys, startDate, endDate):
+        """Get the hdf files of every tile between two dates ('YYYYMMDD',
+        inclusive), as {tile: [path, ...]} ordered as the product
+        directories in data_paths, then by date.
+        """
+        hdf_dict = {tile_Key: [] for tile_Key in tile_keys}
+        if startDate > endDate:
+            print("startDate > endDate")
+            return hdf_dict
+        tile_keys = list(hdf_dict.keys())
+        # stay below SQLite's limit on host parameters
+        for i in range(0, len(tile_keys), 500):
+            chunk = tile_keys[i : i + 500]
+            cursor = self.conn.execute(
+                "SELECT tile, path FROM granules WHERE tile IN (%s) "
+                "AND acq_date BETWEEN ? AND ? ORDER BY acq_date, path"
+                % ",".join("?" * len(chunk)),
+                chunk + [startDate, endDate],
+            )
+            for tile_Key, path in cursor:
+                hdf_dict[tile_Key].append(path)
+        for paths in hdf_dict.values():
+            # the query orders by date and path; sort by product directory
+            paths.sort(key=self._product_rank)
+        return hdf_dict
+
+    def _product_rank(self, path):
+        """Position in data_paths of the product directory of a granule."""
+        for rank, data_path in enumerate(self.data_paths):
+            if path.startswith(join(data_path, "")):
+                return rank
+        return len(self.data_paths)
+
+    def _forget(self, date_dir):
+        """Remove a date folder and its granules from the index."""
+        self.conn.execute(
+            "DELETE FROM granules WHERE path LIKE ? ESCAPE '\\'",
+            (_escape_like(join(date_dir, "")) + "%",),
+        )
+        self.conn.execute("DELETE FROM date_dirs WHERE dir = ?", (date_dir,))
+
+    def _rescan(self, date_dir, folder_date, mtime_ns):
+        """Replace the granules of one date folder with its current listing."""
+        self._forget(date_dir)
+        records = []
+        for MOD11_file in os.listdir(date_dir):
+            file_info = MOD11_file.split(".")
+            if file_info[-1] != "hdf" or len(file_info) < 3:
+                continue
+            records.append(
+                (join(date_dir, MOD11_file), file_info[0], file_info[2], folder_date)
+            )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?)", records
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO date_dirs VALUES (?, ?)", (date_dir, mtime_ns)
+        )
+
+
+"""
+convert a 'YYYY.MM.DD' folder name to 'YYYYMMDD', or None if it is not a date
+"""
+
+
+def folder_to_date(folder):
+    try:
+        return datetime.strptime(folder, "%Y.%m.%d").strftime("%Y%m%d")
+    except ValueError:
+        return None
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
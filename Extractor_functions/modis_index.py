@@ -0,0 +1,86 @@
+"""
+functions to map latitude/longitude to the MODIS sinusoidal tile grid
+(h00v00 - h35v17), computed in-process for whole point arrays
+"""
+
+import numpy as np
+
+# Sphere radius of the MODIS sinusoidal projection (m)
+EARTH_RADIUS = 6371007.181
+# Full extent of the projection and size of one of the 36 x 18 tiles (m)
+GRID_XMAX = np.pi * EARTH_RADIUS
+GRID_YMAX = np.pi / 2 * EARTH_RADIUS
+TILE_SIZE = 2 * GRID_XMAX / 36
+H_TILES = 36
+V_TILES = 18
+
+"""
+project latitude/longitude to sinusoidal x/y
+input of the function:
+lats, lons: degrees, numpy arrays
+output of the function:
+x, y: metres, numpy arrays
+"""
+
+
+def latlon_to_sinusoidal(lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return EARTH_RADIUS * lons * np.cos(lats), EARTH_RADIUS * lats
+
+
+"""
+get the MODIS tile of each point
+input of the function:
+lats, lons: degrees, numpy arrays
+output of the function:
+h, v: int arrays of horizontal/vertical tile numbers, -1 where the
+coordinates are not valid latitude/longitude
+"""
+
+
+def latlon_to_tile(lats, lons):
+    h, v, _, _ = latlon_to_tile_pixel(lats, lons)
+    return h, v
+
+
+"""
+get the MODIS tile and the line/sample inside the tile of each point
+input of the function:
+lats, lons: degrees, numpy arrays
+pixels: number of pixels along a tile side (1200 for the 1 km products
+such as MOD11A1, 2400 for 500 m, 4800 for 250 m)
+output of the function:
+h, v, row, col: int arrays, -1 where the coordinates are not valid
+"""
+
+
+def latlon_to_tile_pixel(lats, lons, pixels=1200):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    valid &= (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+
+    x, y = latlon_to_sinusoidal(np.where(valid, lats, 0), np.where(valid, lons, 0))
+    # distance from the upper left corner of the grid, in tiles
+    tx = (x + GRID_XMAX) / TILE_SIZE
+    ty = (GRID_YMAX - y) / TILE_SIZE
+    # points on the right/bottom edge of the grid belong to the last tile
+    h = np.minimum(np.floor(tx), H_TILES - 1)
+    v = np.minimum(np.floor(ty), V_TILES - 1)
+    col = np.minimum(np.floor((tx - h) * pixels), pixels - 1)
+    row = np.minimum(np.floor((ty - v) * pixels), pixels - 1)
+
+    result = []
+    for arr in (h, v, row, col):
+        result.append(np.where(valid, arr, -1).astype(np.int64))
+    return tuple(result)
+
+
+"""
+get the MODIS tile name (e.g. 'h11v05') for tile numbers
+"""
+
+
+def tile_name(h, v):
+    return "h%02dv%02d" % (h, v)
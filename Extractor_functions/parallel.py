@@ -0,0 +1,154 @@
+"""
+function to run per-scene work units in this process or in a process pool
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import instrument
+
+"""
+apply func to every work unit and yield the results in the order of units
+input of the function:
+func: module-level function (it is pickled to the worker processes)
+units: list of argument tuples, one per work unit
+workers: None or 1 to run serially, N to use N worker processes
+cost: function giving the estimated memory (bytes) of a unit, called in this
+process just before the unit is submitted
+budget: memory budget (bytes) of the units running at once; a unit is only
+submitted while the estimates of the running units and its own fit in it
+(a unit over the budget runs alone); None for no limit
+output of the function:
+iterator over func(*unit), in the same order as units, so that merging the
+results is deterministic and identical to serial mode
+when instrument is enabled, the stage counters of each unit are logged under
+its first argument (the scene) and those of worker processes are merged
+"""
+
+
+def map_units(func, units, workers=None, cost=None, budget=None):
+    units = list(units)
+    if not workers or workers <= 1 or len(units) <= 1:
+        for unit in units:
+            instrument.begin_scene()
+            result = func(*unit)
+            instrument.end_scene(unit[0])
+            yield result
+        return
+
+    if cost is not None and budget is not None:
+        for result in _map_budgeted(func, units, workers, cost, budget):
+            yield result
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if not instrument.enabled:
+            for result in executor.map(func, *zip(*units)):
+                yield result
+            return
+
+        recorded = executor.map(
+            instrument.run_recorded, [func] * len(units), *zip(*units)
+        )
+        for unit, (result, stats) in zip(units, recorded):
+            instrument.merge(stats)
+            instrument.write_scene(unit[0], stats)
+            yield result
+
+
+"""
+map_units with a memory budget, in worker processes
+"""
+
+
+def _map_budgeted(func, units, workers, cost, budget):
+    def submit(executor, unit):
+        if instrument.enabled:
+            return executor.submit(instrument.run_recorded, func, *unit)
+        return executor.submit(func, *unit)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for unit, result in _run_ahead(
+            executor, submit, units, 2 * workers, cost, budget
+        ):
+            if instrument.enabled:
+                result, stats = result
+                instrument.merge(stats)
+                instrument.write_scene(unit[0], stats)
+            yield result
+            result = None
+
+
+"""
+load work units ahead of their use in background threads, so that their
+I/O overlaps the processing of the previous units by the caller
+input of the function:
+load: function applied to every unit (GDAL releases the GIL while reading)
+units: list of argument tuples, one per work unit
+depth: number of units loaded ahead, each in its own thread (0: load each
+unit in this thread when it is asked for)
+cost, budget: as for map_units, bound the memory of the units loaded ahead
+output of the function:
+iterator over load(*unit), in the order of units; at most depth units are
+loaded and not taken yet, so loading pauses when the caller falls behind,
+and the units not started yet are dropped if the caller stops iterating
+"""
+
+
+def prefetch(load, units, depth, cost=None, budget=None):
+    units = list(units)
+    if not depth or depth < 1 or len(units) <= 1:
+        for unit in units:
+            yield load(*unit)
+        return
+
+    def submit(executor, unit):
+        return executor.submit(load, *unit)
+
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        for _, result in _run_ahead(executor, submit, units, depth, cost, budget):
+            yield result
+            result = None
+
+
+"""
+submit units to an executor in order and yield (unit, result) in the same
+order, with ahead units submitted beyond the one being taken; with a cost
+function and budget, also only while the estimates of these units fit in
+the budget (a unit over the budget is submitted alone). The estimate of a
+unit is released once its result is taken
+"""
+
+
+def _run_ahead(executor, submit, units, ahead, cost=None, budget=None):
+    running = deque()
+    in_use = 0
+    next_unit = 0
+    # estimate of the next unit, computed once
+    next_cost = None
+    try:
+        while next_unit < len(units) or running:
+            while next_unit < len(units) and len(running) <= ahead:
+                unit_cost = 0
+                if cost is not None and budget is not None:
+                    if next_cost is None:
+                        next_cost = cost(units[next_unit])
+                    unit_cost = next_cost
+                    if running and in_use + unit_cost > budget:
+                        break
+                unit = units[next_unit]
+                running.append((unit, submit(executor, unit), unit_cost))
+                in_use += unit_cost
+                next_unit += 1
+                next_cost = None
+
+            unit, future, unit_cost = running.popleft()
+            result = future.result()
+            # the future holds the result as long as it is referenced
+            future = None
+            in_use -= unit_cost
+            yield unit, result
+            result = None
+    finally:
+        # the caller stopped early: drop the units not started yet
+        for _, future, _ in running:
+            future.cancel()
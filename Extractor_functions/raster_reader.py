@@ -0,0 +1,341 @@
+"""
+functions to read raster values only where sample points fall, instead of
+reading whole scenes with ReadAsArray
+"""
+
+import warnings
+import numpy as np
+from osgeo import gdal
+from concurrent.futures import ThreadPoolExecutor
+import settings
+import instrument
+
+# Fraction of the raster above which a full read is cheaper than windowed reads
+DENSE_FRACTION = 0.5
+
+
+"""
+choose how to read a band for the given pixel coordinates
+input of the function:
+band: GDAL raster band
+px, py: integer image coordinates, numpy arrays
+max_read_mb: largest full or window read (None: settings.MAX_READ_MB, 0: no
+limit); larger reads, e.g. of a DEM mosaic, are done block by block
+output of the function:
+'full', 'window' or 'blocks'
+"""
+
+
+def choose_read_mode(band, px, py, dense_fraction=DENSE_FRACTION, max_read_mb=None):
+    if max_read_mb is None:
+        max_read_mb = settings.MAX_READ_MB
+    xsize, ysize = band.XSize, band.YSize
+    bx, by = band.GetBlockSize()
+    window_area = (int(px.max()) - int(px.min()) + 1) * (
+        int(py.max()) - int(py.min()) + 1
+    )
+    nbx = (xsize + bx - 1) // bx
+    block_ids = np.unique((py // by) * nbx + px // bx)
+    block_area = len(block_ids) * bx * by
+    if min(window_area, block_area) >= dense_fraction * xsize * ysize:
+        mode, area = "full", xsize * ysize
+    elif block_area < window_area:
+        return "blocks"
+    else:
+        mode, area = "window", window_area
+    itemsize = max(gdal.GetDataTypeSize(band.DataType) // 8, 1)
+    if max_read_mb and area * itemsize > max_read_mb * 2 ** 20:
+        return "blocks"
+    return mode
+
+
+"""
+estimate the largest array held while reading a band at the given image
+coordinates with read_points (size None) or read_windows (size k), from the
+band's metadata only: the whole raster, the window of the points or one
+block, as chosen by choose_read_mode; with a window the region read has a
+halo and is also copied to float32
+input of the function:
+band: GDAL raster band
+px, py: integer image coordinates of the points read, numpy arrays
+size: None, or the odd window size
+output of the function:
+estimated bytes
+"""
+
+
+def read_peak_bytes(band, px, py, size=None, dense_fraction=DENSE_FRACTION):
+    px = np.asarray(px, dtype=np.int64)
+    py = np.asarray(py, dtype=np.int64)
+    if len(px) == 0:
+        return 0
+    itemsize = max(gdal.GetDataTypeSize(band.DataType) // 8, 1)
+    mode = choose_read_mode(band, px, py, dense_fraction)
+    if mode == "full":
+        width, height = band.XSize, band.YSize
+    elif mode == "window":
+        width = int(px.max()) - int(px.min()) + 1
+        height = int(py.max()) - int(py.min()) + 1
+    else:
+        width, height = band.GetBlockSize()
+    if size is None:
+        return width * height * itemsize
+    halo = 2 * (size // 2)
+    return (width + halo) * (height + halo) * (itemsize + 4)
+
+
+"""
+read the pixel values of a band at the given image coordinates
+input of the function:
+band: GDAL raster band
+px, py: integer image coordinates, numpy arrays
+valid: boolean mask of the points to read (points outside it get 0)
+dense_fraction: fall back to a full read when the window or the touched
+blocks cover more than this fraction of the raster
+output of the function:
+numpy array of pixel values, one per point, in the band's data type
+"""
+
+
+def read_points(band, px, py, valid=None, dense_fraction=DENSE_FRACTION):
+    px = np.asarray(px, dtype=np.int64)
+    py = np.asarray(py, dtype=np.int64)
+    if valid is None:
+        valid = np.ones(px.shape, dtype=bool)
+    idx = np.flatnonzero(valid)
+    if len(idx) == 0:
+        return np.zeros(px.shape, dtype=band.ReadAsArray(0, 0, 1, 1).dtype)
+
+    vx, vy = px[idx], py[idx]
+    mode = choose_read_mode(band, vx, vy, dense_fraction)
+
+    with instrument.stage("read_" + mode) as stage:
+        if mode == "full":
+            data = band.ReadAsArray()
+            stage.add_bytes(data.nbytes)
+            sampled = data[vy, vx]
+        elif mode == "window":
+            x0, y0 = int(vx.min()), int(vy.min())
+            data = band.ReadAsArray(
+                x0, y0, int(vx.max()) - x0 + 1, int(vy.max()) - y0 + 1
+            )
+            stage.add_bytes(data.nbytes)
+            sampled = data[vy - y0, vx - x0]
+        else:
+            sampled = _read_blocks(band, vx, vy, stage)
+
+    values = np.zeros(px.shape, dtype=sampled.dtype)
+    values[idx] = sampled
+    return values
+
+
+"""
+read only the raster blocks which contain points and sample them
+"""
+
+
+def _read_blocks(band, px, py, stage):
+    xsize, ysize = band.XSize, band.YSize
+    bx, by = band.GetBlockSize()
+    nbx = (xsize + bx - 1) // bx
+
+    keys = (py // by) * nbx + px // bx
+    order = np.argsort(keys, kind="stable")
+    block_ids, starts = np.unique(keys[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    sampled = None
+    for block_id, start, end in zip(block_ids, starts, ends):
+        sel = order[start:end]
+        xoff = int(block_id % nbx) * bx
+        yoff = int(block_id // nbx) * by
+        data = band.ReadAsArray(
+            xoff, yoff, min(bx, xsize - xoff), min(by, ysize - yoff)
+        )
+        stage.add_bytes(data.nbytes)
+        if sampled is None:
+            sampled = np.zeros(len(px), dtype=data.dtype)
+        sampled[sel] = data[py[sel] - yoff, px[sel] - xoff]
+    return sampled
+
+
+"""
+read the size x size pixel patches centred on the given image coordinates
+input of the function:
+band: GDAL raster band
+px, py: integer image coordinates of the centres, numpy arrays
+size: odd window size (3 for 3x3, 5 for 5x5...)
+valid: boolean mask of the points to read (patches outside it are all NaN)
+dense_fraction: as for read_points
+output of the function:
+float32 array [points, size, size]; pixels outside the raster are NaN
+"""
+
+
+def read_windows(band, px, py, size, valid=None, dense_fraction=DENSE_FRACTION):
+    if size < 1 or size % 2 == 0:
+        raise ValueError("window size must be odd: " + str(size))
+    px = np.asarray(px, dtype=np.int64)
+    py = np.asarray(py, dtype=np.int64)
+    if valid is None:
+        valid = np.ones(px.shape, dtype=bool)
+    patches = np.full((len(px), size, size), np.nan, dtype=np.float32)
+    idx = np.flatnonzero(valid)
+    if len(idx) == 0:
+        return patches
+
+    vx, vy = px[idx], py[idx]
+    mode = choose_read_mode(band, vx, vy, dense_fraction)
+    with instrument.stage("read_windows_" + mode) as stage:
+        if mode == "full":
+            patches[idx] = _gather_windows(
+                band, vx, vy, size, 0, 0, band.XSize, band.YSize, stage
+            )
+        elif mode == "window":
+            patches[idx] = _gather_windows(
+                band,
+                vx,
+                vy,
+                size,
+                int(vx.min()),
+                int(vy.min()),
+                int(vx.max()) + 1,
+                int(vy.max()) + 1,
+                stage,
+            )
+        else:
+            # one read per block holding centres, with a halo for the edges
+            bx, by = band.GetBlockSize()
+            nbx = (band.XSize + bx - 1) // bx
+            keys = (vy // by) * nbx + vx // bx
+            order = np.argsort(keys, kind="stable")
+            block_ids, starts = np.unique(keys[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            for block_id, start, end in zip(block_ids, starts, ends):
+                sel = order[start:end]
+                xoff = int(block_id % nbx) * bx
+                yoff = int(block_id // nbx) * by
+                patches[idx[sel]] = _gather_windows(
+                    band,
+                    vx[sel],
+                    vy[sel],
+                    size,
+                    xoff,
+                    yoff,
+                    min(xoff + bx, band.XSize),
+                    min(yoff + by, band.YSize),
+                    stage,
+                )
+    return patches
+
+
+"""
+read the region of centres [x0, x1) x [y0, y1) with a halo of size // 2
+pixels (NaN beyond the raster) and take the patches of the points from a
+strided view of it, without copying the region once per point
+"""
+
+
+def _gather_windows(band, px, py, size, x0, y0, x1, y1, stage):
+    r = size // 2
+    rx0, ry0 = max(x0 - r, 0), max(y0 - r, 0)
+    rx1, ry1 = min(x1 + r, band.XSize), min(y1 + r, band.YSize)
+    data = band.ReadAsArray(rx0, ry0, rx1 - rx0, ry1 - ry0)
+    stage.add_bytes(data.nbytes)
+
+    padded = np.full((y1 - y0 + 2 * r, x1 - x0 + 2 * r), np.nan, dtype=np.float32)
+    padded[
+        ry0 - (y0 - r) : ry1 - (y0 - r), rx0 - (x0 - r) : rx1 - (x0 - r)
+    ] = data
+    # windows[i, j] is the patch centred on pixel (y0 + i, x0 + j)
+    s0, s1 = padded.strides
+    windows = np.lib.stride_tricks.as_strided(
+        padded,
+        shape=(y1 - y0, x1 - x0, size, size),
+        strides=(s0, s1, s0, s1),
+        writeable=False,
+    )
+    return windows[py - y0, px - x0]
+
+
+"""
+statistics of pixel patches, ignoring NaN (masked) pixels
+input of the function:
+patches: float array [points, size, size], NaN for masked pixels
+stats: names among "mean", "median", "std", "min", "max", "count"
+output of the function:
+{stat: float array [points]}; NaN for points without any unmasked pixel
+(count is 0 for them)
+"""
+
+WINDOW_STATS = {
+    "mean": np.nanmean,
+    "median": np.nanmedian,
+    "std": np.nanstd,
+    "min": np.nanmin,
+    "max": np.nanmax,
+}
+
+
+def window_stats(patches, stats=("mean", "median", "std")):
+    # unmasked pixels per patch, the "count" statistic
+    flat = patches.reshape(len(patches), int(np.prod(patches.shape[1:])))
+    count = np.count_nonzero(~np.isnan(flat), axis=1)
+    result = {}
+    with warnings.catch_warnings():
+        # all-NaN patches give NaN, which is what we want
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for stat in stats:
+            if stat == "count":
+                result[stat] = count.astype(np.float64)
+            elif len(flat) == 0:
+                result[stat] = np.zeros(0)
+            else:
+                result[stat] = WINDOW_STATS[stat](flat, axis=1).astype(np.float64)
+    return result
+
+
+"""
+open several single-band rasters and read each at the given image coordinates
+input of the function:
+paths: {band_type: raster path or GDAL subdataset name}
+px, py, valid: as for read_points; all rasters must share the grid
+threads: number of bands read at the same time (None: settings.BAND_READ_THREADS);
+GDAL releases the GIL while reading and decoding, so JP2/HDF bands decode
+concurrently. Each thread opens its own dataset, as GDAL datasets must not
+be shared between threads
+size: read size x size patches with read_windows instead of single pixels
+output of the function:
+{band_type: numpy array of pixel values (or patches)}; bands which cannot
+be opened or read are reported and left out
+"""
+
+
+def read_bands(paths, px, py, valid=None, threads=None, size=None):
+    if threads is None:
+        threads = settings.BAND_READ_THREADS
+
+    def read_band(band_type):
+        try:
+            with instrument.stage("gdal_open"):
+                bandfile = gdal.Open(paths[band_type])
+            if size is not None:
+                return read_windows(bandfile.GetRasterBand(1), px, py, size, valid)
+            return read_points(bandfile.GetRasterBand(1), px, py, valid)
+        except Exception as e:
+            print(e)
+            print("Unable to open " + band_type + " file\n")
+            return None
+
+    band_types = list(paths.keys())
+    if threads and threads > 1 and len(band_types) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            values = list(executor.map(read_band, band_types))
+    else:
+        values = [read_band(band_type) for band_type in band_types]
+
+    return {
+        band_type: value
+        for band_type, value in zip(band_types, values)
+        if value is not None
+    }
@@ -0,0 +1,409 @@
+"""
+columnar result format: a points x dates x bands float32 array (NaN where a
+point has no value on a date), with the date and point index arrays, as an
+alternative to the nested dicts of (date, value) lists
+"""
+
+import numpy as np
+from collections import namedtuple
+import geo_functions
+
+
+class ResultCube:
+    """Extraction results of many points over many dates.
+    Attributes:
+    values: float32 array [points, dates, bands]; NaN for missing (cloudy,
+    outside the scene, no file), -1 for invalid values as in the dict format
+    dates: '<U8' array of 'YYYYMMDD' dates, sorted
+    point_ids: int array of point ids (row index of the points)
+    lats, lons: float64 arrays of the point coordinates
+    bands: list of band names (or products, for MODIS)
+    decimals: number of decimals of the values in the dict format
+    empty_records: whether the dict format of the sensor keeps points without
+    any value (Sensor.empty_records)
+    overlaps: (rows, date indices, band indices, values) arrays of the values
+    of overlapping scenes of a date (WRS-2 rows, MGRS tiles) which are not in
+    values, as a point holds one value per date and band (see CubeBuilder);
+    to_legacy lists them too, as the dict format does
+    """
+
+    def __init__(
+        self,
+        values,
+        dates,
+        point_ids,
+        lats,
+        lons,
+        bands,
+        decimals,
+        empty_records=True,
+        overlaps=None,
+    ):
+        self.values = values
+        self.dates = dates
+        self.point_ids = point_ids
+        self.lats = lats
+        self.lons = lons
+        self.bands = list(bands)
+        self.decimals = decimals
+        self.empty_records = empty_records
+        if overlaps is None:
+            empty = np.zeros(0, dtype=np.int64)
+            overlaps = (empty, empty, empty, np.zeros(0, dtype=np.float32))
+        self.overlaps = overlaps
+
+    def to_legacy(self, keep_empty=None):
+        """Convert to the dict format of the extractors:
+        {(lat_str, lon_str): {band: [(date, value), ...]}}
+        keep_empty: keep points without any value (with empty lists); None
+        to do as the dict format of the sensor (empty_records)
+        """
+        if keep_empty is None:
+            keep_empty = self.empty_records
+        # values of overlapping scenes, by row
+        extra = {}
+        for p, d, b, value in zip(*(np.asarray(a).tolist() for a in self.overlaps)):
+            extra.setdefault(p, []).append((d, b, value))
+        res = {}
+        for p in range(len(self.point_ids)):
+            point_values = self.values[p]
+            has_value = ~np.isnan(point_values)
+            if not keep_empty and not has_value.any():
+                continue
+            record = {}
+            for b, band_type in enumerate(self.bands):
+                record[band_type] = [
+                    (
+                        str(self.dates[d]),
+                        round(float(point_values[d, b]), self.decimals),
+                    )
+                    for d in np.flatnonzero(has_value[:, b])
+                ]
+            if p in extra:
+                for d, b, value in extra[p]:
+                    record[self.bands[b]].append(
+                        (str(self.dates[d]), round(value, self.decimals))
+                    )
+                for band_values in record.values():
+                    band_values.sort()
+            res[geo_functions.get_latlon_key(self.lats[p], self.lons[p])] = record
+        return res
+
+
+class PointIndex:
+    """Stable integer ids of (lat, lon) points, with their coordinates in
+    contiguous float64 arrays; a point listed in several tiles gets a single
+    id. The "{:.6f}" string keys of the dict format are only built, once per
+    point, when legacy output asks for them (key(), keys).
+    """
+
+    def __init__(self):
+        self._lats = np.empty(0, dtype=np.float64)
+        self._lons = np.empty(0, dtype=np.float64)
+        self._count = 0
+        self._keys = []
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def lats(self):
+        return self._lats[: self._count]
+
+    @property
+    def lons(self):
+        return self._lons[: self._count]
+
+    def add_points(self, locations, lons=None):
+        """Register points and return their ids as an int array; new distinct
+        points (such as those of TiledPoints in a new index) get the ids
+        arange(len(self), len(self) + n), points registered already their id.
+        locations: [(lat, lon), ...], or the lats array with lons given
+        """
+        lats, lons = as_point_arrays(locations, lons)
+        count, n = self._count, len(lats)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        # match the points against the registered ones and each other
+        pairs = np.column_stack(
+            (np.concatenate((self.lats, lats)), np.concatenate((self.lons, lons)))
+        )
+        _, first, inverse = np.unique(
+            pairs, axis=0, return_index=True, return_inverse=True
+        )
+        first = first[inverse.ravel()[count:]]
+        is_new = first >= count
+        # the new points, numbered by first appearance
+        new_first, new_rank = np.unique(first[is_new], return_inverse=True)
+        ids = first.astype(np.int64)
+        ids[is_new] = count + new_rank.ravel()
+        if len(new_first):
+            self._append(lats[new_first - count], lons[new_first - count])
+        return ids
+
+    def _append(self, lats, lons):
+        count = self._count + len(lats)
+        if count > len(self._lats):
+            # grow the arrays geometrically
+            size = max(count, 2 * len(self._lats))
+            self._lats = np.resize(self._lats, size)
+            self._lons = np.resize(self._lons, size)
+        self._lats[self._count : count] = lats
+        self._lons[self._count : count] = lons
+        self._count = count
+
+    def key(self, point_id):
+        """Get the (lat_str, lon_str) key of a point in the dict format."""
+        if point_id >= len(self._keys):
+            self._keys.extend(
+                geo_functions.get_latlon_key(lat, lon)
+                for lat, lon in zip(
+                    self._lats[len(self._keys) : point_id + 1].tolist(),
+                    self._lons[len(self._keys) : point_id + 1].tolist(),
+                )
+            )
+        return self._keys[point_id]
+
+    @property
+    def keys(self):
+        if self._count:
+            self.key(self._count - 1)
+        return self._keys[: self._count]
+
+
+"""
+get points as contiguous float64 arrays
+input of the function:
+locations: [(lat, lon), ...] or an [n, 2] array, or the lats array with
+lons given
+output of the function:
+(lats, lons)
+"""
+
+
+def as_point_arrays(locations, lons=None):
+    if lons is not None:
+        return (
+            np.ascontiguousarray(locations, dtype=np.float64).ravel(),
+            np.ascontiguousarray(lons, dtype=np.float64).ravel(),
+        )
+    points = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    return np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1])
+
+
+"""
+points of a run split in tiles: contiguous lat/lon float64 arrays and the
+members of each tile as index arrays into them
+lats, lons: float64 arrays of the points
+tiles: {tile: int array of the indices of the tile's points}
+"""
+TiledPoints = namedtuple("TiledPoints", ["lats", "lons", "tiles"])
+
+
+"""
+convert {tile: [(lat, lon), ...]} to TiledPoints; a point listed in several
+tiles is stored once, in the order the points first appear
+"""
+
+
+def tiled_points(tile_dict):
+    arrays = [as_point_arrays(locations) for locations in tile_dict.values()]
+    counts = [len(tile_lats) for tile_lats, _ in arrays]
+    if sum(counts) == 0:
+        return TiledPoints(
+            np.empty(0),
+            np.empty(0),
+            {tile_key: np.empty(0, dtype=np.int64) for tile_key in tile_dict},
+        )
+    pairs = np.column_stack(
+        (
+            np.concatenate([tile_lats for tile_lats, _ in arrays]),
+            np.concatenate([tile_lons for _, tile_lons in arrays]),
+        )
+    )
+    _, first, inverse = np.unique(
+        pairs, axis=0, return_index=True, return_inverse=True
+    )
+    # number the distinct points by their first appearance
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    members = rank[inverse.ravel()]
+    points = pairs[first[order]]
+    tiles = dict(zip(tile_dict.keys(), np.split(members, np.cumsum(counts)[:-1])))
+    return TiledPoints(
+        np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1]), tiles
+    )
+
+
+"""
+get TiledPoints from the (point, tile) matches of a tile assignment
+input of the function:
+lats, lons: the points, as for as_point_arrays
+point_idx: index of the point of each match, int array
+tile_keys: tile of each match, array of ints or strings (one entry per
+match, e.g. the path * 1000 + row codes of ConvertToWRS.get_wrs_many)
+output of the function:
+TiledPoints of the input points, the tiles in the order they first appear
+in the matches and their members in the order of the matches
+"""
+
+
+def tiles_of_matches(lats, lons, point_idx, tile_keys):
+    lats, lons = as_point_arrays(lats, lons)
+    point_idx = np.asarray(point_idx, dtype=np.int64).ravel()
+    if len(point_idx) == 0:
+        return TiledPoints(lats, lons, {})
+    keys, first, inverse = np.unique(
+        np.asarray(tile_keys).ravel(), return_index=True, return_inverse=True
+    )
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    members = np.split(
+        point_idx[order], np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+    )
+    tiles = {keys[k].item(): members[k] for k in np.argsort(first, kind="stable")}
+    return TiledPoints(lats, lons, tiles)
+
+
+"""
+convert TiledPoints to the legacy {tile: [(lat, lon), ...]} form
+"""
+
+
+def tile_lists(tiled):
+    return {
+        tile_key: list(zip(tiled.lats[members].tolist(), tiled.lons[members].tolist()))
+        for tile_key, members in tiled.tiles.items()
+    }
+
+
+"""
+results of one scene, as yielded by the iter_* extractors
+scene_id: scene folder or file name
+date: 'YYYYMMDD'
+bands: band names (or the product, for MODIS) of the columns of values
+point_ids: ids of the sampled points in the extractor's PointIndex
+lats, lons: coordinates of the sampled points
+values: float32 array [len(point_ids), len(bands)], -1 for invalid values
+"""
+SceneBatch = namedtuple(
+    "SceneBatch", ["scene_id", "date", "bands", "point_ids", "lats", "lons", "values"]
+)
+
+
+"""
+add the values of a SceneBatch to records {point id: {band: [(date, value),
+...]}}; records of points not in records yet are created with bands
+"""
+
+
+def merge_records(records, batch, bands, decimals):
+    values = np.asarray(batch.values).tolist()
+    for point_id, point_values in zip(batch.point_ids.tolist(), values):
+        record = records.get(point_id)
+        if record is None:
+            record = records[point_id] = {band_type: [] for band_type in bands}
+        for band_type, value in zip(batch.bands, point_values):
+            record[band_type].append((batch.date, round(value, decimals)))
+
+
+"""
+convert records by point id to the dict format
+{(lat_str, lon_str): {band: [(date, value), ...]}}, formatting the key of
+each point once; points with the same key share a record
+"""
+
+
+def legacy_records(records, points):
+    res = {}
+    for point_id, record in records.items():
+        res_key = points.key(point_id)
+        if res_key in res:
+            for band_type, band_values in record.items():
+                res[res_key].setdefault(band_type, []).extend(band_values)
+        else:
+            res[res_key] = record
+    return res
+
+
+class CubeBuilder:
+    """Collect per-scene results and assemble a ResultCube.
+    Usage:
+        builder = CubeBuilder(bands, decimals, points)
+        builder.add_batch(batch)   # once per scene
+        cube = builder.build()
+    points is the PointIndex the ids refer to; every point in it gets a row.
+    If two scenes give a value for the same point, date and band (overlapping
+    WRS-2 rows or MGRS tiles), values holds a valid value over -1, and of two
+    valid values the one added last; the other one goes to the overlaps of
+    the cube, so that to_legacy gives the dict format exactly.
+    empty_records: as for ResultCube
+    """
+
+    def __init__(self, bands, decimals, points=None, empty_records=True):
+        self.bands = list(bands)
+        self.decimals = decimals
+        self.points = points if points is not None else PointIndex()
+        self.empty_records = empty_records
+        self._records = []
+
+    def add_points(self, locations):
+        return self.points.add_points(locations)
+
+    def add(self, file_date, ids, values, bands=None):
+        """Add the values of one scene.
+        ids: point ids, values: array [len(ids), len(bands)]
+        bands: the bands of the columns of values (None: all bands)
+        """
+        if bands is None:
+            bands = self.bands
+        columns = [self.bands.index(band_type) for band_type in bands]
+        values = np.asarray(values, dtype=np.float32).reshape(len(ids), len(columns))
+        self._records.append((file_date, np.asarray(ids), columns, values))
+
+    def add_batch(self, batch):
+        self.add(batch.date, batch.point_ids, batch.values, batch.bands)
+
+    def build(self):
+        dates = np.array(
+            sorted(set(record[0] for record in self._records)), dtype="<U8"
+        )
+        date_index = {file_date: d for d, file_date in enumerate(dates)}
+        values = np.full(
+            (len(self.points), len(dates), len(self.bands)), np.nan, dtype=np.float32
+        )
+        overlaps = []
+        for file_date, ids, columns, record_values in self._records:
+            d = date_index[file_date]
+            for c, column in enumerate(columns):
+                new = record_values[:, c]
+                old = values[ids, d, column]
+                keep_new = np.isnan(old) | (new != -1) & ~np.isnan(new)
+                values[ids, d, column] = np.where(keep_new, new, old)
+                clash = ~np.isnan(old)
+                if clash.any():
+                    rows = ids[clash]
+                    overlaps.append(
+                        (
+                            rows,
+                            np.full(len(rows), d, dtype=np.int64),
+                            np.full(len(rows), column, dtype=np.int64),
+                            np.where(keep_new, old, new)[clash],
+                        )
+                    )
+        if overlaps:
+            overlaps = tuple(np.concatenate(parts) for parts in zip(*overlaps))
+        else:
+            overlaps = None
+        return ResultCube(
+            values,
+            dates,
+            np.arange(len(self.points), dtype=np.int64),
+            np.array(self.points.lats, dtype=np.float64),
+            np.array(self.points.lons, dtype=np.float64),
+            self.bands,
+            self.decimals,
+            self.empty_records,
+            overlaps,
+        )
@@ -0,0 +1,144 @@
+"""
+persistent cache of per-scene extraction results in a local SQLite file, so
+that rerunning the same points only reads the scenes that are new or changed
+
+an entry is keyed by extractor, scene id and a hash of the scene's points,
+and is valid for one extractor version and one (mtime, size) stamp of the
+scene files; values are stored as raw int32 / float32 arrays
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    extractor TEXT NOT NULL,
+    scene_id TEXT NOT NULL,
+    points_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    file_date TEXT NOT NULL,
+    bands TEXT NOT NULL,
+    idx BLOB NOT NULL,
+    vals BLOB NOT NULL,
+    PRIMARY KEY (extractor, scene_id, points_hash)
+);
+"""
+
+
+"""
+hash of the coordinates of the points of a work unit
+input of the function:
+lats, lons: float64 numpy arrays
+output of the function:
+hex string, identical for the same points in the same order
+"""
+
+
+def points_hash(lats, lons):
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(lats, dtype=np.float64).tobytes())
+    sha.update(np.ascontiguousarray(lons, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+"""
+stamp of the files of a scene, to detect new or rewritten data
+input of the function:
+paths: scene files or folders (folders are walked)
+output of the function:
+(latest mtime_ns, total size in bytes); (0, 0) if nothing exists
+"""
+
+
+def scene_stamp(*paths):
+    mtime_ns, size = 0, 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, file_names in os.walk(path):
+                for file_name in file_names:
+                    try:
+                        st = os.stat(os.path.join(root, file_name))
+                    except OSError:
+                        continue
+                    mtime_ns = max(mtime_ns, st.st_mtime_ns)
+                    size += st.st_size
+        elif os.path.exists(path):
+            st = os.stat(path)
+            mtime_ns = max(mtime_ns, st.st_mtime_ns)
+            size += st.st_size
+    return mtime_ns, size
+
+
+class SceneCache:
+    """Cached results of one extractor.
+    Usage:
+        cache = SceneCache(db_path, "landsat_sr", "1")
+        key = points_hash(lats, lons)
+        stamp = scene_stamp(folder_path)
+        cached = cache.get(folder_path, key, stamp)
+        if cached is None:
+            ...
+            cache.put(folder_path, key, stamp, file_date, bands, idx, values)
+        cache.close()
+    Entries of another version or stamp are misses and are replaced by put.
+    """
+
+    def __init__(self, db_path, extractor, version):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.extractor = extractor
+        self.version = str(version)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, scene_id, points_key, stamp):
+        """Get (file_date, bands, idx, values) of a scene, or None if it is
+        not cached for this version, points and stamp.
+        idx: int array of the indices of the sampled points in the unit,
+        values: float32 array [len(idx), len(bands)]
+        """
+        row = self.conn.execute(
+            "SELECT version, mtime_ns, size, file_date, bands, idx, vals "
+            "FROM results WHERE extractor = ? AND scene_id = ? AND points_hash = ?",
+            (self.extractor, scene_id, points_key),
+        ).fetchone()
+        if row is None:
+            return None
+        version, mtime_ns, size, file_date, bands, idx, vals = row
+        if version != self.version or (mtime_ns, size) != tuple(stamp):
+            return None
+        bands = json.loads(bands)
+        idx = np.frombuffer(idx, dtype=np.int32).astype(np.int64)
+        values = np.frombuffer(vals, dtype=np.float32).reshape(len(idx), len(bands))
+        return file_date, bands, idx, values
+
+    def put(self, scene_id, points_key, stamp, file_date, bands, idx, values):
+        """Store the results of a scene, replacing any older entry."""
+        idx = np.ascontiguousarray(idx, dtype=np.int32)
+        values = np.ascontiguousarray(values, dtype=np.float32)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.extractor,
+                    scene_id,
+                    points_key,
+                    self.version,
+                    int(stamp[0]),
+                    int(stamp[1]),
+                    file_date,
+                    json.dumps(list(bands)),
+                    sqlite3.Binary(idx.tobytes()),
+                    sqlite3.Binary(values.tobytes()),
+                ),
+            )
@@ -0,0 +1,96 @@
+"""
+catalog of the processed Sentinel-2 products listed in total_list.json,
+indexed by MGRS tile and date
+
+product folders are expected as .../<zone>/<band>/<square>/<year>/<month>/<day>/...,
+e.g. .../SAFE_sentinel/15/T/VG/2017/5/1/S2A_MSIL2A_....SAFE
+"""
+
+import re
+import json
+import glob
+import bisect
+from os.path import join
+
+FOLDER_PATTERN = re.compile(
+    r"/(\d{1,2})/([A-Z])/([A-Z]{2})/(\d{4})/(\d{1,2})/(\d{1,2})(?:/|$)"
+)
+
+
+class SentinelCatalog:
+    """Product catalog loaded from the JSON list on first use.
+    Usage:
+        catalog = SentinelCatalog(file_json, home_dir)
+        tar_list = catalog.get_file_list(tiles, "20170501", "20170527")
+    A lookup is a dict access on the tile plus a bisect on its sorted dates;
+    the IMG_DATA folder of each product is resolved once and remembered.
+    """
+
+    def __init__(self, file_json, home_dir=""):
+        self.file_json = file_json
+        self.home_dir = home_dir
+        self._tiles = None
+        self._img_data = {}
+
+    def _load(self):
+        """Parse the JSON list into {tile: (sorted dates, folders)}."""
+        if self._tiles is not None:
+            return
+        with open(self.file_json, "r") as fp:
+            all_file_folds = json.load(fp)
+
+        products = {}
+        for tmp in all_file_folds:
+            match = FOLDER_PATTERN.search(tmp)
+            if match is None:
+                continue
+            zone, band, square, year, month, day = match.groups()[:6]
+            file_date = year + "%02d" % int(month) + "%02d" % int(day)
+            products.setdefault(zone + band + square, []).append(
+                (file_date, self.home_dir + tmp)
+            )
+
+        self._tiles = {}
+        for tile, records in products.items():
+            records.sort()
+            self._tiles[tile] = (
+                [record[0] for record in records],
+                [record[1] for record in records],
+            )
+
+    def get_products(self, tile, start_time, end_time):
+        """Get (date, product folder) of a tile between two dates
+        ('YYYYMMDD', inclusive), sorted by date.
+        """
+        self._load()
+        if tile not in self._tiles:
+            return []
+        dates, folders = self._tiles[tile]
+        lo = bisect.bisect_left(dates, start_time)
+        hi = bisect.bisect_right(dates, end_time)
+        return list(zip(dates[lo:hi], folders[lo:hi]))
+
+    def get_img_data(self, file_fold):
+        """Get the GRANULE/*/IMG_DATA folder of a product, or None."""
+        if file_fold not in self._img_data:
+            found = glob.glob(join(file_fold, "GRANULE", "*", "IMG_DATA"))
+            self._img_data[file_fold] = found[0] if found else None
+        return self._img_data[file_fold]
+
+    def get_file_list(self, tiles, start_time, end_time):
+        """Get the IMG_DATA folders per tile between two dates, in the
+        format of sentinel_extractor.get_file_list.
+        """
+        tar_list = {}
+        for tile in tiles:
+            if tile in tar_list:
+                continue
+            file_list = []
+            for _, file_fold in self.get_products(tile, start_time, end_time):
+                img_data = self.get_img_data(file_fold)
+                if img_data is None:
+                    print("No IMG_DATA folder in: " + file_fold + "\n")
+                    continue
+                file_list.append(img_data)
+            tar_list[tile] = file_list
+        return tar_list
@@ -1,5 +1,12 @@
 MOD11A1_PATH = "tq-data04/modis/MOD11A1.006"
 MYD11A1_PATH = "tq-data04/modis/MYD11A1.006"
+# SQLite index of the MODIS granules (relative to home, "" to list folders)
+MODIS_CATALOG_PATH = ".extractor_cache/modis_catalog.sqlite"
+# Checkpoints of interrupted extraction runs (relative to home)
+CHECKPOINT_PATH = ".extractor_cache/checkpoints"
+# SQLite cache of per-scene extraction results, used by runs with use_cache=True
+# (relative to home, "" to disable); it is never pruned, delete it to reclaim space
+RESULT_CACHE_PATH = ".extractor_cache/scene_results.sqlite"
 
 LANDSAT_SR_PATH = [
     "tq-data01/landsat_sr",
@@ -7,6 +14,8 @@ LANDSAT_SR_PATH = [
     "tq-data03/landsat_sr",
     "tq-data04/landsat_sr",
 ]
+# SQLite catalog of the Landsat SR scenes (relative to home, "" to use glob)
+LANDSAT_CATALOG_PATH = ".extractor_cache/landsat_sr_catalog.sqlite"
 
 world_DEM_PATH = "tq-data02/m4/SRTMGL1.003/2000.02.11"
 DEM_original_PATH = "tq-data04/USA_DEM_ORIGINAL"
@@ -16,6 +25,37 @@ WGS_SLOPE_PATH = "tq-data04/WGS_USA_DEM/SLOPE"
 UTM_DEM_PATH = "tq-data04/UTM_USA_DEM/DEM"
 UTM_ASPECT_PATH = "tq-data04/UTM_USA_DEM/ASPECT"
 UTM_SLOPE_PATH = "tq-data04/UTM_USA_DEM/SLOPE"
+# Terrain source: "wgs", "utm", "srtm" or "original" (slope/aspect computed)
+TERRAIN_SOURCE = "wgs"
+# Tile indexes and VRT mosaics of the DEM folders (relative to home)
+TERRAIN_CACHE_PATH = ".extractor_cache/terrain"
+
+# Number of bands of a scene read concurrently (1: one after another)
+BAND_READ_THREADS = 4
+# Largest array (MB) read at once from a raster when the points are dense;
+# larger rasters, e.g. DEM mosaics, are read block by block (0: no limit)
+MAX_READ_MB = 1024
+# Memory budget (MB) of the scenes extracted at once by worker processes,
+# estimated from raster size, data type and bands (0: no limit)
+MEMORY_BUDGET_MB = 4096
+# Number of scenes loaded ahead in background threads while the current one
+# is sampled, in serial runs (0: load each scene when it is sampled)
+PREFETCH_DEPTH = 2
+# Sentinel-2 bands: "20m" for the six R20m bands, "10m" for B02/B03/B04 from
+# R10m with B8A/B11/B12 from R20m, plus the 10m B08 as the extra band NIR_B08
+SENTINEL_RESOLUTION = "20m"
+
+# Landsat pixel_qa values accepted as clear sky (Collection 1 bit flags):
+# pixels flagged clear / water / snow are kept if the flag is enabled here,
+# fill, cloud shadow and cloud pixels are always rejected, and the cloud
+# confidence (0 none, 1 low, 2 medium, 3 high) must not exceed the maximum
+LANDSAT_QA_CLEAR = True
+LANDSAT_QA_WATER = False
+LANDSAT_QA_SNOW = False
+LANDSAT_QA_MAX_CLOUD_CONFIDENCE = 2
+
+# Statistics of the k x k windows around the points (window_size option)
+NEIGHBORHOOD_STATS = ["mean", "median", "std"]
 
 band_key_list = ["B_band", "G_band", "R_band", "NIR_band", "SWIR1", "SWIR2"]
 
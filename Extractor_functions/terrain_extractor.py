@@ -0,0 +1,453 @@
+"""
+function to extract terrain (DEM, slope, aspect) at sample points from the
+DEM tiles of settings.py
+
+a bounding-box index of the tiles of each folder assigns the points to
+tiles, and a VRT mosaic of the folder lets windows cross tile edges; both
+are cached under settings.TERRAIN_CACHE_PATH and rebuilt when the tiles
+change. Sources without slope/aspect rasters (SRTM, the original DEM) get
+them computed from the 3 x 3 DEM window around each point
+"""
+
+import os
+import glob
+import json
+import hashlib
+import pprint
+from os.path import join
+import numpy as np
+from osgeo import gdal, osr
+import settings
+import geo_functions
+import raster_reader
+import instrument
+
+printer = pprint.PrettyPrinter(indent=3)
+
+# layers of each source (relative to home); missing slope/aspect are computed
+TERRAIN_SOURCES = {
+    "wgs": {
+        "DEM": settings.WGS_DEM_PATH,
+        "SLOPE": settings.WGS_SLOPE_PATH,
+        "ASPECT": settings.WGS_ASPECT_PATH,
+    },
+    "utm": {
+        "DEM": settings.UTM_DEM_PATH,
+        "SLOPE": settings.UTM_SLOPE_PATH,
+        "ASPECT": settings.UTM_ASPECT_PATH,
+    },
+    "srtm": {"DEM": settings.world_DEM_PATH},
+    "original": {"DEM": settings.DEM_original_PATH},
+}
+TERRAIN_LAYERS = ["DEM", "SLOPE", "ASPECT"]
+TILE_PATTERNS = ["*.tif", "*.TIF", "*.img", "*.hgt", "*.hgt.zip", "*.adf"]
+
+# metres per degree of latitude, and of longitude at the equator
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+
+
+"""
+get the GDAL names of the raster tiles of a folder; zipped SRTM tiles are
+read through /vsizip/
+"""
+
+
+def list_tiles(folder):
+    paths = set()
+    for pattern in TILE_PATTERNS:
+        paths.update(glob.glob(join(folder, "**", pattern), recursive=True))
+    tiles = []
+    for path in sorted(paths):
+        if path.endswith(".adf") and os.path.basename(path) != "hdr.adf":
+            # an ArcInfo grid is opened through its hdr.adf only
+            continue
+        if path.endswith(".zip"):
+            entries = gdal.ReadDir("/vsizip/" + path) or []
+            inner = [entry for entry in entries if entry.endswith(".hgt")]
+            if not inner:
+                continue
+            path = "/vsizip/" + path + "/" + inner[0]
+        tiles.append(path)
+    return tiles
+
+
+class TileIndex:
+    """Bounding boxes (in degrees) of the tiles of a folder.
+    Usage:
+        index = TileIndex(folder, cache_dir)
+        tile = index.assign(lats, lons)   # tile number per point, -1 if none
+        index.tiles[tile[0]], index.vrt_path()
+    The index is stored as JSON in cache_dir, keyed by a stamp of the tile
+    files (names, sizes, mtimes), so later runs do not open every tile.
+    """
+
+    def __init__(self, folder, cache_dir):
+        self.folder = folder
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.name = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]
+        self.index_path = join(cache_dir, self.name + ".json")
+        self._load()
+
+    def _stamp(self, tiles):
+        sha = hashlib.sha1()
+        for tile in tiles:
+            path = tile
+            if tile.startswith("/vsizip/"):
+                # stamp the zip file, not its member
+                path = tile[len("/vsizip/") :].rsplit("/", 1)[0]
+            st = os.stat(path)
+            sha.update(("%s %d %d\n" % (tile, st.st_size, st.st_mtime_ns)).encode())
+        return sha.hexdigest()
+
+    def _load(self):
+        """Read the index from the cache, or build it from the tiles."""
+        with instrument.stage("terrain_index"):
+            tiles = list_tiles(self.folder)
+            self.stamp = self._stamp(tiles)
+            index = None
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r") as fp:
+                    index = json.load(fp)
+                if index.get("stamp") != self.stamp:
+                    index = None
+            if index is None:
+                index = {"stamp": self.stamp, "tiles": [], "bboxes": [], "wkts": []}
+                for tile in tiles:
+                    try:
+                        bbox, wkt = tile_bbox(tile)
+                    except Exception as e:
+                        print(e)
+                        print("Unable to open DEM tile: " + tile + "\n")
+                        continue
+                    index["tiles"].append(tile)
+                    index["bboxes"].append(bbox)
+                    index["wkts"].append(wkt)
+                tmp_path = self.index_path + ".tmp"
+                with open(tmp_path, "w") as fp:
+                    json.dump(index, fp)
+                os.replace(tmp_path, self.index_path)
+
+        self.tiles = index["tiles"]
+        self.bboxes = np.array(index["bboxes"], dtype=np.float64).reshape(-1, 4)
+        self.wkts = index["wkts"]
+        # tiles sharing one projection can be read through a single mosaic
+        self.single_crs = len(set(self.wkts)) == 1
+
+        # grid of cells (about one tile wide) -> tiles overlapping the cell
+        self.cells = {}
+        self.cell_size = 1.0
+        if len(self.tiles) > 0:
+            self.cell_size = max(
+                float(np.median(self.bboxes[:, 2] - self.bboxes[:, 0])), 1e-3
+            )
+            for t, (minx, miny, maxx, maxy) in enumerate(self.bboxes):
+                for cx in range(self._cell(minx), self._cell(maxx) + 1):
+                    for cy in range(self._cell(miny), self._cell(maxy) + 1):
+                        self.cells.setdefault((cx, cy), []).append(t)
+
+    def _cell(self, degrees):
+        return int(np.floor(degrees / self.cell_size))
+
+    def assign(self, lats, lons, after=None):
+        """Get the tile of each point (the first tile whose bounding box
+        holds it), -1 for points outside every tile.
+        after: tile number per point; only the tiles after it are
+        candidates (to move on to the next tile of a point), None for all
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        tile = np.full(len(lats), -1, dtype=np.int64)
+        if after is None:
+            after = tile
+        if len(self.tiles) == 0 or len(lats) == 0:
+            return tile
+        with instrument.stage("tile_assignment"):
+            cx = np.floor(lons / self.cell_size).astype(np.int64)
+            cy = np.floor(lats / self.cell_size).astype(np.int64)
+            cell_keys, inverse = np.unique(
+                np.column_stack((cx, cy)), axis=0, return_inverse=True
+            )
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind="stable")
+            starts = np.searchsorted(inverse[order], np.arange(len(cell_keys)))
+            ends = np.append(starts[1:], len(order))
+            for (key_x, key_y), start, end in zip(cell_keys, starts, ends):
+                candidates = self.cells.get((int(key_x), int(key_y)))
+                if not candidates:
+                    continue
+                sel = order[start:end]
+                for t in candidates:
+                    minx, miny, maxx, maxy = self.bboxes[t]
+                    inside = (
+                        (tile[sel] == -1)
+                        & (after[sel] < t)
+                        & (lons[sel] >= minx)
+                        & (lons[sel] < maxx)
+                        & (lats[sel] > miny)
+                        & (lats[sel] <= maxy)
+                    )
+                    tile[sel[inside]] = t
+        return tile
+
+    def vrt_path(self):
+        """Get the VRT mosaic of the tiles, built once per tile stamp.
+        Only for tiles sharing a projection.
+        """
+        vrt_path = join(self.cache_dir, self.name + "_" + self.stamp[:12] + ".vrt")
+        if not os.path.exists(vrt_path):
+            with instrument.stage("terrain_vrt"):
+                # drop the mosaics of older versions of the folder
+                for old_path in glob.glob(join(self.cache_dir, self.name + "_*.vrt")):
+                    os.remove(old_path)
+                tmp_path = vrt_path + ".tmp.vrt"
+                vrt = gdal.BuildVRT(tmp_path, self.tiles)
+                vrt.FlushCache()
+                vrt = None
+                os.replace(tmp_path, vrt_path)
+        return vrt_path
+
+
+"""
+get the bounding box of a raster in degrees of its geographic CRS
+output of the function:
+([min lon, min lat, max lon, max lat], projection WKT)
+"""
+
+
+def tile_bbox(path):
+    ds = gdal.Open(path)
+    gt = ds.GetGeoTransform()
+    wkt = ds.GetProjection()
+    xsize, ysize = ds.RasterXSize, ds.RasterYSize
+    # corners and edge midpoints, projected coordinates
+    pxs = np.array([0, xsize / 2.0, xsize, 0, xsize, 0, xsize / 2.0, xsize])
+    pys = np.array([0, 0, 0, ysize / 2.0, ysize / 2.0, ysize, ysize, ysize])
+    xs = gt[0] + pxs * gt[1] + pys * gt[2]
+    ys = gt[3] + pxs * gt[4] + pys * gt[5]
+
+    prosrs, geosrs = geo_functions.getSRSPair(ds)
+    if prosrs.IsGeographic():
+        lons, lats = xs, ys
+    else:
+        if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+            prosrs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            geosrs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        ct = osr.CoordinateTransformation(prosrs, geosrs)
+        coords = np.asarray(ct.TransformPoints(np.column_stack((xs, ys)).tolist()))
+        lons, lats = coords[:, 0], coords[:, 1]
+    return [
+        float(lons.min()),
+        float(lats.min()),
+        float(lons.max()),
+        float(lats.max()),
+    ], wkt
+
+
+"""
+compute slope and aspect (degrees, as gdaldem with the Horn method) from
+3 x 3 DEM windows
+input of the function:
+patches: float array [points, 3, 3], NaN for no data
+dx, dy: pixel width and height in metres, scalars or arrays [points]
+output of the function:
+(slope, aspect) float arrays; aspect is clockwise from north, -1 on flat
+ground; NaN where the window has no data
+"""
+
+
+def slope_aspect(patches, dx, dy):
+    w = patches.reshape(len(patches), 9).astype(np.float64)
+    gx = (w[:, 2] + 2 * w[:, 5] + w[:, 8]) - (w[:, 0] + 2 * w[:, 3] + w[:, 6])
+    gy = (w[:, 6] + 2 * w[:, 7] + w[:, 8]) - (w[:, 0] + 2 * w[:, 1] + w[:, 2])
+    slope = np.degrees(np.arctan(np.hypot(gx / (8 * dx), gy / (8 * dy))))
+    # Horn leaves out the centre pixel, which must have data too
+    slope = np.where(np.isnan(w[:, 4]), np.nan, slope)
+
+    # on non-square pixels (geographic grids) the gradients are per metre
+    aspect = np.degrees(np.arctan2(gy / dy, -gx / dx))
+    aspect = np.where(aspect > 90.0, 450.0 - aspect, 90.0 - aspect)
+    aspect = np.where(aspect == 360.0, 0.0, aspect)
+    aspect = np.where((gx == 0) & (gy == 0), -1.0, aspect)
+    aspect = np.where(np.isnan(slope), np.nan, aspect)
+    return slope, aspect
+
+
+"""
+get the pixel width and height in metres of a geographic grid at the given
+latitudes (the width shrinks with the cosine of the latitude)
+input of the function:
+gt: geotransform of the grid, in degrees
+lats: latitudes of the points, numpy array
+output of the function:
+(dx, dy) float64 arrays [points]
+"""
+
+
+def geographic_pixel_size(gt, lats):
+    lats = np.asarray(lats, dtype=np.float64)
+    dx = abs(gt[1]) * METERS_PER_DEGREE_LON * np.cos(np.radians(lats))
+    dy = np.full(lats.shape, abs(gt[5]) * METERS_PER_DEGREE_LAT)
+    return dx, dy
+
+
+"""
+sample one layer at the points of their tiles
+input of the function:
+index: TileIndex of the layer's folder
+tile: tile number of each point (from index.assign)
+window: None for the pixel under the points, 3 for their 3 x 3 windows
+output of the function:
+(values, dx, dy): float64 values [points] (or patches [points, 3, 3]),
+NaN for no data, and the pixel size in metres at each point
+"""
+
+
+def sample_layer(index, lats, lons, tile, window=None):
+    n = len(lats)
+    if window is None:
+        values = np.full(n, np.nan)
+    else:
+        values = np.full((n, window, window), np.nan)
+    dx = np.full(n, np.nan)
+    dy = np.full(n, np.nan)
+
+    # one mosaic for tiles sharing a projection
+    if index.single_crs:
+        sel = np.flatnonzero(tile >= 0)
+        if len(sel):
+            _sample_raster(index.vrt_path(), lats, lons, sel, window, values, dx, dy)
+        return values, dx, dy
+
+    # otherwise tile by tile: the degree boxes of tiles in other projections
+    # overlap, so the points outside the raster of their tile are sent on to
+    # their next tile
+    tile = np.asarray(tile, dtype=np.int64)
+    while (tile >= 0).any():
+        missed = []
+        for t in np.unique(tile[tile >= 0]):
+            sel = np.flatnonzero(tile == t)
+            valid = _sample_raster(
+                index.tiles[t], lats, lons, sel, window, values, dx, dy
+            )
+            missed.append(sel[~valid])
+        missed = np.concatenate(missed)
+        next_tile = np.full(n, -1, dtype=np.int64)
+        next_tile[missed] = index.assign(lats[missed], lons[missed], tile[missed])
+        tile = next_tile
+    return values, dx, dy
+
+
+"""
+sample one raster at the points sel, into values, dx and dy
+output of the function:
+boolean array [len(sel)], whether the points are inside the raster
+"""
+
+
+def _sample_raster(path, lats, lons, sel, window, values, dx, dy):
+    with instrument.stage("gdal_open"):
+        ds = gdal.Open(path)
+    band = ds.GetRasterBand(1)
+    pxs, pys, valid = geo_functions.points_to_pixels(ds, lats[sel], lons[sel])
+    if window is None:
+        sampled = raster_reader.read_points(band, pxs, pys, valid)
+        sampled = sampled.astype(np.float64)
+        sampled[~valid] = np.nan
+    else:
+        sampled = raster_reader.read_windows(band, pxs, pys, window, valid)
+        sampled = sampled.astype(np.float64)
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        sampled[sampled == nodata] = np.nan
+    inside = sel[valid]
+    values[inside] = sampled[valid]
+
+    gt = ds.GetGeoTransform()
+    prosrs, _ = geo_functions.getSRSPair(ds)
+    if prosrs.IsGeographic():
+        dx[inside], dy[inside] = geographic_pixel_size(gt, lats[inside])
+    else:
+        dx[inside] = abs(gt[1]) * prosrs.GetLinearUnits()
+        dy[inside] = abs(gt[5]) * prosrs.GetLinearUnits()
+    return valid
+
+
+"""
+function to sample the terrain layers of a source at many points
+input of the function:
+lats, lons: coordinates of the points, numpy arrays
+source: key of TERRAIN_SOURCES (None: settings.TERRAIN_SOURCE)
+output of the function:
+{"DEM": array, "SLOPE": array, "ASPECT": array} of float64, NaN where no
+tile covers the point or the tile has no data there
+"""
+
+
+def sample_terrain(lats, lons, source=None):
+    if source is None:
+        source = settings.TERRAIN_SOURCE
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    home = os.path.expanduser("~")
+    cache_dir = join(home, settings.TERRAIN_CACHE_PATH)
+    layers = TERRAIN_SOURCES[source]
+
+    result = {}
+    for layer in TERRAIN_LAYERS:
+        if layer not in layers:
+            continue
+        index = TileIndex(join(home, layers[layer]), cache_dir)
+        tile = index.assign(lats, lons)
+        result[layer], _, _ = sample_layer(index, lats, lons, tile)
+        if layer == "DEM":
+            dem_index, dem_tile = index, tile
+
+    if "SLOPE" not in result or "ASPECT" not in result:
+        # computed from the 3 x 3 DEM windows
+        patches, dx, dy = sample_layer(dem_index, lats, lons, dem_tile, window=3)
+        with instrument.stage("slope_aspect"):
+            slope, aspect = slope_aspect(patches, dx, dy)
+        result.setdefault("SLOPE", slope)
+        result.setdefault("ASPECT", aspect)
+    return result
+
+
+"""
+function to extract DEM, slope and aspect given sample points
+input of the function:
+points: coordinate (lat, lon); float, a list of tuple
+source: "wgs", "utm" (precomputed slope/aspect rasters), "srtm" or
+"original" (slope/aspect computed from the DEM); None: settings.TERRAIN_SOURCE
+output of the function:
+{(lat_str, lon_str): {'DEM': value, 'SLOPE': value, 'ASPECT': value}}
+--------------valid Data----------------
+DEM: metres, SLOPE: 0-90 degrees, ASPECT: 0-360 degrees clockwise from north
+--------------Invalid Data----------------
+None where no tile covers the point; ASPECT = -1 on flat ground
+"""
+
+
+def extract_terrain(points, source=None):
+    points = list(points)
+    lats = np.array([pt[0] for pt in points], dtype=np.float64)
+    lons = np.array([pt[1] for pt in points], dtype=np.float64)
+    terrain = sample_terrain(lats, lons, source)
+
+    terrain_res = {}
+    for i, pt in enumerate(points):
+        point_res = {}
+        for layer in TERRAIN_LAYERS:
+            value = terrain[layer][i]
+            point_res[layer] = None if np.isnan(value) else round(float(value), 4)
+        terrain_res[geo_functions.get_latlon_key(pt[0], pt[1])] = point_res
+    return terrain_res
+
+
+if __name__ == "__main__":
+    print("begin!")
+    points = [(40.570, -89.354), (42.353, -89.352), (40.619, -116.959)]
+    printer.pprint(extract_terrain(points))
+    print("finish!")
@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+import checkpoint
+import result_cube
+
+
+# two tiles sharing the point (41.0, -89.0)
+TILED = result_cube.TiledPoints(
+    np.array([40.0, 40.5, 41.0, 42.0]),
+    np.array([-90.0, -89.5, -89.0, -88.0]),
+    {"023-032": np.array([0, 1, 2]), "023-031": np.array([2, 3])},
+)
+
+
+def scene_batch(scene_id, date, tile_key, idx, point_ids):
+    members = TILED.tiles[tile_key][idx]
+    return result_cube.SceneBatch(
+        scene_id,
+        date,
+        ["B", "G"],
+        point_ids[members],
+        TILED.lats[members],
+        TILED.lons[members],
+        np.arange(2 * len(idx), dtype=np.float32).reshape(len(idx), 2) / 10,
+    )
+
+
+def record(ck, scene_id, date, tile_key="023-032", idx=(0, 2)):
+    idx = np.array(idx, dtype=np.int64)
+    batch = scene_batch(scene_id, date, tile_key, idx, np.arange(4))
+    ck.record(batch, tile_key, idx)
+    return batch
+
+
+def assert_same_batch(a, b):
+    assert (a.scene_id, a.date, a.bands) == (b.scene_id, b.date, b.bands)
+    for field in ("point_ids", "lats", "lons", "values"):
+        np.testing.assert_array_equal(getattr(a, field), getattr(b, field))
+
+
+def test_resume_yields_recorded_batches(tmp_path):
+    params = ("landsat_sr", {"023-032": [(40.0, -90.0)]}, "20160401", "20161001")
+    ck = checkpoint.Checkpoint.for_run(str(tmp_path), *params)
+    batches = [
+        record(ck, "s1", "20160415"),
+        record(ck, "s2", "20160501", "023-031", (0, 1)),
+    ]
+
+    resumed = checkpoint.Checkpoint.for_run(str(tmp_path), *params)
+    assert resumed.run_dir == ck.run_dir
+    assert list(resumed.done) == ["s1", "s2"]
+    for stored, batch in zip(resumed.batches(TILED, np.arange(4)), batches):
+        assert_same_batch(stored, batch)
+
+    other = checkpoint.Checkpoint.for_run(str(tmp_path), *params[:-1], "20161101")
+    assert other.run_dir != ck.run_dir
+    assert other.done == {}
+
+
+def test_resume_maps_points_through_a_fresh_point_index(tmp_path):
+    ck = checkpoint.Checkpoint(str(tmp_path / "run"))
+    # the first run's index had other points registered before
+    first_index = result_cube.PointIndex()
+    first_index.add_points([(10.0, 10.0), (11.0, 11.0)])
+    first_ids = first_index.add_points(TILED.lats, TILED.lons)
+    assert first_ids.tolist() == [2, 3, 4, 5]
+    idx = np.array([1, 0])
+    ck.record(scene_batch("s1", "20160415", "023-031", idx, first_ids), "023-031", idx)
+
+    fresh_index = result_cube.PointIndex()
+    fresh_ids = fresh_index.add_points(TILED.lats, TILED.lons)
+    (stored,) = checkpoint.Checkpoint(str(tmp_path / "run")).batches(
+        TILED, fresh_ids
+    )
+    assert stored.point_ids.tolist() == [3, 2]
+    np.testing.assert_array_equal(fresh_index.lats[stored.point_ids], stored.lats)
+    np.testing.assert_array_equal(fresh_index.lons[stored.point_ids], stored.lons)
+    assert stored.lats.tolist() == [42.0, 41.0]
+
+
+def test_scenes_of_other_points_are_redone(tmp_path):
+    ck = checkpoint.Checkpoint(str(tmp_path / "run"))
+    record(ck, "s1", "20160415")
+    record(ck, "s2", "20160501", "023-031", (0, 1))
+    record(ck, "s3", "20160517", "023-032", (1,))
+
+    moved = result_cube.TiledPoints(
+        TILED.lats.copy(), TILED.lons.copy(), {"023-032": TILED.tiles["023-032"]}
+    )
+    moved.lats[1] = 40.6
+    resumed = checkpoint.Checkpoint(str(tmp_path / "run"))
+    batches = list(resumed.batches(moved, np.arange(4)))
+    assert [batch.scene_id for batch in batches] == ["s1"]
+    # s2 (tile gone) and s3 (point moved) are extracted again
+    assert list(resumed.done) == ["s1"]
+
+
+def test_cut_short_journal_line_is_redone(tmp_path):
+    ck = checkpoint.Checkpoint(str(tmp_path / "run"))
+    record(ck, "s1", "20160415")
+    with open(ck.journal_path, "a") as fp:
+        fp.write('{"scene_id": "s2", "fi')
+
+    resumed = checkpoint.Checkpoint(str(tmp_path / "run"))
+    assert list(resumed.done) == ["s1"]
+    record(resumed, "s2", "20160501")
+    # the new entry does not reuse the file of the cut-short one
+    assert len(set(resumed.done.values())) == 2
+
+    resumed = checkpoint.Checkpoint(str(tmp_path / "run"))
+    assert list(resumed.done) == ["s1", "s2"]
+
+
+def test_missing_result_file_is_redone(tmp_path):
+    ck = checkpoint.Checkpoint(str(tmp_path / "run"))
+    record(ck, "s1", "20160415")
+    record(ck, "s2", "20160501")
+    os.remove(os.path.join(ck.run_dir, ck.done["s1"]))
+    assert list(checkpoint.Checkpoint(str(tmp_path / "run")).done) == ["s2"]
+
+
+def test_clear_removes_the_run(tmp_path):
+    ck = checkpoint.Checkpoint(str(tmp_path / "run"))
+    record(ck, "s1", "20160415")
+    ck.clear()
+    assert not os.path.exists(ck.run_dir)
+    assert checkpoint.Checkpoint(str(tmp_path / "run")).done == {}
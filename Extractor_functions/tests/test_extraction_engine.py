@@ -0,0 +1,413 @@
+import os
+
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip("osgeo.gdal")
+from osgeo import osr
+
+import settings
+import checkpoint
+import extraction_engine
+import instrument
+import result_cube
+
+SIZE = (30, 40)
+RES = 0.01
+TILES = {"t1": (-100.0, 45.0), "t2": (-99.8, 45.0)}
+DATES = ["20160101", "20160117", "20160202"]
+
+
+class GridSensor(extraction_engine.Sensor):
+    """Scenes of synthetic rasters: <tile>_<date> folders with qa.tif (0 for
+    clear pixels), b1.tif and b2.tif.
+    """
+
+    name = "grid"
+    bands = ["B1", "B2"]
+    scale = 0.0001
+    valid_range = (0.0, 1.0)
+    empty_records = True
+
+    def __init__(self, root):
+        self.root = root
+        # scene ids given to scene_files, to tell which scenes were read
+        self.opened = []
+
+    def list_scenes(self, tile_keys, start_time, end_time):
+        return {
+            tile_key: [
+                os.path.join(self.root, tile_key + "_" + file_date)
+                for file_date in DATES
+                if start_time <= file_date <= end_time
+            ]
+            for tile_key in tile_keys
+        }
+
+    def scene_files(self, scene_id):
+        self.opened.append(scene_id)
+        if not os.path.isdir(scene_id):
+            return None
+        grid = {
+            band_type: os.path.join(scene_id, band_type.lower() + ".tif")
+            for band_type in self.bands
+        }
+        return extraction_engine.Scene(
+            scene_id[-8:], os.path.join(scene_id, "qa.tif"), [grid], self.bands
+        )
+
+    def qa_rule(self, qa_values):
+        return qa_values == 0
+
+
+def write_raster(path, data, origin):
+    ds = gdal.GetDriverByName("GTiff").Create(
+        path, data.shape[1], data.shape[0], 1, gdal.GDT_Int16
+    )
+    ds.SetGeoTransform((origin[0], RES, 0, origin[1], 0, -RES))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(data)
+    ds.FlushCache()
+    ds = None
+
+
+def pixel_center(origin, row, col):
+    return origin[1] - (row + 0.5) * RES, origin[0] + (col + 0.5) * RES
+
+
+@pytest.fixture
+def scenes(tmp_path, monkeypatch):
+    """Write the scenes; return the sensor, the points by tile and the
+    rasters {scene folder: (qa, b1, b2)}.
+    """
+    # the result cache and checkpoints go under home
+    monkeypatch.setenv("HOME", str(tmp_path))
+    rng = np.random.default_rng(0)
+    rasters = {}
+    for tile_key, origin in TILES.items():
+        for file_date in DATES:
+            folder = str(tmp_path / (tile_key + "_" + file_date))
+            os.makedirs(folder)
+            qa = (rng.random(SIZE) < 0.3).astype(np.int16)
+            b1 = rng.integers(-500, 11000, SIZE).astype(np.int16)
+            b2 = rng.integers(0, 10000, SIZE).astype(np.int16)
+            for name, data in (("qa", qa), ("b1", b1), ("b2", b2)):
+                write_raster(os.path.join(folder, name + ".tif"), data, origin)
+            rasters[folder] = (qa, b1, b2)
+
+    cells = {
+        "t1": [(row, col) for row in range(0, 30, 4) for col in (1, 18, 25, 39)],
+        "t2": [(row, col) for row in (3, 17, 29) for col in (0, 12)],
+    }
+    tile_dict = {
+        tile_key: [pixel_center(TILES[tile_key], row, col) for row, col in cells]
+        for tile_key, cells in cells.items()
+    }
+    # a point in both tiles, and one outside the rasters
+    tile_dict["t2"].append(tile_dict["t1"][3])
+    tile_dict["t1"].append((44.0, -99.0))
+    return GridSensor(str(tmp_path)), tile_dict, rasters
+
+
+def expected_records(sensor, tile_dict, rasters, start_time="0", end_time="9"):
+    """Results of the scenes computed pixel by pixel."""
+    res = {}
+    for tile_key, locations in tile_dict.items():
+        origin = TILES[tile_key]
+        for lat, lon in locations:
+            record = res.setdefault(
+                ("{:.6f}".format(lat), "{:.6f}".format(lon)), {"B1": [], "B2": []}
+            )
+            row = int(np.floor((origin[1] - lat) / RES))
+            col = int(np.floor((lon - origin[0]) / RES))
+            if not (0 <= row < SIZE[0] and 0 <= col < SIZE[1]):
+                continue
+            for file_date in DATES:
+                if not start_time <= file_date <= end_time:
+                    continue
+                qa, b1, b2 = rasters[
+                    os.path.join(sensor.root, tile_key + "_" + file_date)
+                ]
+                if qa[row, col] != 0:
+                    continue
+                for band_type, data in (("B1", b1), ("B2", b2)):
+                    value = round(data[row, col] * 0.0001, 4)
+                    if not 0 < value < 1:
+                        value = -1
+                    record[band_type].append(
+                        (file_date, round(float(np.float32(value)), 4))
+                    )
+    for record in res.values():
+        for band_values in record.values():
+            band_values.sort()
+    return res
+
+
+def test_serial_extract_matches_pixels(scenes):
+    sensor, tile_dict, rasters = scenes
+    res = extraction_engine.extract(sensor, tile_dict, "20160101", "20160131")
+    assert res == expected_records(sensor, tile_dict, rasters, "20160101", "20160131")
+    res = extraction_engine.extract(sensor, tile_dict, "20160101", "20161231")
+    assert res == expected_records(sensor, tile_dict, rasters)
+
+
+def make_cloudy(sensor, rasters, scene_key):
+    """Mark every pixel of a scene cloudy."""
+    folder = os.path.join(sensor.root, scene_key)
+    qa, b1, b2 = rasters[folder]
+    qa = np.ones_like(qa)
+    write_raster(os.path.join(folder, "qa.tif"), qa, TILES[scene_key.split("_")[0]])
+    rasters[folder] = (qa, b1, b2)
+
+
+def test_sample_scene_without_clear_points():
+    sensor = GridSensor("unused")
+    scene = extraction_engine.Scene("20160101", None, [], sensor.bands)
+    empty = np.zeros(0, dtype=np.int64)
+    loaded = extraction_engine.LoadedScene(
+        scene, empty, None, {"B1": np.zeros(0, np.int16), "B2": np.zeros(0, np.int16)}
+    )
+    file_date, bands, idx, values = extraction_engine.sample_scene(sensor, loaded)
+    assert (file_date, bands, idx.tolist()) == ("20160101", ["B1", "B2"], [])
+    assert values.shape == (0, 2) and values.dtype == np.float32
+
+
+def test_sample_windows_without_clear_points():
+    sensor = GridSensor("unused")
+    sensor.window_size = 3
+    sensor.window_stats = ["mean", "median", "count"]
+    scene = extraction_engine.Scene("20160101", "qa.tif", [], sensor.bands)
+    empty = np.zeros(0, dtype=np.int64)
+    patches = np.zeros((0, 3, 3), np.float32)
+    loaded = extraction_engine.LoadedScene(
+        scene, empty, np.zeros((0, 3, 3), bool), {"B1": patches, "B2": patches}
+    )
+    _, columns, idx, values = extraction_engine.sample_scene(sensor, loaded)
+    assert columns == sensor.columns()
+    assert values.shape == (0, 6) and values.dtype == np.float32
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_fully_cloudy_scene(scenes, workers):
+    sensor, tile_dict, rasters = scenes
+    make_cloudy(sensor, rasters, "t1_20160117")
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", workers)
+    assert res == expected_records(sensor, tile_dict, rasters)
+    batches = list(extraction_engine.iter_scenes(sensor, tile_dict, "2016", "2017"))
+    (cloudy,) = [batch for batch in batches if batch.scene_id.endswith("t1_20160117")]
+    assert cloudy.values.shape == (0, 2)
+
+
+def test_workers_match_serial(scenes):
+    sensor, tile_dict, rasters = scenes
+    expected = expected_records(sensor, tile_dict, rasters)
+    assert extraction_engine.extract(sensor, tile_dict, "2016", "2017", 2) == expected
+    # the point of both tiles has two values on each date
+    cube = extraction_engine.extract(
+        sensor, tile_dict, "2016", "2017", 2, output="cube"
+    )
+    assert cube.to_legacy() == expected
+    assert cube.values.shape == (len(expected), len(DATES), 2)
+
+
+def test_result_cache_hits_and_file_changes(scenes):
+    sensor, tile_dict, rasters = scenes
+    expected = expected_records(sensor, tile_dict, rasters)
+    # the cache is only used when asked for
+    assert extraction_engine.extract(sensor, tile_dict, "2016", "2017") == expected
+    assert len(set(sensor.opened)) == 6
+
+    del sensor.opened[:]
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", use_cache=True)
+    assert res == expected
+    assert len(set(sensor.opened)) == 6
+    del sensor.opened[:]
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", use_cache=True)
+    assert res == expected
+    assert sensor.opened == []
+
+    # a rewritten band file makes its scene a miss
+    changed = os.path.join(sensor.root, "t2_20160117")
+    path = os.path.join(changed, "b1.tif")
+    mtime_ns = os.stat(path).st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", use_cache=True)
+    assert res == expected
+    assert set(sensor.opened) == {changed}
+
+    # other points are other entries
+    del sensor.opened[:]
+    tile_dict = {"t1": tile_dict["t1"][:5]}
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", use_cache=True)
+    assert res == expected_records(sensor, tile_dict, rasters)
+    assert len(set(sensor.opened)) == 3
+
+
+def batches_by_scene(batches):
+    return {
+        batch.scene_id: (
+            batch.date,
+            batch.bands,
+            batch.lats.tolist(),
+            batch.lons.tolist(),
+            batch.values.tolist(),
+        )
+        for batch in batches
+    }
+
+
+def test_resume_skips_completed_scenes(scenes, tmp_path):
+    sensor, tile_dict, _ = scenes
+    expected = batches_by_scene(
+        extraction_engine.iter_scenes(sensor, tile_dict, "2016", "2017")
+    )
+    assert len(expected) == 6
+
+    run_dir = str(tmp_path / "run")
+    batches = extraction_engine.iter_scenes(
+        sensor, tile_dict, "2016", "2017", checkpoint=checkpoint.Checkpoint(run_dir)
+    )
+    first = [next(batches), next(batches)]
+    batches.close()
+
+    del sensor.opened[:]
+    resumed = list(
+        extraction_engine.iter_scenes(
+            sensor, tile_dict, "2016", "2017", checkpoint=checkpoint.Checkpoint(run_dir)
+        )
+    )
+    assert [batch.scene_id for batch in resumed[:2]] == [
+        batch.scene_id for batch in first
+    ]
+    assert batches_by_scene(resumed) == expected
+    assert len(resumed) == 6
+    assert not set(sensor.opened) & set(batch.scene_id for batch in first)
+
+
+def test_resume_with_a_fresh_point_index(scenes, tmp_path):
+    sensor, tile_dict, _ = scenes
+    run_dir = str(tmp_path / "run")
+    # the interrupted run shared an index holding other points first
+    shared = result_cube.PointIndex()
+    shared.add_points([(0.0, 0.0), (1.0, 1.0), (2.0, 2.0)])
+    batches = extraction_engine.iter_scenes(
+        sensor,
+        tile_dict,
+        "2016",
+        "2017",
+        point_index=shared,
+        checkpoint=checkpoint.Checkpoint(run_dir),
+    )
+    first = [next(batches), next(batches)]
+    batches.close()
+    assert min(first[0].point_ids) >= 3
+
+    point_index = result_cube.PointIndex()
+    resumed = list(
+        extraction_engine.iter_scenes(
+            sensor,
+            tile_dict,
+            "2016",
+            "2017",
+            point_index=point_index,
+            checkpoint=checkpoint.Checkpoint(run_dir),
+        )
+    )
+    assert [batch.scene_id for batch in resumed[:2]] == [
+        batch.scene_id for batch in first
+    ]
+    for batch in resumed:
+        np.testing.assert_array_equal(
+            np.asarray(point_index.lats)[batch.point_ids], batch.lats
+        )
+        np.testing.assert_array_equal(
+            np.asarray(point_index.lons)[batch.point_ids], batch.lons
+        )
+    np.testing.assert_array_equal(resumed[0].values, first[0].values)
+    np.testing.assert_array_equal(resumed[0].lats, first[0].lats)
+
+
+def test_point_ids_follow_the_point_index(scenes):
+    sensor, tile_dict, _ = scenes
+    point_index = result_cube.PointIndex()
+    batches = list(
+        extraction_engine.iter_scenes(
+            sensor, tile_dict, "2016", "2017", point_index=point_index
+        )
+    )
+    for batch in batches:
+        np.testing.assert_array_equal(
+            np.asarray(point_index.lats)[batch.point_ids], batch.lats
+        )
+        np.testing.assert_array_equal(
+            np.asarray(point_index.lons)[batch.point_ids], batch.lons
+        )
+    # the point of both tiles has one id
+    assert len(point_index) == len(tile_dict["t1"]) + len(tile_dict["t2"]) - 1
+
+
+@pytest.mark.parametrize("budget_mb", [0, 1e-6, 4096])
+def test_memory_budget_keeps_results(scenes, monkeypatch, budget_mb):
+    sensor, tile_dict, rasters = scenes
+    monkeypatch.setattr(settings, "MEMORY_BUDGET_MB", budget_mb)
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", 2)
+    assert res == expected_records(sensor, tile_dict, rasters)
+
+
+def test_scene_memory(scenes):
+    sensor, tile_dict, _ = scenes
+    lats, lons = np.array(tile_dict["t1"]).T
+    scene_id = os.path.join(sensor.root, "t1_20160101")
+    assert extraction_engine.scene_memory(scene_id, sensor, lats, lons) > 0
+    missing = os.path.join(sensor.root, "t1_20160301")
+    assert extraction_engine.scene_memory(missing, sensor, lats, lons) == 0
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+@pytest.mark.parametrize("budget_mb", [0, 1e-6])
+def test_prefetch_matches_serial(scenes, monkeypatch, depth, budget_mb):
+    sensor, tile_dict, rasters = scenes
+    monkeypatch.setattr(settings, "PREFETCH_DEPTH", depth)
+    monkeypatch.setattr(settings, "MEMORY_BUDGET_MB", budget_mb)
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017")
+    assert res == expected_records(sensor, tile_dict, rasters)
+    # a scene that cannot be used is skipped
+    sensor.root = sensor.root + "_moved"
+    assert extraction_engine.extract(sensor, tile_dict, "2016", "2017") == {
+        res_key: {"B1": [], "B2": []} for res_key in res
+    }
+
+
+@pytest.mark.parametrize("output", ["dict", "cube"])
+def test_tile_assignment_is_counted_once_per_run(scenes, output):
+    sensor, tile_dict, _ = scenes
+    instrument.enable()
+    try:
+        extraction_engine.extract(sensor, tile_dict, "2016", "2017", output=output)
+        stats = instrument.snapshot()
+    finally:
+        instrument.disable()
+        instrument.reset()
+    assert stats["tile_assignment"]["calls"] == 1
+    assert stats["list_files"]["calls"] == 1
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_fully_cloudy_scene_with_windows(scenes, workers):
+    sensor, tile_dict, rasters = scenes
+    sensor.window_size = 3
+    sensor.window_stats = ["mean", "count"]
+    make_cloudy(sensor, rasters, "t1_20160117")
+    res = extraction_engine.extract(sensor, tile_dict, "2016", "2017", workers)
+    assert set(next(iter(res.values()))) == {
+        "B1_mean",
+        "B1_count",
+        "B2_mean",
+        "B2_count",
+    }
+    # the same as without the cloudy scene
+    cloudy = os.path.join(sensor.root, "t1_20160117")
+    os.rename(cloudy, cloudy + "_moved")
+    assert extraction_engine.extract(sensor, tile_dict, "2016", "2017") == res
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+osr = pytest.importorskip("osgeo.osr")
+
+import geo_functions
+
+
+class GridDataset:
+    """Raster metadata of a grid, as read by grid_key."""
+
+    def __init__(self, gt, xsize, ysize, wkt="WKT"):
+        self.gt = gt
+        self.RasterXSize = xsize
+        self.RasterYSize = ysize
+        self.wkt = wkt
+
+    def GetGeoTransform(self):
+        return self.gt
+
+    def GetProjection(self):
+        return self.wkt
+
+
+def wgs84_wkt():
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    return srs.ExportToWkt()
+
+
+def test_geo2imagexy_batch_inverts_the_geotransform():
+    # a rotated grid: x = 10 + 2 col + row, y = 20 + col - 2 row
+    dataset = GridDataset((10.0, 2.0, 1.0, 20.0, 1.0, -2.0), 50, 50)
+    rng = np.random.default_rng(0)
+    cols, rows = rng.uniform(-5, 55, 20), rng.uniform(-5, 55, 20)
+    x = 10.0 + 2 * cols + rows
+    y = 20.0 + cols - 2 * rows
+    px, py = geo_functions.geo2imagexy_batch(dataset, x, y)
+    np.testing.assert_allclose(px, cols)
+    np.testing.assert_allclose(py, rows)
+    for i in range(3):
+        np.testing.assert_allclose(
+            geo_functions.geo2imagexy(dataset, x[i], y[i]), [cols[i], rows[i]]
+        )
+
+
+def test_points_to_pixels_edges():
+    # 40 x 30 pixels of 0.25 degrees from (-100, 45) to (-90, 37.5)
+    dataset = GridDataset((-100.0, 0.25, 0.0, 45.0, 0.0, -0.25), 40, 30, wgs84_wkt())
+    points = [
+        (45.0, -100.0, 0, 0, True),  # upper left corner
+        (44.9, -99.9, 0, 0, True),
+        (40.0, -95.0, 20, 20, True),
+        (37.5001, -90.0001, 39, 29, True),  # inside the lower right corner
+        (40.0, -90.0, 40, 20, False),  # right edge
+        (37.5, -95.0, 20, 30, False),  # bottom edge
+        (37.5, -90.0, 40, 30, False),
+        # just left of and above the raster: floor, not truncation towards 0
+        (40.0, -100.1, -1, 20, False),
+        (45.1, -95.0, 20, -1, False),
+        (50.0, -120.0, -80, -20, False),
+        (np.nan, -95.0, -1, -1, False),
+    ]
+    lats = np.array([pt[0] for pt in points])
+    lons = np.array([pt[1] for pt in points])
+    px, py, valid = geo_functions.points_to_pixels(dataset, lats, lons)
+    assert px.dtype == np.int64 and py.dtype == np.int64
+    assert px.tolist() == [pt[2] for pt in points]
+    assert py.tolist() == [pt[3] for pt in points]
+    assert valid.tolist() == [pt[4] for pt in points]
+
+
+def test_points_to_pixels_southern_hemisphere():
+    # negative origin in both axes, 1 x 2 degree pixels
+    dataset = GridDataset((-60.0, 1.0, 0.0, -10.0, 0.0, -2.0), 10, 5, wgs84_wkt())
+    lats = np.array([-10.0, -11.9, -12.0, -19.99, -20.0, -9.99])
+    lons = np.array([-60.0, -59.5, -50.01, -50.0, -55.0, -55.0])
+    px, py, valid = geo_functions.points_to_pixels(dataset, lats, lons)
+    assert px.tolist() == [0, 0, 9, 10, 5, 5]
+    assert py.tolist() == [0, 0, 1, 4, 5, -1]
+    assert valid.tolist() == [True, True, True, False, False, False]
+
+
+def test_points_to_pixels_of_no_points():
+    dataset = GridDataset((-100.0, 0.25, 0.0, 45.0, 0.0, -0.25), 40, 30, wgs84_wkt())
+    px, py, valid = geo_functions.points_to_pixels(dataset, [], [])
+    assert px.shape == py.shape == valid.shape == (0,)
+
+
+def test_deprecated_scalar_helpers():
+    dataset = GridDataset((-100.0, 0.25, 0.0, 45.0, 0.0, -0.25), 40, 30, wgs84_wkt())
+    inside = geo_functions.point_boundary_is_valid(dataset, 40.0, -95.0)
+    assert inside == (True, 20, 20)
+    # the right edge is outside the raster
+    edge = geo_functions.point_boundary_is_valid(dataset, 40.0, -90.0)
+    assert edge == (False, 40, 20)
+
+    data = np.array([[1000, 2000], [3000, 4000]])
+    assert geo_functions.get_band_value(data, 1, 0, 1) == 0.2
+    assert geo_functions.get_band_value(data, 0, 1, 2) == 0.3
+    assert geo_functions.get_band_value(data, 1, 1, 3) == 80.0
+    assert geo_functions.get_band_value(data, 1, 1, 3, cloud=True) == 4000
+    assert geo_functions.scale_band_value(15000, 3) == 300.0
+    assert geo_functions.scale_band_value(15000, 4) == -1
+
+
+def test_pixels_are_cached_per_grid_and_points(monkeypatch):
+    calls = []
+
+    def points_to_pixels(dataset, lats, lons):
+        calls.append(dataset)
+        n = len(lats)
+        return np.zeros(n, np.int64), np.zeros(n, np.int64), np.ones(n, bool)
+
+    monkeypatch.setattr(geo_functions, "points_to_pixels", points_to_pixels)
+    monkeypatch.setattr(geo_functions, "_pixel_cache", {})
+    lats, lons = np.array([41.0, 41.5]), np.array([-93.0, -92.5])
+    b02 = GridDataset((399960.0, 10.0, 0.0, 4700040.0, 0.0, -10.0), 10980, 10980)
+    b03 = GridDataset((399960.0, 10.0, 0.0, 4700040.0, 0.0, -10.0), 10980, 10980)
+    b8a = GridDataset((399960.0, 20.0, 0.0, 4700040.0, 0.0, -20.0), 5490, 5490)
+
+    first = geo_functions.points_to_pixels_cached(b02, lats, lons, "k")
+    # another band of the same grid and points is a hit
+    assert geo_functions.points_to_pixels_cached(b03, lats, lons, "k") is first
+    assert calls == [b02]
+    # another grid, other points or another projection are misses
+    geo_functions.points_to_pixels_cached(b8a, lats, lons, "k")
+    geo_functions.points_to_pixels_cached(b02, lats[:1], lons[:1], "k1")
+    other_crs = GridDataset(b02.gt, 10980, 10980, wkt="OTHER")
+    geo_functions.points_to_pixels_cached(other_crs, lats, lons, "k")
+    assert calls == [b02, b8a, b02, other_crs]
+    assert geo_functions.points_to_pixels_cached(b8a, lats, lons, "k")[0].shape == (2,)
+    assert len(calls) == 4
+
+
+def test_pixel_cache_drops_the_oldest_grid(monkeypatch):
+    calls = []
+
+    def points_to_pixels(dataset, lats, lons):
+        calls.append(dataset.gt[0])
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, bool)
+
+    monkeypatch.setattr(geo_functions, "points_to_pixels", points_to_pixels)
+    monkeypatch.setattr(geo_functions, "_pixel_cache", {})
+    size = geo_functions.PIXEL_CACHE_SIZE
+    grids = [
+        GridDataset((float(i), 1.0, 0.0, 0.0, 0.0, -1.0), 5, 5) for i in range(size + 1)
+    ]
+    for grid in grids:
+        geo_functions.points_to_pixels_cached(grid, [], [], "k")
+    assert len(geo_functions._pixel_cache) == size
+    geo_functions.points_to_pixels_cached(grids[-1], [], [], "k")
+    assert len(calls) == size + 1
+    geo_functions.points_to_pixels_cached(grids[0], [], [], "k")
+    assert len(calls) == size + 2
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import instrument
+
+
+@pytest.fixture
+def recording():
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+
+def test_disabled_stages_record_nothing():
+    instrument.disable()
+    instrument.reset()
+    with instrument.stage("read") as stage:
+        stage.add_bytes(10)
+    instrument.add("read")
+    assert instrument.snapshot() == {}
+
+
+def test_repeated_stages_add_up(recording):
+    for nbytes in (100, 200, 300):
+        with instrument.stage("read") as stage:
+            stage.add_bytes(nbytes)
+    stats = instrument.snapshot()
+    assert stats["read"]["calls"] == 3
+    assert stats["read"]["bytes"] == 600
+    assert stats["read"]["seconds"] >= 0.0
+
+
+def test_nested_stages_count_separately(recording):
+    with instrument.stage("scene"):
+        for _ in range(2):
+            with instrument.stage("gdal_open"):
+                pass
+        with instrument.stage("read") as stage:
+            stage.add_bytes(8)
+    stats = instrument.snapshot()
+    assert {name: entry["calls"] for name, entry in stats.items()} == {
+        "scene": 1,
+        "gdal_open": 2,
+        "read": 1,
+    }
+    # the outer stage includes the time of the inner ones
+    inner = stats["gdal_open"]["seconds"] + stats["read"]["seconds"]
+    assert stats["scene"]["seconds"] >= inner
+    assert stats["scene"]["bytes"] == 0
+
+
+def test_scene_counters_and_log(recording, tmp_path):
+    log = str(tmp_path / "scenes.jsonl")
+    instrument.enable(log)
+    with instrument.stage("list_files"):
+        pass
+    for scene_id, nbytes in (("s1", 5), ("s2", 7)):
+        instrument.begin_scene()
+        with instrument.stage("read") as stage:
+            stage.add_bytes(nbytes)
+        stats = instrument.end_scene(scene_id)
+        assert stats["read"][0] == 1 and stats["read"][2] == nbytes
+
+    with open(log) as fp:
+        entries = [json.loads(line) for line in fp]
+    assert [entry["scene_id"] for entry in entries] == ["s1", "s2"]
+    assert entries[1]["stages"]["read"]["bytes"] == 7
+    assert "list_files" not in entries[0]["stages"]
+    totals = instrument.snapshot()
+    assert totals["read"]["calls"] == 2 and totals["read"]["bytes"] == 12
+    assert totals["list_files"]["calls"] == 1
+
+
+def test_merge_and_report(recording):
+    with instrument.stage("scale"):
+        pass
+    # counters of a unit run in a worker process
+    instrument.merge({"read_points": [3, 1.5, 2000000], "scale": [1, 0.0, 0]})
+    stats = instrument.snapshot()
+    assert stats["read_points"] == {"calls": 3, "seconds": 1.5, "bytes": 2000000}
+    assert stats["scale"]["calls"] == 2
+
+    lines = instrument.summary().splitlines()
+    assert lines[0].split() == ["stage", "calls", "seconds", "MB", "read"]
+    # slowest stage first
+    assert lines[1].split() == ["read_points", "3", "1.5000", "2.00"]
+    assert lines[2].split()[:2] == ["scale", "2"]
+    assert len(lines) == 3
+
+
+def test_dump_json(recording, tmp_path):
+    instrument.add("transform", 0.25, 2, 16)
+    path = str(tmp_path / "stages.json")
+    instrument.dump_json(path)
+    with open(path) as fp:
+        assert json.load(fp) == {
+            "transform": {"calls": 2, "seconds": 0.25, "bytes": 16}
+        }
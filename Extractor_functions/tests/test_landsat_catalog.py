@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import landsat_catalog
+
+
+def make_scene(volume, sensor, path, row, date):
+    folder = os.path.join(
+        volume,
+        sensor,
+        "01",
+        path,
+        row,
+        "%s_L1TP_%s%s_%s_20170223_01_T1" % (sensor, path, row, date),
+    )
+    os.makedirs(folder)
+    return folder
+
+
+def touch(folder, step=1):
+    """Move the mtime of a folder forward, as a new listing would."""
+    mtime_ns = os.stat(folder).st_mtime_ns + step * 10**9
+    os.utime(folder, ns=(mtime_ns, mtime_ns))
+
+
+def test_query_by_path_row_and_dates(tmp_path):
+    vol1, vol2 = str(tmp_path / "tq-data01"), str(tmp_path / "tq-data02")
+    a = make_scene(vol1, "LC08", "023", "032", "20160415")
+    b = make_scene(vol2, "LE07", "023", "032", "20160407")
+    make_scene(vol1, "LC08", "023", "032", "20161115")
+    c = make_scene(vol1, "LC08", "024", "032", "20160501")
+    os.makedirs(os.path.join(vol1, "LC08", "01", "023", "032", "not_a_scene"))
+
+    catalog = landsat_catalog.LandsatCatalog(
+        str(tmp_path / "db" / "c.db"), [vol1, vol2]
+    )
+    assert catalog.refresh() == 3
+    tar_list = catalog.query(
+        [("023", "032"), ("024", "032"), ("025", "032")], "20160401", "20161001"
+    )
+    assert tar_list == {"023-032": [b, a], "024-032": [c], "025-032": []}
+    catalog.close()
+
+
+def test_refresh_relists_changed_row_dirs_only(tmp_path):
+    volume = str(tmp_path / "tq-data01")
+    a = make_scene(volume, "LC08", "023", "032", "20160415")
+    make_scene(volume, "LC08", "024", "032", "20160501")
+    path_rows = [("023", "032"), ("024", "032")]
+
+    catalog = landsat_catalog.LandsatCatalog(str(tmp_path / "c.db"), [volume])
+    assert catalog.refresh(path_rows) == 2
+    assert catalog.refresh(path_rows) == 0
+
+    b = make_scene(volume, "LC08", "023", "032", "20160517")
+    touch(os.path.dirname(b))
+    assert catalog.refresh(path_rows) == 1
+    assert catalog.query(path_rows[:1], "20160101", "20161231") == {"023-032": [a, b]}
+
+    # a row directory that disappeared loses its scenes
+    shutil.rmtree(os.path.dirname(a))
+    assert catalog.refresh(path_rows) == 1
+    assert catalog.query(path_rows[:1], "20160101", "20161231") == {"023-032": []}
+    catalog.close()
+
+
+def test_catalog_persists_between_runs(tmp_path):
+    volume = str(tmp_path / "tq-data01")
+    a = make_scene(volume, "LC08", "023", "032", "20160415")
+    db_path = str(tmp_path / "c.db")
+    catalog = landsat_catalog.LandsatCatalog(db_path, [volume])
+    catalog.refresh()
+    catalog.close()
+
+    catalog = landsat_catalog.LandsatCatalog(db_path, [volume])
+    assert catalog.refresh() == 0
+    assert catalog.query([("023", "032")], "20160415", "20160415") == {"023-032": [a]}
+    catalog.close()
+
+
+def test_scene_date():
+    assert (
+        landsat_catalog.scene_date("/x/LC08_L1TP_023032_20160415_20170223_01_T1")
+        == "20160415"
+    )
+    assert landsat_catalog.scene_date("/x/LC08_L1TP_023032") is None
+    assert (
+        landsat_catalog.scene_date("/x/LC08_L1TP_023032_2016041_20170223_01_T1") is None
+    )
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pytest
+
+ogr = pytest.importorskip("osgeo.ogr")
+from osgeo import osr
+
+import landsat_index
+
+# two WRS-2 scenes overlapping between -90 and -89 degrees of longitude
+SCENES = [
+    (23, 32, "POLYGON ((-91 40, -89 40, -89 42, -91 42, -91 40))"),
+    (24, 32, "POLYGON ((-90 40, -88 40, -88 42, -90 42, -90 40))"),
+]
+LATS = np.array([41.0, 41.0, 41.0, 45.0, 40.5])
+LONS = np.array([-90.5, -89.5, -88.5, 0.0, -88.2])
+
+
+def write_shapefile(path, scenes):
+    driver = ogr.GetDriverByName("ESRI Shapefile")
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    datasource = driver.CreateDataSource(path)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    layer = datasource.CreateLayer("wrs2_descending", srs, ogr.wkbPolygon)
+    for name in ("PATH", "ROW"):
+        layer.CreateField(ogr.FieldDefn(name, ogr.OFTInteger))
+    for path_num, row_num, wkt in scenes:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField("PATH", path_num)
+        feature.SetField("ROW", row_num)
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+        feature = None
+    datasource = None
+
+
+@pytest.fixture
+def shapefile(tmp_path):
+    path = str(tmp_path / "wrs2_descending.shp")
+    write_shapefile(path, SCENES)
+    return path
+
+
+def check_lookup(conv):
+    point_idx, paths, rows = conv.get_wrs_many(LATS, LONS)
+    assert point_idx.tolist() == [0, 1, 1, 2, 4]
+    assert paths.tolist() == [23, 23, 24, 24, 24]
+    assert rows.tolist() == [32] * 5
+    assert conv.get_wrs(41.0, -89.5) == [
+        {"path": 23, "row": 32},
+        {"path": 24, "row": 32},
+    ]
+    assert conv.get_wrs(45.0, 0.0) == []
+
+
+def test_get_wrs_many(shapefile):
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+
+
+def test_shapely_1_fallback(shapefile, monkeypatch):
+    monkeypatch.setattr(landsat_index, "shapely_points", None)
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+
+
+def count_shapefile_reads(monkeypatch):
+    reads = []
+    read_shapefile = landsat_index.ConvertToWRS._read_shapefile
+
+    def counting(self):
+        reads.append(self.shapefile_path)
+        return read_shapefile(self)
+
+    monkeypatch.setattr(landsat_index.ConvertToWRS, "_read_shapefile", counting)
+    return reads
+
+
+def test_cache_follows_the_shapefile(shapefile, monkeypatch):
+    reads = count_shapefile_reads(monkeypatch)
+    conv = landsat_index.ConvertToWRS(shapefile)
+    assert conv.cache_path == shapefile[: -len(".shp")] + ".cache.npz"
+    check_lookup(conv)
+    assert len(reads) == 1 and os.path.exists(conv.cache_path)
+
+    # a new instance loads the cache
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+    assert len(reads) == 1
+
+    # a touched shapefile (same size) rebuilds the cache
+    mtime_ns = os.stat(shapefile).st_mtime_ns + 10**9
+    os.utime(shapefile, ns=(mtime_ns, mtime_ns))
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+    assert len(reads) == 2
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+    assert len(reads) == 2
+
+    # so does a touched .dbf, which holds the paths and rows
+    dbf = shapefile[: -len(".shp")] + ".dbf"
+    os.utime(dbf, ns=(mtime_ns, mtime_ns))
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+    assert len(reads) == 3
+
+    # a rewritten shapefile gives its own scenes
+    write_shapefile(shapefile, SCENES[:1] + [(25, 33, SCENES[1][2])])
+    conv = landsat_index.ConvertToWRS(shapefile)
+    assert conv.get_wrs(41.0, -88.5) == [{"path": 25, "row": 33}]
+    assert len(reads) == 4
+
+
+def test_unreadable_cache_is_rebuilt(shapefile, monkeypatch):
+    reads = count_shapefile_reads(monkeypatch)
+    conv = landsat_index.ConvertToWRS(shapefile)
+    conv.get_wrs(41.0, -89.5)
+    with open(conv.cache_path, "wb") as fp:
+        fp.write(b"not a cache")
+    check_lookup(landsat_index.ConvertToWRS(shapefile))
+    assert len(reads) == 2
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("osgeo")
+
+import Landsat_Ref_Mod
+
+
+def test_default_lut_accepts_legacy_values():
+    lut = Landsat_Ref_Mod.build_qa_lut()
+    for value in (66, 130, 322, 386, 834, 898, 1346):
+        assert lut[value], value
+
+
+def test_default_lut_rejects_cloud_shadow_fill_water():
+    lut = Landsat_Ref_Mod.build_qa_lut()
+    # fill, water, cloud shadow, cloud, high cloud confidence
+    for value in (1, 68, 136, 352, 194):
+        assert not lut[value], value
+
+
+def test_flags():
+    assert Landsat_Ref_Mod.build_qa_lut(water=True)[68]
+    assert not Landsat_Ref_Mod.build_qa_lut(clear=False)[66]
+    assert Landsat_Ref_Mod.build_qa_lut(max_cloud_confidence=3)[194]
+
+
+def test_qa_flags_change_the_cache_key(tmp_path, monkeypatch):
+    import scene_cache
+
+    sensor = Landsat_Ref_Mod.LandsatSR()
+    assert sensor.name == Landsat_Ref_Mod.LandsatSR().name
+    db_path = str(tmp_path / "c.db")
+    cache = scene_cache.SceneCache(db_path, sensor.name, sensor.version)
+    cache.put("scene", "k", (1, 1), "20160415", ["B"], [0], [[0.5]])
+    cache.close()
+
+    monkeypatch.setattr(
+        Landsat_Ref_Mod, "CLEAR_QA_LUT", Landsat_Ref_Mod.build_qa_lut(water=True)
+    )
+    other = Landsat_Ref_Mod.LandsatSR()
+    assert other.name != sensor.name
+    assert other.name.startswith("landsat_sr_qa")
+    cache = scene_cache.SceneCache(db_path, other.name, other.version)
+    assert cache.get("scene", "k", (1, 1)) is None
+
+
+@pytest.mark.parametrize("window_size", [0, 2, 4, -3, 3.0, "3"])
+def test_invalid_window_size_is_rejected(window_size):
+    with pytest.raises(ValueError):
+        Landsat_Ref_Mod.LandsatSR(window_size=window_size)
+
+
+def test_window_stats_are_checked():
+    with pytest.raises(ValueError):
+        Landsat_Ref_Mod.LandsatSR(window_size=3, window_stats=["mean", "mode"])
+    sensor = Landsat_Ref_Mod.LandsatSR(window_size=3, window_stats=["count", "max"])
+    assert sensor.columns()[:2] == ["B_band_count", "B_band_max"]
+    assert Landsat_Ref_Mod.LandsatSR(window_size=1).window_size is None
@@ -0,0 +1,97 @@
+import os
+import shutil
+
+import modis_catalog
+
+
+def make_granule(data_path, product, tile, date):
+    """Write an empty hdf granule into its YYYY.MM.DD folder."""
+    date_dir = os.path.join(data_path, "%s.%s.%s" % (date[:4], date[4:6], date[6:]))
+    if not os.path.isdir(date_dir):
+        os.makedirs(date_dir)
+    path = os.path.join(date_dir, "%s.A%s.%s.006.2016101.hdf" % (product, date, tile))
+    open(path, "w").close()
+    return path
+
+
+def touch(folder, step=1):
+    """Move the mtime of a folder forward, as a new listing would."""
+    mtime_ns = os.stat(folder).st_mtime_ns + step * 10**9
+    os.utime(folder, ns=(mtime_ns, mtime_ns))
+
+
+def test_query_by_tile_and_dates(tmp_path):
+    mod, myd = str(tmp_path / "MOD11A1.006"), str(tmp_path / "MYD11A1.006")
+    a = make_granule(mod, "MOD11A1", "h11v04", "20160401")
+    b = make_granule(mod, "MOD11A1", "h11v04", "20160402")
+    c = make_granule(myd, "MYD11A1", "h11v04", "20160401")
+    d = make_granule(mod, "MOD11A1", "h12v04", "20160402")
+    make_granule(mod, "MOD11A1", "h11v04", "20160501")
+    open(os.path.join(mod, "2016.04.01", "notes.txt"), "w").close()
+    os.makedirs(os.path.join(mod, "not_a_date"))
+
+    catalog = modis_catalog.ModisCatalog(str(tmp_path / "db" / "m.db"), [mod, myd])
+    assert catalog.refresh() == 4
+    hdf_dict = catalog.query(["h11v04", "h12v04", "h13v04"], "20160401", "20160430")
+    assert hdf_dict == {"h11v04": [a, b, c], "h12v04": [d], "h13v04": []}
+    assert catalog.query(["h11v04"], "20160402", "20160401") == {"h11v04": []}
+    catalog.close()
+
+
+def test_refresh_relists_changed_date_folders_in_range(tmp_path):
+    mod = str(tmp_path / "MOD11A1.006")
+    a = make_granule(mod, "MOD11A1", "h11v04", "20160401")
+    make_granule(mod, "MOD11A1", "h11v04", "20160501")
+
+    catalog = modis_catalog.ModisCatalog(str(tmp_path / "m.db"), [mod])
+    assert catalog.refresh("20160401", "20160430") == 1
+    assert catalog.query(["h11v04"], "20160101", "20161231") == {"h11v04": [a]}
+    assert catalog.refresh("20160401", "20160430") == 0
+
+    b = make_granule(mod, "MOD11A1", "h12v04", "20160401")
+    touch(os.path.dirname(b))
+    assert catalog.refresh("20160401", "20160430") == 1
+    assert catalog.query(["h12v04"], "20160401", "20160401") == {"h12v04": [b]}
+    catalog.close()
+
+
+def test_folder_to_date():
+    assert modis_catalog.folder_to_date("2016.04.01") == "20160401"
+    assert modis_catalog.folder_to_date("2016.4.1") == "20160401"
+    assert modis_catalog.folder_to_date("MOD11A1") is None
+
+
+def test_refresh_drops_removed_date_folders(tmp_path):
+    mod = str(tmp_path / "MOD11A1.006")
+    make_granule(mod, "MOD11A1", "h11v04", "20160401")
+    b = make_granule(mod, "MOD11A1", "h11v04", "20160402")
+    c = make_granule(mod, "MOD11A1", "h11v04", "20160501")
+
+    catalog = modis_catalog.ModisCatalog(str(tmp_path / "m.db"), [mod])
+    catalog.refresh()
+    shutil.rmtree(os.path.dirname(c))
+    shutil.rmtree(os.path.join(mod, "2016.04.01"))
+    # only the removed folders inside the refreshed range are dropped
+    catalog.refresh("20160401", "20160430")
+    assert catalog.query(["h11v04"], "20160101", "20161231") == {"h11v04": [b, c]}
+    catalog.refresh()
+    assert catalog.query(["h11v04"], "20160101", "20161231") == {"h11v04": [b]}
+
+    # a folder that comes back is listed again
+    a = make_granule(mod, "MOD11A1", "h11v04", "20160401")
+    assert catalog.refresh() == 1
+    assert catalog.query(["h11v04"], "20160101", "20161231") == {"h11v04": [a, b]}
+    catalog.close()
+
+
+def test_query_follows_order_of_data_paths(tmp_path):
+    mod, myd = str(tmp_path / "MOD11A1.006"), str(tmp_path / "MYD11A1.006")
+    a = make_granule(mod, "MOD11A1", "h11v04", "20160401")
+    b = make_granule(mod, "MOD11A1", "h11v04", "20160402")
+    c = make_granule(myd, "MYD11A1", "h11v04", "20160401")
+
+    catalog = modis_catalog.ModisCatalog(str(tmp_path / "m.db"), [myd, mod])
+    catalog.refresh()
+    hdf_dict = catalog.query(["h11v04"], "20160401", "20160430")
+    assert hdf_dict == {"h11v04": [c, a, b]}
+    catalog.close()
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import modis_index
+
+
+@pytest.mark.parametrize(
+    "lat, lon, tile",
+    [
+        (0.0, 0.0, "h18v09"),
+        (41.88, -87.63, "h11v04"),  # Chicago
+        (39.9, 116.4, "h26v05"),  # Beijing
+        (40.0001, 0.0, "h18v04"),
+        (40.0, 0.0, "h18v05"),
+        (39.9999, 0.0, "h18v05"),
+        (90.0, 0.0, "h18v00"),
+        (-90.0, 0.0, "h18v17"),
+        (0.0, -180.0, "h00v09"),
+        (0.0, 180.0, "h35v09"),
+        (10.0, 180.0, "h35v08"),
+    ],
+)
+def test_latlon_to_tile(lat, lon, tile):
+    h, v = modis_index.latlon_to_tile([lat], [lon])
+    assert modis_index.tile_name(h[0], v[0]) == tile
+
+
+def test_invalid_coordinates():
+    h, v = modis_index.latlon_to_tile([91.0, np.nan, 0.0], [0.0, 0.0, 181.0])
+    assert h.tolist() == [-1, -1, -1]
+    assert v.tolist() == [-1, -1, -1]
+
+
+def test_tile_pixel_edges():
+    h, v, row, col = modis_index.latlon_to_tile_pixel([0.0, -90.0], [0.0, 0.0])
+    assert (h.tolist(), v.tolist()) == ([18, 18], [9, 17])
+    assert (row.tolist(), col.tolist()) == ([0, 1199], [0, 0])
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+import MODIS_LST_Mod
+
+
+def scalar_lst(day_lst, day_qc, night_lst, night_qc):
+    """LST of one pixel with the former per-point QC rule."""
+    valid_lst_value = []
+    for lst, qc in ((day_lst, day_qc), (night_lst, night_qc)):
+        if qc == 0 or qc & 0x000F == 1:
+            if 7500 <= lst <= 65535:
+                valid_lst_value.append(lst * 0.02)
+    if len(valid_lst_value) == 0:
+        return -1
+    return float("%.2f" % np.mean(np.array(valid_lst_value)))
+
+
+def test_get_lst_values_matches_scalar_rule():
+    rng = np.random.default_rng(0)
+    n = 5000
+    qc_values = np.array([0, 1, 2, 3, 17, 65, 81, 129, 255])
+    day_lst = rng.integers(7000, 16000, n)
+    night_lst = rng.integers(7000, 16000, n)
+    day_lst[:10] = 7500
+    night_lst[:10] = 7499
+    day_qc = rng.choice(qc_values, n)
+    night_qc = rng.choice(qc_values, n)
+
+    values = MODIS_LST_Mod.get_lst_values(day_lst, day_qc, night_lst, night_qc)
+    expected = [
+        scalar_lst(*pixel) for pixel in zip(day_lst, day_qc, night_lst, night_qc)
+    ]
+    np.testing.assert_allclose(values, expected, atol=1e-9)
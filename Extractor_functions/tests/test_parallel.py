@@ -0,0 +1,80 @@
+import parallel
+
+UNITS = [(n, 7) for n in range(20, 40)]
+
+
+def test_workers_give_serial_results_in_order():
+    serial = list(parallel.map_units(divmod, UNITS))
+    assert serial == [divmod(*unit) for unit in UNITS]
+    assert list(parallel.map_units(divmod, UNITS, workers=3)) == serial
+
+
+def test_single_unit_runs_in_this_process():
+    calls = []
+
+    def record(value):
+        calls.append(value)
+        return value
+
+    # a local function cannot be pickled, so this only works serially
+    assert list(parallel.map_units(record, [(1,)], workers=4)) == [1]
+    assert list(parallel.map_units(record, [(2,), (3,)])) == [2, 3]
+    assert calls == [1, 2, 3]
+
+
+def test_budget_keeps_results_and_estimates_each_unit_once():
+    estimated = []
+
+    def cost(unit):
+        estimated.append(unit)
+        return 10
+
+    for budget in (5, 25, 1000):
+        del estimated[:]
+        results = parallel.map_units(divmod, UNITS, 3, cost, budget)
+        assert list(results) == [divmod(*unit) for unit in UNITS]
+        assert estimated == UNITS
+
+
+def test_prefetch_keeps_order_and_bounds_the_units_ahead():
+    started = []
+
+    def load(n, d):
+        started.append(n)
+        return divmod(n, d)
+
+    for depth in (0, 1, 3):
+        del started[:]
+        loaded = parallel.prefetch(load, UNITS, depth)
+        assert next(loaded) == divmod(*UNITS[0])
+        # the unit taken and at most depth units loaded ahead
+        assert len(started) <= depth + 1
+        assert list(loaded) == [divmod(*unit) for unit in UNITS[1:]]
+        assert sorted(started) == [n for n, _ in UNITS]
+
+
+def test_prefetch_stops_with_the_caller():
+    started = []
+
+    def load(n, d):
+        started.append(n)
+        return n
+
+    loaded = parallel.prefetch(load, UNITS, 2)
+    assert [next(loaded), next(loaded)] == [20, 21]
+    loaded.close()
+    assert len(started) <= 4
+
+
+def test_prefetch_budget_loads_one_unit_at_a_time():
+    started = []
+
+    def load(n, d):
+        started.append(n)
+        return n
+
+    loaded = parallel.prefetch(load, UNITS, 3, cost=lambda unit: 10, budget=15)
+    for n, _ in UNITS:
+        assert next(loaded) == n
+        assert started[-1] == n
+    loaded.close()
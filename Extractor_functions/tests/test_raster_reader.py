@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip("osgeo.gdal")
+
+import raster_reader
+
+
+class ArrayBand:
+    """Minimal raster band over a numpy array, with a chosen block size."""
+
+    DataType = gdal.GDT_Int16
+
+    def __init__(self, data, block_size):
+        self.data = data
+        self.XSize = data.shape[1]
+        self.YSize = data.shape[0]
+        self.block_size = block_size
+
+    def GetBlockSize(self):
+        return list(self.block_size)
+
+    def ReadAsArray(self, xoff=0, yoff=0, xsize=None, ysize=None):
+        if xsize is None:
+            xsize, ysize = self.XSize, self.YSize
+        return self.data[yoff : yoff + ysize, xoff : xoff + xsize].copy()
+
+
+def random_case(rng):
+    ysize, xsize = rng.integers(1, 120, 2)
+    data = rng.integers(-1000, 1000, (ysize, xsize)).astype(np.int16)
+    band = ArrayBand(data, (int(rng.integers(1, 40)), int(rng.integers(1, 40))))
+    n = int(rng.integers(1, 60))
+    # a cluster of points, or points spread over the raster
+    if rng.random() < 0.5:
+        px = rng.integers(0, max(xsize // 4, 1), n)
+        py = rng.integers(0, max(ysize // 4, 1), n)
+    else:
+        px = rng.integers(0, xsize, n)
+        py = rng.integers(0, ysize, n)
+    valid = rng.random(n) < 0.9
+    return data, band, px, py, valid
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_read_points_matches_indexing(seed):
+    data, band, px, py, valid = random_case(np.random.default_rng(seed))
+    values = raster_reader.read_points(band, px, py, valid)
+    np.testing.assert_array_equal(values[valid], data[py[valid], px[valid]])
+    assert (values[~valid] == 0).all()
+
+
+@pytest.mark.parametrize("seed", range(100))
+@pytest.mark.parametrize("size", [1, 3, 5])
+def test_read_windows_matches_indexing(seed, size):
+    data, band, px, py, valid = random_case(np.random.default_rng(seed))
+    patches = raster_reader.read_windows(band, px, py, size, valid)
+
+    r = size // 2
+    padded = np.full((data.shape[0] + 2 * r, data.shape[1] + 2 * r), np.nan)
+    padded[r : r + data.shape[0], r : r + data.shape[1]] = data
+    for i in range(len(px)):
+        if valid[i]:
+            expected = padded[py[i] : py[i] + size, px[i] : px[i] + size]
+            np.testing.assert_array_equal(patches[i], expected)
+        else:
+            assert np.isnan(patches[i]).all()
+
+
+def test_window_stats_ignore_masked_pixels():
+    patches = np.array(
+        [
+            [[1.0, 2.0, np.nan], [4.0, np.nan, 6.0], [7.0, 8.0, 9.0]],
+            [[np.nan] * 3] * 3,
+            [[5.0] * 3] * 3,
+        ]
+    )
+    stats = raster_reader.window_stats(
+        patches, ("mean", "median", "std", "min", "max", "count")
+    )
+    clear = [1.0, 2.0, 4.0, 6.0, 7.0, 8.0, 9.0]
+    assert stats["mean"][0] == pytest.approx(np.mean(clear))
+    assert stats["median"][0] == 6.0
+    assert stats["std"][0] == pytest.approx(np.std(clear))
+    assert (stats["min"][0], stats["max"][0]) == (1.0, 9.0)
+    assert stats["count"].tolist() == [7.0, 0.0, 9.0]
+    for stat in ("mean", "median", "std", "min", "max"):
+        assert np.isnan(stats[stat][1])
+        assert stats[stat][2] == (0.0 if stat == "std" else 5.0)
+
+
+
+
+def test_window_stats_of_no_points():
+    # e.g. a scene whose windows are all cloudy
+    stats = raster_reader.window_stats(np.zeros((0, 3, 3)), ("mean", "count"))
+    assert stats["mean"].shape == (0,)
+    assert stats["count"].shape == (0,)
+
+
+def test_large_reads_fall_back_to_blocks():
+    band = ArrayBand(np.zeros((1000, 1000), dtype=np.int16), (100, 100))
+    px, py = np.meshgrid(np.arange(0, 1000, 50), np.arange(0, 1000, 50))
+    px, py = px.ravel(), py.ravel()
+    assert raster_reader.choose_read_mode(band, px, py, max_read_mb=0) == "full"
+    assert raster_reader.choose_read_mode(band, px, py, max_read_mb=1) == "blocks"
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+import result_cube
+
+
+def test_shared_points_get_one_id():
+    builder = result_cube.CubeBuilder(["B", "G"], 4)
+    assert builder.add_points([(1.0, 2.0), (3.0, 4.0)]).tolist() == [0, 1]
+    assert builder.add_points([(3.0, 4.0), (5.0, 6.0)]).tolist() == [1, 2]
+
+
+def test_to_legacy_gives_dict_format():
+    builder = result_cube.CubeBuilder(["B", "G"], 4)
+    ids = builder.add_points([(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)])
+    builder.add("20160117", ids[1:2], [[0.1, 0.4]])
+    builder.add("20160101", ids[:2], [[0.5, -1], [0.2, 0.3]])
+    # a scene with a band missing
+    builder.add("20160202", ids[:1], [[0.7]], bands=["G"])
+    cube = builder.build()
+
+    assert cube.dates.tolist() == ["20160101", "20160117", "20160202"]
+    assert cube.values.shape == (3, 3, 2)
+    assert np.isnan(cube.values[2]).all()
+    expected = {
+        ("1.000000", "2.000000"): {
+            "B": [("20160101", 0.5)],
+            "G": [("20160101", -1.0), ("20160202", 0.7)],
+        },
+        ("3.000000", "4.000000"): {
+            "B": [("20160101", 0.2), ("20160117", 0.1)],
+            "G": [("20160101", 0.3), ("20160117", 0.4)],
+        },
+    }
+    assert cube.to_legacy(keep_empty=False) == expected
+    expected[("5.000000", "6.000000")] = {"B": [], "G": []}
+    assert cube.to_legacy() == expected
+
+
+def test_tiled_points_stores_shared_points_once():
+    tiled = result_cube.tiled_points(
+        {"a": [(1.0, 2.0), (3.0, 4.0)], "b": [(5.0, 6.0), (1.0, 2.0)], "c": []}
+    )
+    assert tiled.lats.tolist() == [1.0, 3.0, 5.0]
+    assert tiled.lons.tolist() == [2.0, 4.0, 6.0]
+    assert {k: v.tolist() for k, v in tiled.tiles.items()} == {
+        "a": [0, 1],
+        "b": [2, 0],
+        "c": [],
+    }
+
+
+def test_point_index_ids_and_keys():
+    points = result_cube.PointIndex()
+    assert points.add_points([(1.0, 2.0), (3.0, 4.0)]).tolist() == [0, 1]
+    ids = points.add_points(np.array([3.0, 5.0]), np.array([4.0, 6.0]))
+    assert ids.tolist() == [1, 2]
+    assert points.keys[2] == ("5.000000", "6.000000")
+    assert points.lats.tolist() == [1.0, 3.0, 5.0]
+
+
+def scene_batch(scene_id, date, ids, values):
+    values = np.array(values, dtype=np.float32)
+    return result_cube.SceneBatch(scene_id, date, ["B", "G"], ids, None, None, values)
+
+
+def test_merge_records_matches_cube():
+    points = result_cube.PointIndex()
+    ids = points.add_points([(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)])
+    batches = [
+        scene_batch("s1", "20160101", ids[:2], [[0.5, -1], [0.2, 0.3]]),
+        scene_batch("s2", "20160117", ids[1:], [[0.1, 0.4], [-1, 0.6]]),
+    ]
+    records = {}
+    builder = result_cube.CubeBuilder(["B", "G"], 4, points, empty_records=False)
+    for batch in batches:
+        result_cube.merge_records(records, batch, ["B", "G"], 4)
+        builder.add_batch(batch)
+    assert builder.build().to_legacy() == result_cube.legacy_records(records, points)
+
+
+def test_cube_keeps_valid_value_of_overlapping_scenes():
+    points = result_cube.PointIndex()
+    ids = points.add_points([(1.0, 2.0)])
+    builder = result_cube.CubeBuilder(["B"], 4, points)
+    builder.add("20160101", ids, [[0.5]])
+    builder.add("20160101", ids, [[-1]])
+    assert builder.build().values[0, 0, 0] == 0.5
+
+
+def test_to_legacy_lists_values_of_overlapping_scenes():
+    points = result_cube.PointIndex()
+    ids = points.add_points([(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)])
+    # two WRS-2 rows of the same date sharing the second point
+    batches = [
+        scene_batch("s1", "20160101", ids[:2], [[0.5, -1], [0.2, 0.3]]),
+        scene_batch("s2", "20160101", ids[1:], [[0.1, -1], [-1, 0.6]]),
+        scene_batch("s3", "20160117", ids[1:2], [[0.7, 0.8]]),
+    ]
+    records = {}
+    builder = result_cube.CubeBuilder(["B", "G"], 4, points)
+    for batch in batches:
+        result_cube.merge_records(records, batch, ["B", "G"], 4)
+        builder.add_batch(batch)
+    res = result_cube.legacy_records(records, points)
+    for record in res.values():
+        for band_values in record.values():
+            band_values.sort()
+    cube = builder.build()
+    assert cube.to_legacy() == res
+    # the cube holds one value per date: the valid one, else the last one
+    assert cube.values[1, 0].tolist() == [pytest.approx(0.1), pytest.approx(0.3)]
+
+
+def test_point_index_numbers_new_points_in_order():
+    points = result_cube.PointIndex()
+    points.add_points([(3.0, 4.0)])
+    ids = points.add_points([(1.0, 2.0), (3.0, 4.0), (1.0, 2.0), (0.5, 9.0)])
+    assert ids.tolist() == [1, 0, 1, 2]
+    assert points.lats.tolist() == [3.0, 1.0, 0.5]
+    assert points.lons.tolist() == [4.0, 2.0, 9.0]
+    assert points.add_points([]).tolist() == []
+    assert len(points) == 3
+
+
+def test_tiles_of_matches_groups_point_indices():
+    lats = np.array([1.0, 3.0, 5.0, 7.0])
+    lons = np.array([2.0, 4.0, 6.0, 8.0])
+    # point 1 in two tiles, point 3 in none
+    tiled = result_cube.tiles_of_matches(
+        lats, lons, [0, 1, 1, 2], [23032, 23032, 23033, 22032]
+    )
+    assert tiled.lats.dtype == np.float64
+    assert list(tiled.tiles) == [23032, 23033, 22032]
+    assert {k: v.tolist() for k, v in tiled.tiles.items()} == {
+        23032: [0, 1],
+        23033: [1],
+        22032: [2],
+    }
+    assert result_cube.tile_lists(tiled) == {
+        23032: [(1.0, 2.0), (3.0, 4.0)],
+        23033: [(3.0, 4.0)],
+        22032: [(5.0, 6.0)],
+    }
+    # round trip through the legacy form
+    again = result_cube.tiled_points(result_cube.tile_lists(tiled))
+    assert again.lats.tolist() == [1.0, 3.0, 5.0]
+
+
+def test_tiles_of_no_matches():
+    tiled = result_cube.tiles_of_matches([1.0], [2.0], [], [])
+    assert tiled.tiles == {}
+    assert tiled.lats.tolist() == [1.0]
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+
+import scene_cache
+
+
+def write(path, data):
+    with open(path, "w") as fp:
+        fp.write(data)
+
+
+def test_hit_and_miss(tmp_path):
+    cache = scene_cache.SceneCache(str(tmp_path / "db" / "c.db"), "landsat_sr", 1)
+    key = scene_cache.points_hash(np.array([40.0, 41.0]), np.array([-90.0, -89.0]))
+    stamp = (123, 456)
+    assert cache.get("scene", key, stamp) is None
+
+    values = np.array([[0.5, -1.0], [0.25, 0.125]], dtype=np.float32)
+    cache.put("scene", key, stamp, "20160415", ["B", "G"], [0, 1], values)
+    file_date, bands, idx, cached = cache.get("scene", key, stamp)
+    assert (file_date, bands, idx.tolist()) == ("20160415", ["B", "G"], [0, 1])
+    np.testing.assert_array_equal(cached, values)
+
+    other_key = scene_cache.points_hash(
+        np.array([41.0, 40.0]), np.array([-89.0, -90.0])
+    )
+    assert cache.get("scene", other_key, stamp) is None
+    assert cache.get("other scene", key, stamp) is None
+    assert cache.get("scene", key, (124, 456)) is None
+    assert cache.get("scene", key, (123, 457)) is None
+    cache.close()
+
+    # entries of another extractor or version are misses
+    db_path = str(tmp_path / "db" / "c.db")
+    assert (
+        scene_cache.SceneCache(db_path, "sentinel_sr", 1).get("scene", key, stamp)
+        is None
+    )
+    assert (
+        scene_cache.SceneCache(db_path, "landsat_sr", 2).get("scene", key, stamp)
+        is None
+    )
+    assert scene_cache.SceneCache(db_path, "landsat_sr", "1").get("scene", key, stamp)
+
+
+def test_put_replaces_entry(tmp_path):
+    cache = scene_cache.SceneCache(str(tmp_path / "c.db"), "landsat_sr", 1)
+    cache.put("scene", "k", (1, 1), "20160415", ["B"], [0], [[0.5]])
+    cache.put("scene", "k", (2, 1), "20160415", ["B"], [0, 2], [[0.25], [0.75]])
+    assert cache.get("scene", "k", (1, 1)) is None
+    _, _, idx, values = cache.get("scene", "k", (2, 1))
+    assert idx.tolist() == [0, 2]
+    assert values.ravel().tolist() == [0.25, 0.75]
+
+
+def test_scene_stamp_follows_file_changes(tmp_path):
+    folder = tmp_path / "LC08_L1TP_023032_20160415_20170223_01_T1"
+    folder.mkdir()
+    band = str(folder / "band1.tif")
+    write(band, "abc")
+    write(str(folder / "band2.tif"), "de")
+    stamp = scene_cache.scene_stamp(str(folder))
+    assert stamp[1] == 5
+    assert scene_cache.scene_stamp(str(folder)) == stamp
+    assert scene_cache.scene_stamp(band)[1] == 3
+
+    # a rewritten file with the same size
+    mtime_ns = os.stat(band).st_mtime_ns + 10**9
+    os.utime(band, ns=(mtime_ns, mtime_ns))
+    assert scene_cache.scene_stamp(str(folder)) == (mtime_ns, 5)
+    assert scene_cache.scene_stamp(str(tmp_path / "missing")) == (0, 0)
+
+
+def test_points_hash_depends_on_order():
+    lats, lons = np.array([40.0, 41.0]), np.array([-90.0, -89.0])
+    assert scene_cache.points_hash(lats, lons) == scene_cache.points_hash(
+        lats.tolist(), lons.tolist()
+    )
+    assert scene_cache.points_hash(lats, lons) != scene_cache.points_hash(
+        lats[::-1], lons[::-1]
+    )
@@ -0,0 +1,83 @@
+import json
+import os
+
+import sentinel_catalog
+
+SAFE = "/tq-data05/sentinel/SAFE_sentinel"
+
+
+def make_product(home, tile_dir, date, granule=True):
+    """Write an empty product folder and return its path in the JSON list."""
+    year, month, day = date[:4], str(int(date[4:6])), str(int(date[6:]))
+    folder = "%s/%s/%s/%s/%s/S2A_MSIL2A_%sT170851.SAFE" % (
+        SAFE,
+        tile_dir,
+        year,
+        month,
+        day,
+        date,
+    )
+    os.makedirs(home + folder)
+    if granule:
+        os.makedirs(os.path.join(home + folder, "GRANULE", "L2A_T15TVG", "IMG_DATA"))
+    return folder
+
+
+def write_list(tmp_path, folders):
+    file_json = str(tmp_path / "total_list.json")
+    with open(file_json, "w") as fp:
+        json.dump(folders, fp)
+    return file_json
+
+
+def img_data(home, folder):
+    return os.path.join(home + folder, "GRANULE", "L2A_T15TVG", "IMG_DATA")
+
+
+def test_get_file_list_by_tile_and_dates(tmp_path):
+    home = str(tmp_path)
+    a = make_product(home, "15/T/VG", "20170501")
+    b = make_product(home, "15/T/VG", "20170421")
+    c = make_product(home, "15/T/VG", "20170601")
+    d = make_product(home, "5/Q/KB", "20170510")
+    e = make_product(home, "15/T/VG", "20170511", granule=False)
+    catalog = sentinel_catalog.SentinelCatalog(
+        write_list(tmp_path, [a, b, c, d, e, "/not/a/product"]), home
+    )
+
+    tar_list = catalog.get_file_list(
+        ["15TVG", "5QKB", "15TVG", "16TBL"], "20170421", "20170531"
+    )
+    assert tar_list == {
+        "15TVG": [img_data(home, b), img_data(home, a)],
+        "5QKB": [img_data(home, d)],
+        "16TBL": [],
+    }
+
+
+def test_get_products_dates_are_inclusive(tmp_path):
+    home = str(tmp_path)
+    a = make_product(home, "15/T/VG", "20170501")
+    b = make_product(home, "15/T/VG", "20170511")
+    catalog = sentinel_catalog.SentinelCatalog(write_list(tmp_path, [b, a]), home)
+    assert catalog.get_products("15TVG", "20170501", "20170511") == [
+        ("20170501", home + a),
+        ("20170511", home + b),
+    ]
+    assert catalog.get_products("15TVG", "20170502", "20170510") == []
+
+
+def test_list_is_loaded_once(tmp_path):
+    home = str(tmp_path)
+    a = make_product(home, "15/T/VG", "20170501")
+    file_json = write_list(tmp_path, [a])
+    catalog = sentinel_catalog.SentinelCatalog(file_json, home)
+    assert len(catalog.get_products("15TVG", "20170101", "20171231")) == 1
+    os.remove(file_json)
+    assert len(catalog.get_products("15TVG", "20170101", "20171231")) == 1
+
+
+def test_folder_pattern():
+    match = sentinel_catalog.FOLDER_PATTERN.search(SAFE + "/15/T/VG/2017/5/1/S2A")
+    assert match.groups() == ("15", "T", "VG", "2017", "5", "1")
+    assert sentinel_catalog.FOLDER_PATTERN.search(SAFE + "/15/T/VG/2017") is None
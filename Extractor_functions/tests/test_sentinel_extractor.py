@@ -0,0 +1,118 @@
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("osgeo")
+
+R10M = ["B02", "B03", "B04", "B08", "TCI", "AOT", "WVP"]
+R20M = ["B02", "B03", "B04", "B05", "B8A", "B11", "B12", "SCL"]
+
+
+class ConvertToMRGS:
+    """Stand-in for the MGRS lookup of sentinel_index, which is not part of
+    this repository; scene_files does not use it.
+    """
+
+    def get_mgrs(self, lat, lon):
+        return []
+
+
+@pytest.fixture
+def sentinel_extractor(monkeypatch):
+    stub = types.ModuleType("sentinel_index")
+    stub.ConvertToMRGS = ConvertToMRGS
+    monkeypatch.setitem(sys.modules, "sentinel_index", stub)
+    monkeypatch.delitem(sys.modules, "sentinel_extractor", raising=False)
+    import sentinel_extractor
+
+    yield sentinel_extractor
+    sys.modules.pop("sentinel_extractor", None)
+
+
+def make_product(tmp_path, sentinel_extractor):
+    """Write an IMG_DATA folder with the band files of both resolutions and
+    the 4 files of its cloud mask folder.
+    """
+    day = tmp_path / "SAFE_sentinel" / "15" / "T" / "VG" / "2017" / "5" / "1"
+    img_data = (
+        day / "S2A_MSIL2A_20170501T170851.SAFE" / "GRANULE" / "L2A_T15TVG" / "IMG_DATA"
+    )
+    for res_folder, bands in (("R10m", R10M), ("R20m", R20M)):
+        os.makedirs(str(img_data / res_folder))
+        for band in bands:
+            name = "T15TVG_20170501T170851_%s_%s.jp2" % (band, res_folder[1:])
+            (img_data / res_folder / name).write_bytes(b"")
+    qc_path = sentinel_extractor.get_qc_path(str(img_data))
+    os.makedirs(qc_path)
+    for name in ("cloud.img", "cloud.hdr", "a", "b"):
+        with open(os.path.join(qc_path, name), "w"):
+            pass
+    return str(img_data)
+
+
+def band_files(scene):
+    return [
+        {band_type: os.path.basename(path) for band_type, path in grid.items()}
+        for grid in scene.grids
+    ]
+
+
+def test_10m_band_map(tmp_path, sentinel_extractor):
+    folder = make_product(tmp_path, sentinel_extractor)
+    scene = sentinel_extractor.SentinelSR("10m").scene_files(folder)
+    assert scene.date == "20170501"
+    assert scene.qa_path.endswith("/cloudmask/sentinel/15/T/VG/2017/5/1/cloud.img")
+    assert scene.bands[-1] == "NIR_B08"
+    assert band_files(scene) == [
+        {
+            "B_band": "T15TVG_20170501T170851_B02_10m.jp2",
+            "G_band": "T15TVG_20170501T170851_B03_10m.jp2",
+            "R_band": "T15TVG_20170501T170851_B04_10m.jp2",
+            "NIR_B08": "T15TVG_20170501T170851_B08_10m.jp2",
+        },
+        {
+            "NIR_band": "T15TVG_20170501T170851_B8A_20m.jp2",
+            "SWIR1": "T15TVG_20170501T170851_B11_20m.jp2",
+            "SWIR2": "T15TVG_20170501T170851_B12_20m.jp2",
+        },
+    ]
+
+
+def test_20m_band_map(tmp_path, sentinel_extractor):
+    folder = make_product(tmp_path, sentinel_extractor)
+    scene = sentinel_extractor.SentinelSR("20m").scene_files(folder)
+    (grid,) = band_files(scene)
+    assert grid == {
+        "B_band": "T15TVG_20170501T170851_B02_20m.jp2",
+        "G_band": "T15TVG_20170501T170851_B03_20m.jp2",
+        "R_band": "T15TVG_20170501T170851_B04_20m.jp2",
+        "NIR_band": "T15TVG_20170501T170851_B8A_20m.jp2",
+        "SWIR1": "T15TVG_20170501T170851_B11_20m.jp2",
+        "SWIR2": "T15TVG_20170501T170851_B12_20m.jp2",
+    }
+
+
+def test_resolution_folders_are_listed_once(
+    tmp_path, monkeypatch, sentinel_extractor
+):
+    folder = make_product(tmp_path, sentinel_extractor)
+    listed = []
+    listdir = os.listdir
+
+    def counting_listdir(path):
+        listed.append(os.path.basename(path))
+        return listdir(path)
+
+    monkeypatch.setattr(sentinel_extractor.os, "listdir", counting_listdir)
+    sentinel_extractor.SentinelSR("10m").scene_files(folder)
+    # the cloud mask folder, then each resolution folder once
+    assert sorted(listed) == ["1", "R10m", "R20m"]
+
+
+def test_missing_resolution_folder(tmp_path, sentinel_extractor):
+    folder = make_product(tmp_path, sentinel_extractor)
+    os.rename(os.path.join(folder, "R10m"), os.path.join(folder, "R10m_old"))
+    assert sentinel_extractor.SentinelSR("10m").scene_files(folder) is None
+    assert sentinel_extractor.SentinelSR("20m").scene_files(folder) is not None
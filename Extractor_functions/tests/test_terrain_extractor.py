@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+import terrain_extractor
+
+
+def plane(east, north, dx=30.0, dy=30.0):
+    """3 x 3 DEM window of z = east * x + north * y (x east, y north, in
+    metres), row 0 being the northern row.
+    """
+    x = (np.arange(3) - 1) * dx
+    y = (1 - np.arange(3)) * dy
+    return (east * x[None, :] + north * y[:, None])[None]
+
+
+@pytest.mark.parametrize(
+    "east, north, expected",
+    [
+        # the aspect is the direction the slope faces, downhill
+        (0.0, -1.0, 0.0),
+        (-1.0, -1.0, 45.0),
+        (-1.0, 0.0, 90.0),
+        (-1.0, 1.0, 135.0),
+        (0.0, 1.0, 180.0),
+        (1.0, 1.0, 225.0),
+        (1.0, 0.0, 270.0),
+        (1.0, -1.0, 315.0),
+    ],
+)
+def test_aspect_of_each_quadrant(east, north, expected):
+    _, aspect = terrain_extractor.slope_aspect(plane(east, north), 30.0, 30.0)
+    assert aspect[0] == pytest.approx(expected)
+
+
+def test_aspect_on_non_square_pixels():
+    # gradients are per metre, so the pixel shape does not turn the aspect
+    patches = plane(-1.0, -1.0, dx=20.0, dy=30.0)
+    _, aspect = terrain_extractor.slope_aspect(patches, 20.0, 30.0)
+    assert aspect[0] == pytest.approx(45.0)
+
+
+def test_flat_patch():
+    slope, aspect = terrain_extractor.slope_aspect(np.full((1, 3, 3), 120.0), 30, 30)
+    assert slope[0] == 0.0
+    assert aspect[0] == -1.0
+
+
+def test_slope_of_known_gradient():
+    patches = np.concatenate([plane(0.5, 0.0), plane(0.3, 0.4), plane(1.0, 0.0)])
+    slope, _ = terrain_extractor.slope_aspect(patches, 30.0, 30.0)
+    expected = np.degrees(np.arctan([0.5, 0.5, 1.0]))
+    np.testing.assert_allclose(slope, expected)
+    assert slope[2] == pytest.approx(45.0)
+
+
+def test_no_data_centre():
+    patches = plane(0.5, 0.0)
+    patches[0, 1, 1] = np.nan
+    slope, aspect = terrain_extractor.slope_aspect(patches, 30.0, 30.0)
+    assert np.isnan(slope[0]) and np.isnan(aspect[0])
+
+
+def test_geographic_pixel_size_shrinks_with_latitude():
+    gt = (-90.0, 1 / 3600.0, 0.0, 41.0, 0.0, -1 / 3600.0)
+    dx, dy = terrain_extractor.geographic_pixel_size(gt, np.array([0.0, 60.0]))
+    equator = terrain_extractor.METERS_PER_DEGREE_LON / 3600.0
+    assert dx[0] == pytest.approx(equator)
+    assert dx[1] == pytest.approx(equator / 2)
+    np.testing.assert_allclose(dy, terrain_extractor.METERS_PER_DEGREE_LAT / 3600.0)
+
+
+def test_tile_index_assigns_border_points(tmp_path, monkeypatch):
+    folder = tmp_path / "dem"
+    folder.mkdir()
+    bboxes = {
+        "a.tif": [0.0, 0.0, 1.0, 1.0],
+        "b.tif": [1.0, 0.0, 2.0, 1.0],
+        "c.tif": [0.0, 1.0, 1.0, 2.0],
+    }
+    for name in bboxes:
+        (folder / name).write_bytes(b"")
+    monkeypatch.setattr(
+        terrain_extractor,
+        "tile_bbox",
+        lambda path: (bboxes[path.rsplit("/", 1)[-1]], "WKT"),
+    )
+    index = terrain_extractor.TileIndex(str(folder), str(tmp_path / "cache"))
+    names = [tile.rsplit("/", 1)[-1] for tile in index.tiles]
+    assert names == ["a.tif", "b.tif", "c.tif"]
+
+    lats = np.array([0.5, 0.5, 1.0, 1.0, 0.5, 0.0, 2.0, 1.5, -0.5])
+    lons = np.array([0.5, 1.0, 0.5, 1.0, 0.0, 0.5, 0.5, 2.0, 0.5])
+    tile = index.assign(lats, lons)
+    # the west and north edges of a tile belong to it, the east and south
+    # edges to the next tile
+    assigned = [names[t] if t >= 0 else None for t in tile]
+    assert assigned == [
+        "a.tif",
+        "b.tif",
+        "a.tif",
+        "b.tif",
+        "a.tif",
+        None,
+        "c.tif",
+        None,
+        None,
+    ]
+    assert index.assign(np.zeros(0), np.zeros(0)).shape == (0,)
+
+
+def write_tile(path, origin, value, epsg):
+    from osgeo import gdal, osr
+
+    ds = gdal.GetDriverByName("GTiff").Create(path, 10, 10, 1, gdal.GDT_Int16)
+    ds.SetGeoTransform((origin[0], 0.1, 0, origin[1], 0, -0.1))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(np.full((10, 10), value, dtype=np.int16))
+    ds.FlushCache()
+    ds = None
+
+
+def test_points_outside_their_tile_raster_go_to_the_next_tile(
+    tmp_path, monkeypatch
+):
+    folder = tmp_path / "dem"
+    folder.mkdir()
+    # a covers -96..-95, b -95.5..-94.5, in two geographic CRSs
+    write_tile(str(folder / "a.tif"), (-96.0, 41.0), 100, 4326)
+    write_tile(str(folder / "b.tif"), (-95.5, 41.0), 200, 4269)
+    # the degree box of a is wider than its raster, as the reprojected box
+    # of a tile in another projection is
+    bboxes = {
+        "a.tif": [-96.0, 40.0, -94.5, 41.0],
+        "b.tif": [-95.5, 40.0, -94.5, 41.0],
+    }
+    monkeypatch.setattr(
+        terrain_extractor,
+        "tile_bbox",
+        # one WKT per tile: the tiles do not share a projection
+        lambda path: (bboxes[path.rsplit("/", 1)[-1]], path),
+    )
+    index = terrain_extractor.TileIndex(str(folder), str(tmp_path / "cache"))
+    assert not index.single_crs
+
+    lats = np.array([40.55, 40.55, 40.55, 40.55, 39.0])
+    lons = np.array([-95.85, -95.25, -94.85, -94.45, -95.0])
+    tile = index.assign(lats, lons)
+    assert tile.tolist() == [0, 0, 0, -1, -1]
+    # the next candidate after a tile
+    assert index.assign(lats, lons, after=tile).tolist() == [-1, 1, 1, -1, -1]
+
+    values, dx, dy = terrain_extractor.sample_layer(index, lats, lons, tile)
+    np.testing.assert_array_equal(values, [100, 100, 200, np.nan, np.nan])
+    assert np.isfinite(dx[:3]).all() and np.isnan(dx[3:]).all()
+
+    patches, _, _ = terrain_extractor.sample_layer(index, lats, lons, tile, window=3)
+    assert (patches[2] == 200).all()